@@ -0,0 +1,204 @@
+# alerts.py
+# Threshold alerting on the metrics and sensor readings RaspControll already collects
+#
+# Rules file format, one rule per line ('#' starts a comment):
+#
+#   disk_percent > 90 for 5 min
+#   temperature_c >= 80 for 30s level=danger clear=75
+#   ds18b20 > 60°C
+#   ram_percent > 90 for 2m repeat=1h name=memory
+#
+#   <metric> <op> <threshold>[unit] [for <duration>] [level=warning|danger] [clear=<value>] [repeat=<duration>] [name=<text>]
+#
+# op is one of > >= < <=. A rule fires once the condition has held for the whole duration (immediately
+# without "for"), and resolves only when the value is back past the clear threshold: by default 5%
+# of the threshold short of it (hysteresis), so a value hovering around the limit doesn't flap.
+# Each firing is notified once; repeat= re-notifies while it stays firing.
+
+# Standard Library Imports
+import re
+import json
+import time
+import queue
+import threading
+import urllib.request
+from collections import defaultdict
+
+ALERT_LEVELS = ('warning', 'danger')
+DEFAULT_HYSTERESIS = 0.05 # Fraction of the threshold
+_DURATION_UNITS = {'s': 1, 'sec': 1, 'secs': 1, 'second': 1, 'seconds': 1, 'm': 60, 'min': 60, 'mins': 60,
+                   'minute': 60, 'minutes': 60, 'h': 3600, 'hour': 3600, 'hours': 3600}
+_RULE_RE = re.compile(r"^(?P<metric>[A-Za-z_]\w*)\s*(?P<op>>=|<=|>|<)\s*(?P<threshold>-?\d+(?:\.\d+)?)\s*(?P<unit>°C|C|%)?"
+                      r"(?:\s+for\s+(?P<duration>\d+(?:\.\d+)?\s*[a-z]*))?(?P<options>(?:\s+\w+=\S+)*)\s*$")
+_COMPARE = {'>': lambda v, t: v > t, '>=': lambda v, t: v >= t, '<': lambda v, t: v < t, '<=': lambda v, t: v <= t}
+
+def parse_duration(text: str) -> float:
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([a-z]*)\s*", text)
+    if not match or (match.group(2) and match.group(2) not in _DURATION_UNITS):
+        raise ValueError(f"Invalid duration '{text}' (use e.g. 30s, 5 min, 1h).")
+    return float(match.group(1)) * _DURATION_UNITS.get(match.group(2), 1) # A bare number is seconds
+
+class AlertRule:
+    def __init__(self, text: str):
+        match = _RULE_RE.match(text.strip())
+        if not match: raise ValueError(f"Cannot parse rule '{text.strip()}'.")
+        self.text = text.strip()
+        self.metric, self.op = match.group('metric'), match.group('op')
+        self.threshold = float(match.group('threshold'))
+        self.unit = match.group('unit') or ''
+        self.for_s = parse_duration(match.group('duration')) if match.group('duration') else 0.0
+        options = dict(option.split('=', 1) for option in match.group('options').split())
+        unknown = set(options) - {'level', 'clear', 'repeat', 'name'}
+        if unknown: raise ValueError(f"Unknown option(s) {', '.join(sorted(unknown))} in rule '{self.text}'.")
+        self.level = options.get('level', 'warning')
+        if self.level not in ALERT_LEVELS: raise ValueError(f"level must be one of {', '.join(ALERT_LEVELS)}.")
+        self.name = options.get('name', self.text[:match.start('options')].strip())
+        self.repeat_s = parse_duration(options['repeat']) if 'repeat' in options else None
+        rising = self.op in ('>', '>=')
+        default_clear = self.threshold - DEFAULT_HYSTERESIS * abs(self.threshold) * (1 if rising else -1)
+        self.clear = float(options['clear']) if 'clear' in options else default_clear
+        if (rising and self.clear > self.threshold) or (not rising and self.clear < self.threshold):
+            raise ValueError(f"clear={self.clear:g} must be on the safe side of the threshold in rule '{self.text}'.")
+
+    def breached(self, value: float) -> bool:
+        return _COMPARE[self.op](value, self.threshold)
+
+    def recovered(self, value: float) -> bool:
+        return value <= self.clear if self.op in ('>', '>=') else value >= self.clear
+
+def load_rules(path) -> tuple:
+    # Returns (rules, errors). Invalid lines are reported and skipped rather than disabling all alerting.
+    rules, errors = [], []
+    try: lines = open(path, encoding='utf-8').read().splitlines()
+    except FileNotFoundError: return rules, errors
+    for number, line in enumerate(lines, 1):
+        line = line.split('#', 1)[0].strip()
+        if not line: continue
+        try: rules.append(AlertRule(line))
+        except ValueError as e: errors.append(f"{path}:{number}: {e}")
+    return rules, errors
+
+class AlertEngine:
+    # Rules are indexed by metric, and each rule keeps only a small state machine
+    # (ok -> pending -> firing -> ok), so a sample costs O(rules for the metrics in it). No history is
+    # kept or rescanned. on_event(event) is called for every notification-worthy transition;
+    # observe() may be called from the stats collector thread and request threads concurrently.
+    def __init__(self, rules=(), on_event=None):
+        self.enabled = True
+        self.on_event = on_event
+        self._lock = threading.Lock()
+        self.set_rules(rules)
+
+    def set_rules(self, rules):
+        with self._lock:
+            self._rules = list(rules)
+            self._state = {id(rule): {"state": "ok", "since": None, "value": None, "notified": None, "updated": None}
+                           for rule in self._rules}
+            self._by_metric = defaultdict(list)
+            for rule in self._rules: self._by_metric[rule.metric].append(rule)
+
+    def observe(self, values: dict, now: float = None) -> list:
+        if not self.enabled: return []
+        now = time.time() if now is None else now
+        events = []
+        with self._lock:
+            for metric, value in values.items():
+                if value is None: continue
+                for rule in self._by_metric.get(metric, ()):
+                    event = self._step(rule, self._state[id(rule)], float(value), now)
+                    if event: events.append(event)
+        for event in events: # Outside the lock: notification sinks may be slow
+            if self.on_event:
+                try: self.on_event(event)
+                except Exception as e: print(f"Alert notification failed: {e}")
+        return events
+
+    def _step(self, rule: AlertRule, st: dict, value: float, now: float):
+        st["value"], st["updated"] = value, now
+        if st["state"] == "firing":
+            if rule.recovered(value):
+                st.update(state="ok", since=None)
+                return self._event(rule, "resolved", value, now)
+            if rule.repeat_s and now - st["notified"] >= rule.repeat_s:
+                st["notified"] = now
+                return self._event(rule, "firing", value, now, repeat=True)
+            return None
+        if not rule.breached(value):
+            st.update(state="ok", since=None)
+            return None
+        if st["state"] == "ok": st.update(state="pending", since=now)
+        if now - st["since"] >= rule.for_s:
+            st.update(state="firing", since=now, notified=now)
+            return self._event(rule, "firing", value, now)
+        return None
+
+    def _event(self, rule: AlertRule, status: str, value: float, now: float, repeat: bool = False) -> dict:
+        return {"rule": rule.name, "metric": rule.metric, "status": status, "value": value, "unit": rule.unit,
+                "threshold": rule.threshold, "level": rule.level if status == "firing" else "success",
+                "repeat": repeat, "time": now}
+
+    def status(self) -> list:
+        with self._lock:
+            return [{"rule": rule.name, "expression": rule.text, "metric": rule.metric, "level": rule.level,
+                     "for_s": rule.for_s, "clear": rule.clear, **self._state[id(rule)]} for rule in self._rules]
+
+class WebhookSender:
+    # Posts alert events as JSON from one background thread, so a slow or unreachable endpoint never
+    # delays sampling or requests. If the queue is full, events are dropped (they are still in the notifications).
+    def __init__(self, url: str, timeout: float = 5.0, max_queue: int = 100):
+        self.url = url
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def send(self, event: dict):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='alert-webhook', daemon=True)
+                self._thread.start()
+        try: self._queue.put_nowait(event)
+        except queue.Full: print(f"Alert webhook queue full; dropping alert '{event.get('rule')}'.")
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            request = urllib.request.Request(self.url, data=json.dumps(event).encode(), method='POST',
+                                             headers={'Content-Type': 'application/json', 'User-Agent': 'RaspControll'})
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response: response.read()
+            except Exception as e:
+                print(f"Alert webhook {self.url} failed: {e}")
+
+class SensorSampler:
+    # Reads the sensors every `interval` seconds on its own daemon thread and passes the real
+    # readings to on_values, so sensor rules are checked even when nobody has the Sensors page
+    # open. It is separate from the system stats thread because a DHT22 read can retry for seconds.
+    def __init__(self, read_values, on_values, interval: float = 30.0):
+        self.read_values = read_values
+        self.on_values = on_values
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None: return
+            self._thread = threading.Thread(target=self._run, name='sensor-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread: self._thread.join()
+
+    def sample(self) -> dict:
+        values = self.read_values()
+        if values: self.on_values(values)
+        return values
+
+    def _run(self):
+        while not self._stop.is_set():
+            try: self.sample()
+            except Exception as e: print(f"Sensor sample failed: {e}")
+            self._stop.wait(self.interval)
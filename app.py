@@ -8,76 +8,129 @@ import datetime # For timestamps
 import shutil
 from pathlib import Path
 import subprocess # For SSH command execution
+import threading
+import time
 
 # Third-party Library Imports
-from flask import Flask, render_template, redirect, url_for, request, send_file, session, send_from_directory, flash
+from flask import Flask, render_template, redirect, url_for, request, send_file, session, send_from_directory, flash, abort, jsonify, Response, g
 # Note: `flash` was imported in the prompt but not used in the final simulated app.
 # If real notifications or feedback messages were implemented beyond simple page reloads,
 # `flash` would be useful here.
 
+# Local Imports
+from thumbnails import ThumbnailCache, is_image_name, PIL_AVAILABLE as THUMBNAILS_AVAILABLE
+from notification_store import NotificationStore, NOTIFICATION_LEVELS
+from shared_state import MemoryState, SQLiteState, SQLiteNotificationStore, simulated_op_path
+from gpio_events import EventBroker
+from gpio_scheduler import PinScheduler, SimulatedPinBackend, RPiGPIOBackend, compile_program
+from subsystems import SubsystemRegistry
+from metrics import MetricsRegistry
+from profiler import SamplingProfiler
+from system_stats import SystemStatsCollector
+from alerts import AlertEngine, WebhookSender, SensorSampler, load_rules
+from fleet import FleetAggregator, load_nodes
+from http_cache import StaticAssets, compress_response, revalidate_response
+
+# Hardware Subsystems
+# Every hardware backend below is initialised lazily, on first use, by the registry in subsystems.py:
+# importing app.py touches no hardware, so startup is fast and the camera is only claimed once someone
+# views it. Until a subsystem is initialised its *_AVAILABLE flag is False. Routes declare what they
+# need with @subsystems.requires(...); /api/subsystems reports what was initialised and how long it took.
+subsystems = SubsystemRegistry()
+
 # Raspberry Pi Specific Libraries (install these on your Pi for real hardware interaction)
 # ------------------------------------------------------------------------------------
 # For System Monitoring & Process List:
-try:
-    import psutil
-    PSUTIL_AVAILABLE = True
-    print("psutil library loaded successfully. Real system monitoring and process list enabled.")
-except ImportError:
-    PSUTIL_AVAILABLE = False
-    print("psutil library not found. System monitoring and process list will be simulated.")
+psutil = None
+PSUTIL_AVAILABLE = False
+
+@subsystems.subsystem('psutil', "System monitoring and process list")
+def _init_psutil():
+    global psutil, PSUTIL_AVAILABLE
+    try:
+        import psutil as psutil_module
+        psutil, PSUTIL_AVAILABLE = psutil_module, True
+        print("psutil library loaded successfully. Real system monitoring and process list enabled.")
+    except ImportError:
+        print("psutil library not found. System monitoring and process list will be simulated.")
+
+# Live rates (per-core CPU, network and disk throughput, temperature, throttling); see system_stats.py.
+# Sampled on a background thread every SYSTEM_STATS_INTERVAL seconds, so pages never block to measure.
+SYSTEM_STATS_INTERVAL = 2.0
+system_stats = SystemStatsCollector(lambda: psutil if PSUTIL_AVAILABLE else None, interval=SYSTEM_STATS_INTERVAL)
+
+@subsystems.subsystem('system_stats', "Background sampler for CPU/network/disk rates and temperature")
+def _init_system_stats():
+    subsystems.ensure('psutil') # The first (baseline) sample should already use psutil if it's installed
+    system_stats.start()
 
 # For GPIO Control:
-try:
-    import RPi.GPIO as GPIO
-    GPIO.setmode(GPIO.BCM) # Use Broadcom pin numbering
-    GPIO.setwarnings(False) # Disable warnings
-    RPI_GPIO_AVAILABLE = True
-    # Define which pins are controllable and their default state/setup
-    CONTROLLABLE_PINS = {
-        17: {"name": "GPIO 17", "state": GPIO.LOW, "mode": GPIO.OUT, "id": 17},
-        18: {"name": "GPIO 18", "state": GPIO.LOW, "mode": GPIO.OUT, "id": 18},
-        27: {"name": "GPIO 27", "state": GPIO.LOW, "mode": GPIO.OUT, "id": 27},
-    }
-    # Setup initial pin modes
-    for pin, config in CONTROLLABLE_PINS.items():
-        GPIO.setup(pin, config["mode"], initial=config["state"])
-    print("RPi.GPIO library loaded successfully. Real GPIO control enabled.")
-
-except ImportError:
-    RPI_GPIO_AVAILABLE = False
-    CONTROLLABLE_PINS = { # Fallback to simulation
-        17: {"name": "GPIO 17", "state": "OFF", "id": 17},
-        18: {"name": "GPIO 18", "state": "ON", "id": 18},
-        27: {"name": "GPIO 27", "state": "OFF", "id": 27},
-    }
-    print("RPi.GPIO library not found. GPIO control will be simulated.")
-except RuntimeError as e: # Handle cases where RPi.GPIO is imported but not on a Pi
-    RPI_GPIO_AVAILABLE = False
-    CONTROLLABLE_PINS = { # Fallback to simulation
-        17: {"name": "GPIO 17", "state": "OFF", "id": 17},
-        18: {"name": "GPIO 18", "state": "ON", "id": 18},
-        27: {"name": "GPIO 27", "state": "OFF", "id": 27},
-    }
-    print(f"RPi.GPIO could not be initialized (not on a Pi or no permissions): {e}. GPIO control will be simulated.")
+GPIO = None
+RPI_GPIO_AVAILABLE = False
+# Define which pins are controllable and their simulated default state.
+# With real GPIO, these become outputs initialised LOW.
+CONTROLLABLE_PINS = {
+    17: {"name": "GPIO 17", "state": "OFF", "id": 17},
+    18: {"name": "GPIO 18", "state": "ON", "id": 18},
+    27: {"name": "GPIO 27", "state": "OFF", "id": 27},
+}
+# Input pins monitored with edge detection (buttons, PIR sensors, reed switches, ...).
+# "pull" is "up", "down" or None; "bouncetime" is the debounce interval in ms.
+INPUT_PINS = {
+    22: {"name": "GPIO 22 (Input)", "state": "OFF", "pull": "up", "bouncetime": 50, "id": 22},
+}
+
+@subsystems.subsystem('gpio', "GPIO pins, edge detection and the pin scheduler backend")
+def _init_gpio():
+    global GPIO, RPI_GPIO_AVAILABLE, CONTROLLABLE_PINS
+    try:
+        import RPi.GPIO as gpio_module
+        gpio_module.setmode(gpio_module.BCM) # Use Broadcom pin numbering
+        gpio_module.setwarnings(False) # Disable warnings
+        real_pins = {pin_id: {"name": config["name"], "state": gpio_module.LOW, "mode": gpio_module.OUT, "id": pin_id}
+                     for pin_id, config in CONTROLLABLE_PINS.items()}
+        # Setup initial pin modes
+        for pin, config in real_pins.items():
+            gpio_module.setup(pin, config["mode"], initial=config["state"])
+        GPIO, CONTROLLABLE_PINS, RPI_GPIO_AVAILABLE = gpio_module, real_pins, True
+        print("RPi.GPIO library loaded successfully. Real GPIO control enabled.")
+    except ImportError:
+        print("RPi.GPIO library not found. GPIO control will be simulated.")
+        return
+    except RuntimeError as e: # Handle cases where RPi.GPIO is imported but not on a Pi
+        print(f"RPi.GPIO could not be initialized (not on a Pi or no permissions): {e}. GPIO control will be simulated.")
+        return
+    gpio_scheduler.backend = RPiGPIOBackend(GPIO, gpio_lock, on_write=_on_scheduled_write)
+    for pin_id, config in INPUT_PINS.items():
+        try:
+            pull = {"up": GPIO.PUD_UP, "down": GPIO.PUD_DOWN}.get(config.get("pull"), GPIO.PUD_OFF)
+            GPIO.setup(pin_id, GPIO.IN, pull_up_down=pull)
+            GPIO.add_event_detect(pin_id, GPIO.BOTH, callback=_on_gpio_edge, bouncetime=config.get("bouncetime", 50))
+        except RuntimeError as e:
+            print(f"Could not enable edge detection on GPIO {pin_id}: {e}")
 
 # For Camera Integration
 CAMERA_AVAILABLE = False
 picam2 = None # For Picamera2
 camera = None # For older PiCamera
-try:
-    from picamera2 import Picamera2
-    picam2 = Picamera2()
-    CAMERA_AVAILABLE = True
-    print("Picamera2 library found and initialized.")
-except (ImportError, RuntimeError, FileNotFoundError) as e: 
-    print(f"Picamera2 not available ({e}), trying older PiCamera library...")
+
+@subsystems.subsystem('camera', "Pi camera (Picamera2 or legacy PiCamera)")
+def _init_camera():
+    global picam2, camera, CAMERA_AVAILABLE
     try:
-        from picamera import PiCamera
-        camera = PiCamera()
+        from picamera2 import Picamera2
+        picam2 = Picamera2()
         CAMERA_AVAILABLE = True
-        print("PiCamera library found and initialized.")
-    except (ImportError, RuntimeError) as e2:
-        print(f"PiCamera also not available ({e2}). Camera feature will use placeholder.")
+        print("Picamera2 library found and initialized.")
+    except (ImportError, RuntimeError, FileNotFoundError) as e: 
+        print(f"Picamera2 not available ({e}), trying older PiCamera library...")
+        try:
+            from picamera import PiCamera
+            camera = PiCamera()
+            CAMERA_AVAILABLE = True
+            print("PiCamera library found and initialized.")
+        except (ImportError, RuntimeError) as e2:
+            print(f"PiCamera also not available ({e2}). Camera feature will use placeholder.")
 
 # For DHT Temperature/Humidity Sensors (e.g., DHT11, DHT22):
 # import Adafruit_DHT # pip install Adafruit_DHT (may require libgpiod2 or other system deps)
@@ -97,21 +150,33 @@ except (ImportError, RuntimeError, FileNotFoundError) as e:
 # File Manager Configuration
 FILE_MANAGER_BASE_DIR = Path.home() / "RaspControll_files"
 FILE_MANAGER_REAL_MODE = False
-try:
-    FILE_MANAGER_BASE_DIR.mkdir(parents=True, exist_ok=True)
-    test_file_path = FILE_MANAGER_BASE_DIR / ".perm_test"
-    with open(test_file_path, "w") as f: f.write("test")
-    with open(test_file_path, "r") as f: f.read()
-    os.remove(test_file_path)
-    FILE_MANAGER_REAL_MODE = True
-    print(f"File Manager: Operating in real mode. Base directory: {FILE_MANAGER_BASE_DIR}")
-    if not any(FILE_MANAGER_BASE_DIR.iterdir()): 
-        (FILE_MANAGER_BASE_DIR / "sample_file.txt").write_text("Hello from RaspControll!")
-        (FILE_MANAGER_BASE_DIR / "another_folder").mkdir(exist_ok=True)
-        (FILE_MANAGER_BASE_DIR / "another_folder" / "nested_file.log").write_text("Log entry.")
-except Exception as e:
-    print(f"File Manager: Error setting up base directory {FILE_MANAGER_BASE_DIR}: {e}. Falling back to simulation.")
-    FILE_MANAGER_REAL_MODE = False
+
+@subsystems.subsystem('file_manager', "File Manager base directory (permission probe and sample files)")
+def _init_file_manager():
+    global FILE_MANAGER_REAL_MODE
+    try:
+        FILE_MANAGER_BASE_DIR.mkdir(parents=True, exist_ok=True)
+        test_file_path = FILE_MANAGER_BASE_DIR / ".perm_test"
+        with open(test_file_path, "w") as f: f.write("test")
+        with open(test_file_path, "r") as f: f.read()
+        os.remove(test_file_path)
+        FILE_MANAGER_REAL_MODE = True
+        print(f"File Manager: Operating in real mode. Base directory: {FILE_MANAGER_BASE_DIR}")
+        if not any(FILE_MANAGER_BASE_DIR.iterdir()): 
+            (FILE_MANAGER_BASE_DIR / "sample_file.txt").write_text("Hello from RaspControll!")
+            (FILE_MANAGER_BASE_DIR / "another_folder").mkdir(exist_ok=True)
+            (FILE_MANAGER_BASE_DIR / "another_folder" / "nested_file.log").write_text("Log entry.")
+    except Exception as e:
+        print(f"File Manager: Error setting up base directory {FILE_MANAGER_BASE_DIR}: {e}. Falling back to simulation.")
+        FILE_MANAGER_REAL_MODE = False
+
+# File Manager thumbnails (requires Pillow; see thumbnails.py)
+THUMBNAIL_CACHE_DIR = Path.home() / ".cache" / "RaspControll" / "thumbnails"
+THUMBNAIL_CACHE_MAX_BYTES = 64 * 1024**2 # Least recently used thumbnails are evicted beyond this
+THUMBNAIL_SIZE = (160, 160)
+THUMBNAIL_WORKERS = 2 # Keep small on a Pi; decoding is CPU and memory heavy
+thumbnail_cache = ThumbnailCache(THUMBNAIL_CACHE_DIR, max_bytes=THUMBNAIL_CACHE_MAX_BYTES, size=THUMBNAIL_SIZE, workers=THUMBNAIL_WORKERS)
+if not THUMBNAILS_AVAILABLE: print("Pillow library not found. File Manager thumbnails disabled.")
 
 # Helper function for formatting bytes
 def format_bytes(bts):
@@ -138,13 +203,83 @@ def _secure_join(base_path: Path, current_relative_path_str: str) -> Path | None
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
+app.add_template_filter(format_bytes, 'format_bytes')
 
-# Simulated Notifications
-simulated_notifications = [
-    {"message": "System started successfully.", "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")},
-]
+# Metrics (exported at /metrics in Prometheus text format; see metrics.py)
+REQUEST_METRIC = 'raspcontroll_request_duration_seconds'
+HARDWARE_CALL_METRIC = 'raspcontroll_hardware_call_duration_seconds'
+FALLBACK_METRIC = 'raspcontroll_simulation_fallbacks_total'
+metrics = MetricsRegistry()
+metrics.describe(REQUEST_METRIC, "Time to produce a response (for streams: until the response starts), by endpoint.")
+metrics.describe(HARDWARE_CALL_METRIC, "Duration of calls to psutil, sensors, the camera and subprocesses.")
+metrics.describe(FALLBACK_METRIC, "Requests that used simulated data instead of real hardware.")
+METRICS_SHARE_DIR = os.environ.get('RASPCONTROLL_METRICS_DIR') # Set by serve.py --workers: sum all workers' metrics
+if METRICS_SHARE_DIR: metrics.share(METRICS_SHARE_DIR)
+
+def _timed_call(subsystem, call, fn, *args, **kwargs):
+    with metrics.timed(HARDWARE_CALL_METRIC, subsystem=subsystem, call=call):
+        return fn(*args, **kwargs)
+
+def _count_fallback(feature, reason):
+    metrics.inc(FALLBACK_METRIC, feature=feature, reason=reason)
+
+# Sampling profiler for live diagnosis (see profiler.py). Each worker process has its own; see _profiler_pid_mismatch().
+PROFILER_MAX_SECONDS = 300
+PROFILER_DEFAULT_INTERVAL_MS = 10 # 100 samples/s; each sample costs well under a millisecond
+profiler = SamplingProfiler(max_seconds=PROFILER_MAX_SECONDS)
+
+@app.before_request
+def _start_request_timer(): g.request_start = time.perf_counter()
+
+@app.after_request
+def _remember_response_status(response): # Registered first, so it runs last and sees the final status
+    g.response_status = response.status_code
+    return response
 
-# Simulated File System (used if FILE_MANAGER_REAL_MODE is False)
+@app.teardown_request
+def _record_request_latency(exc):
+    # Teardown also runs for requests that raised an unhandled exception (which after_request may
+    # never see), so those are counted as 500s instead of going missing.
+    start = g.get('request_start')
+    if start is not None:
+        status = g.get('response_status', 500) # No response recorded: the request failed
+        metrics.observe(REQUEST_METRIC, time.perf_counter() - start, endpoint=request.endpoint or 'unmatched',
+                        method=request.method, status=str(status))
+
+# HTTP caching and compression (see http_cache.py). Set RASPCONTROLL_COMPRESSION=0 if a reverse
+# proxy (nginx, Caddy) in front of RaspControll already compresses responses.
+COMPRESSION_ENABLED = os.environ.get('RASPCONTROLL_COMPRESSION', '1') != '0'
+PINOUT_IMAGE = 'images/placeholder_pinout.png' # Relative to the static folder
+CAMERA_PLACEHOLDER = 'images/placeholder_camera.png'
+static_assets = StaticAssets(app.static_folder)
+
+@app.url_defaults
+def _fingerprint_asset_urls(endpoint, values):
+    # url_for('static', ...) and url_for('pinout_image') get ?v=<content hash>: browsers may keep
+    # them for a year, and a changed file gets a new URL.
+    filename = values.get('filename') if endpoint == 'static' else PINOUT_IMAGE if endpoint == 'pinout_image' else None
+    if filename and 'v' not in values:
+        version = static_assets.fingerprint(filename)
+        if version: values['v'] = version
+
+@app.endpoint('static') # Replaces Flask's static file view
+def static_file(filename):
+    response = static_assets.send(filename, request, version=request.args.get('v'), compression=COMPRESSION_ENABLED)
+    if response is None: abort(404)
+    return response
+
+@app.after_request
+def _revalidate_and_compress(response): # Runs before _remember_response_status, so 304s are recorded as such
+    revalidate_response(response, request)
+    if COMPRESSION_ENABLED: compress_response(response, request.accept_encodings)
+    return response
+
+# Notifications (bounded newest-first store; see notification_store.py)
+NOTIFICATIONS_MAX = 500 # Oldest notifications are dropped beyond this
+NOTIFICATIONS_PERSIST_PATH = None # e.g. Path.home() / ".cache" / "RaspControll" / "notifications.jsonl" to keep them across restarts
+NOTIFICATIONS_PER_PAGE = 50
+
+# Simulated File System (used if FILE_MANAGER_REAL_MODE is False; initial contents, the live copy is in app_state)
 simulated_files = [
     {"name": "File1.txt", "type": "file", "path": "/"},
     {"name": "Document.pdf", "type": "file", "path": "/"},
@@ -152,6 +287,129 @@ simulated_files = [
     {"name": "image.jpg", "type": "file", "path": "/Folder1/"},
 ]
 
+# Shared State
+# Simulated pin states, simulated files and notifications are mutated by request handlers.
+# 'memory' (default) is safe for one process with many threads; use 'sqlite' when running
+# several worker processes (e.g. behind gunicorn) so they all share one copy.
+STATE_BACKEND = os.environ.get('RASPCONTROLL_STATE_BACKEND', 'memory')
+STATE_DB_PATH = Path(os.environ.get('RASPCONTROLL_STATE_DB', Path.home() / ".cache" / "RaspControll" / "state.db"))
+_initial_pin_states = {pin_id: config["state"] for pin_id, config in {**CONTROLLABLE_PINS, **INPUT_PINS}.items()}
+if STATE_BACKEND == 'sqlite':
+    app_state = SQLiteState(STATE_DB_PATH, _initial_pin_states, simulated_files)
+    notification_store = SQLiteNotificationStore(STATE_DB_PATH, max_items=NOTIFICATIONS_MAX)
+    print(f"Shared state: using SQLite database {STATE_DB_PATH}")
+else:
+    app_state = MemoryState(_initial_pin_states, simulated_files)
+    notification_store = NotificationStore(max_items=NOTIFICATIONS_MAX, persist_path=NOTIFICATIONS_PERSIST_PATH)
+gpio_lock = threading.Lock() # Serialises read-modify-write of real pins between request threads
+gpio_events = EventBroker() # Pin changes pushed to /api/gpio/events/stream clients
+
+# Each streaming client holds a server thread for as long as it is connected. Cap them so that
+# with a fixed-size thread pool (waitress, gunicorn gthread) streams can't starve short requests.
+MAX_STREAM_CLIENTS = int(os.environ.get('RASPCONTROLL_MAX_STREAMS', 8))
+_stream_slots = threading.BoundedSemaphore(MAX_STREAM_CLIENTS)
+
+class _LimitedStream:
+    # Releases the stream slot when the server closes the response, even if the client
+    # disconnected before the first chunk was sent.
+    def __init__(self, generator):
+        self._generator = generator
+        self._released = False
+    def __iter__(self): return self._generator
+    def close(self):
+        self._generator.close()
+        if not self._released:
+            self._released = True
+            _stream_slots.release()
+
+def _publish_pin_change(pin_id, state, kind, edge=None):
+    config = CONTROLLABLE_PINS.get(pin_id) or INPUT_PINS.get(pin_id, {})
+    return gpio_events.publish({"pin": pin_id, "name": config.get("name", f"GPIO {pin_id}"), "state": state, "kind": kind, "edge": edge})
+
+def _on_gpio_edge(channel): # Called by RPi.GPIO on its own event thread, not a request thread
+    state = "ON" if GPIO.input(channel) == GPIO.HIGH else "OFF"
+    _publish_pin_change(channel, state, "input", edge="rising" if state == "ON" else "falling")
+
+def _on_scheduled_write(pin_id, high): # Called from the GPIO scheduler thread
+    state = "ON" if high else "OFF"
+    if not RPI_GPIO_AVAILABLE: app_state.set_pins({pin_id: state})
+    _publish_pin_change(pin_id, state, "output")
+
+# Timed pin programs (pulse/blink/PWM) run on a dedicated thread; see gpio_scheduler.py.
+# The GPIO subsystem swaps in the RPi.GPIO backend when real GPIO is available.
+gpio_scheduler = PinScheduler(SimulatedPinBackend(on_write=_on_scheduled_write))
+
+def notify(message, level="info", source="system"):
+    return notification_store.add(message, level=level, source=source)
+
+notify("System started successfully.", level="success")
+
+# Alerting (rule syntax in alerts.py). Rules are evaluated on every system stats sample and on the
+# real sensor readings taken every SENSOR_SAMPLE_INTERVAL seconds; alerts are added to the
+# notifications and, if configured, posted to a webhook.
+ALERT_RULES_PATH = Path(os.environ.get('RASPCONTROLL_ALERT_RULES', Path(__file__).with_name('alerts.rules')))
+ALERT_WEBHOOK_URL = os.environ.get('RASPCONTROLL_ALERT_WEBHOOK') # e.g. an ntfy/Gotify/Home Assistant webhook
+alert_webhook = WebhookSender(ALERT_WEBHOOK_URL) if ALERT_WEBHOOK_URL else None
+alert_rules, alert_rule_errors = load_rules(ALERT_RULES_PATH)
+for rule_error in alert_rule_errors: print(f"Alert rules: {rule_error}")
+
+def _on_alert(event):
+    value = f"{event['value']:g}{event['unit']}"
+    if event["status"] == "resolved": message = f"Resolved: {event['rule']} (now {value})."
+    else: message = f"{'Still firing' if event['repeat'] else 'Alert'}: {event['rule']} (now {value})."
+    notify(message, level=event["level"], source="alerts")
+    if alert_webhook: alert_webhook.send(event)
+
+alert_engine = AlertEngine(alert_rules, on_event=_on_alert)
+
+def _system_alert_values(stats):
+    # Flattens a system stats sample into the metric names alert rules can use
+    if stats.get("simulated"): return {} # Never alert on made-up numbers
+    throttling = stats.get("throttling") or {}
+    values = {"ram_percent": stats.get("ram_percent"), "disk_percent": stats.get("disk_percent"),
+              "temperature_c": stats.get("temperature_c"),
+              "throttled": len(throttling["now"]) if throttling else None,
+              "under_voltage": int("under_voltage" in throttling["now"]) if throttling else None}
+    if stats.get("cpu"):
+        values["cpu_percent"] = stats["cpu"]["total_percent"]
+        values["net_rx_bytes_per_s"] = sum(n["rx_bytes_per_s"] for n in stats["network"].values())
+        values["net_tx_bytes_per_s"] = sum(n["tx_bytes_per_s"] for n in stats["network"].values())
+        values["disk_read_bytes_per_s"] = sum(d["read_bytes_per_s"] for d in stats["disks"].values())
+        values["disk_write_bytes_per_s"] = sum(d["write_bytes_per_s"] for d in stats["disks"].values())
+        values["disk_iops"] = sum(d["read_iops"] + d["write_iops"] for d in stats["disks"].values())
+    return values
+
+system_stats.add_listener(lambda stats: alert_engine.observe(_system_alert_values(stats)))
+
+SENSOR_SAMPLE_INTERVAL = float(os.environ.get('RASPCONTROLL_SENSOR_INTERVAL', 30))
+SENSOR_METRICS = {"dht22_temperature", "dht22_humidity", "ds18b20", "bmp280_temperature", "bmp280_pressure",
+                  "sense_hat_temperature", "sense_hat_humidity", "sense_hat_pressure"} # Keys of read_sensors()' values
+sensor_sampler = SensorSampler(lambda: read_sensors()[1], lambda values: alert_engine.observe(values),
+                               interval=SENSOR_SAMPLE_INTERVAL)
+
+@subsystems.subsystem('alerts', "Alert rule evaluation (system stats listener and background sensor sampler)")
+def start_alerting():
+    # Ensured by serve.py (in the hardware-owning worker when there are several): alerts need the stats
+    # collector and the sensor sampler running even if nobody opens the System Monitoring or Sensors page.
+    # /api/alerts requires it too, so serve.py forwards that route to the worker evaluating the rules.
+    alert_engine.enabled = True
+    if alert_rules: subsystems.ensure('system_stats')
+    if any(rule.metric in SENSOR_METRICS for rule in alert_rules): sensor_sampler.start()
+
+# Fleet mode (node list format in fleet.py): this instance also polls the other RaspControll instances
+# listed in the nodes file and shows them on /fleet. Without the file the page only explains the setup.
+FLEET_NODES_PATH = Path(os.environ.get('RASPCONTROLL_FLEET_NODES', Path(__file__).with_name('fleet.nodes')))
+FLEET_POLL_INTERVAL = float(os.environ.get('RASPCONTROLL_FLEET_INTERVAL', 10))
+FLEET_TIMEOUT = float(os.environ.get('RASPCONTROLL_FLEET_TIMEOUT', 3))
+FLEET_MAX_WORKERS = int(os.environ.get('RASPCONTROLL_FLEET_WORKERS', 8)) # Concurrent polls, however many nodes
+fleet_nodes, fleet_node_errors = load_nodes(FLEET_NODES_PATH)
+for node_error in fleet_node_errors: print(f"Fleet nodes: {node_error}")
+fleet = FleetAggregator(fleet_nodes, interval=FLEET_POLL_INTERVAL, timeout=FLEET_TIMEOUT, max_workers=FLEET_MAX_WORKERS)
+
+@subsystems.subsystem('fleet', "Background poller for the other RaspControll instances in the fleet")
+def _init_fleet():
+    fleet.start()
+
 # Simulated System Statistics (Fallback)
 dummy_stats = {
     "cpu_usage": "25% (Simulated)", "cpu_usage_percent": 25,
@@ -189,7 +447,7 @@ def get_real_pi_info():
     info = dummy_pi_info.copy() # Start with defaults, override with real data
 
     try: # Get Model, SoC, Serial from /proc/cpuinfo
-        output = subprocess.check_output(["cat", "/proc/cpuinfo"], text=True)
+        output = _timed_call('subprocess', 'cpuinfo', subprocess.check_output, ["cat", "/proc/cpuinfo"], text=True)
         lines = output.splitlines()
         model_found = False
         soc_found = False
@@ -221,7 +479,7 @@ def get_real_pi_info():
         print(f"Error reading /proc/cpuinfo: {e}. Falling back to dummy values for model, soc, serial.")
 
     try: # Get RAM from free -m
-        output = subprocess.check_output(["free", "-m"], text=True)
+        output = _timed_call('subprocess', 'free', subprocess.check_output, ["free", "-m"], text=True)
         lines = output.splitlines()
         for line in lines:
             if line.startswith("Mem:"):
@@ -233,7 +491,7 @@ def get_real_pi_info():
         print(f"Error running 'free -m': {e}. Falling back to dummy value for RAM.")
 
     try: # Get OS Version from /etc/os-release
-        output = subprocess.check_output(["cat", "/etc/os-release"], text=True)
+        output = _timed_call('subprocess', 'os_release', subprocess.check_output, ["cat", "/etc/os-release"], text=True)
         lines = output.splitlines()
         for line in lines:
             if line.startswith("PRETTY_NAME="):
@@ -244,7 +502,7 @@ def get_real_pi_info():
         print(f"Error reading /etc/os-release: {e}. Falling back to dummy value for OS Version.")
 
     try: # Get Kernel Version from uname -r
-        info["kernel_version"] = subprocess.check_output(["uname", "-r"], text=True).strip()
+        info["kernel_version"] = _timed_call('subprocess', 'uname', subprocess.check_output, ["uname", "-r"], text=True).strip()
     except Exception as e:
         print(f"Error running 'uname -r': {e}. Falling back to dummy value for Kernel Version.")
         
@@ -259,40 +517,148 @@ def get_real_pi_info():
 @app.route('/')
 def index(): return render_template('index.html')
 
-@app.route('/gpio')
-def gpio():
-    current_pins_state = []
+def _read_pins():
+    # Returns (output pins, input pins) as lists of {"id", "name", "state"} dicts.
+    current_pins_state, input_pins_state = [], []
     if RPI_GPIO_AVAILABLE:
         for pin_id, config in CONTROLLABLE_PINS.items():
             if config["mode"] == GPIO.OUT:
                 state = GPIO.input(pin_id)
                 current_pins_state.append({"id": pin_id, "name": config["name"], "state": "ON" if state == GPIO.HIGH else "OFF"})
+        for pin_id, config in INPUT_PINS.items():
+            state = GPIO.input(pin_id)
+            input_pins_state.append({"id": pin_id, "name": config["name"], "state": "ON" if state == GPIO.HIGH else "OFF"})
     else: 
+        _count_fallback('gpio', 'unavailable')
+        pin_states = app_state.pin_states()
         for pin_id, config in CONTROLLABLE_PINS.items():
-            current_pins_state.append({"id": pin_id, "name": config["name"], "state": config["state"]})
-    return render_template('gpio.html', pins=current_pins_state)
+            current_pins_state.append({"id": pin_id, "name": config["name"], "state": pin_states.get(pin_id, config["state"])})
+        for pin_id, config in INPUT_PINS.items():
+            input_pins_state.append({"id": pin_id, "name": config["name"], "state": pin_states.get(pin_id, config["state"])})
+    return current_pins_state, input_pins_state
+
+@app.route('/gpio')
+@subsystems.requires('gpio')
+def gpio():
+    current_pins_state, input_pins_state = _read_pins()
+    return render_template('gpio.html', pins=current_pins_state, input_pins=input_pins_state, last_event_seq=gpio_events.last_seq)
 
 @app.route('/gpio/toggle/<int:pin_id>')
+@subsystems.requires('gpio')
 def toggle_gpio(pin_id):
     action_msg = ""
     if RPI_GPIO_AVAILABLE:
         if pin_id in CONTROLLABLE_PINS and CONTROLLABLE_PINS[pin_id]["mode"] == GPIO.OUT:
-            current_state = GPIO.input(pin_id)
-            new_state = not current_state
-            GPIO.output(pin_id, new_state)
+            with gpio_lock:
+                current_state = GPIO.input(pin_id)
+                new_state = not current_state
+                GPIO.output(pin_id, new_state)
             action = "turned ON" if new_state == GPIO.HIGH else "turned OFF"
             action_msg = f"Real GPIO pin {CONTROLLABLE_PINS[pin_id]['name']} {action}."
+            _publish_pin_change(pin_id, "ON" if new_state == GPIO.HIGH else "OFF", "output")
     else:
-        if pin_id in CONTROLLABLE_PINS:
-            current_state = CONTROLLABLE_PINS[pin_id]["state"]
-            new_state = "ON" if current_state == "OFF" else "OFF"
-            CONTROLLABLE_PINS[pin_id]["state"] = new_state
+        new_state = app_state.toggle_pin(pin_id) if pin_id in CONTROLLABLE_PINS else None
+        if new_state is not None:
             action_msg = f"Simulated GPIO pin {CONTROLLABLE_PINS[pin_id]['name']} {new_state}."
-    if action_msg: simulated_notifications.insert(0, {"message": action_msg, "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+            _publish_pin_change(pin_id, new_state, "output")
+    if action_msg: notify(action_msg, source="gpio")
     return redirect(url_for('gpio'))
 
+def _parse_pin_state(value):
+    if isinstance(value, bool): return "ON" if value else "OFF"
+    if isinstance(value, int) and value in (0, 1): return "ON" if value else "OFF"
+    if isinstance(value, str) and value.upper() in ("ON", "OFF", "HIGH", "LOW"): return "ON" if value.upper() in ("ON", "HIGH") else "OFF"
+    return None
+
+@app.route('/api/gpio')
+@subsystems.requires('gpio')
+def gpio_api():
+    current_pins_state, input_pins_state = _read_pins()
+    return jsonify({"outputs": current_pins_state, "inputs": input_pins_state, "last_event_seq": gpio_events.last_seq})
+
+@app.route('/api/gpio/batch', methods=['POST'])
+@subsystems.requires('gpio')
+def gpio_batch():
+    # Sets several output pins in one request, e.g. {"pins": {"17": "ON", "18": "OFF"}}.
+    # Everything is validated first; then all pins are written while holding the GPIO lock,
+    # so no other request can interleave. If any pin is invalid, nothing is changed.
+    payload = request.get_json(silent=True) or {}
+    requested = payload.get("pins")
+    if not isinstance(requested, dict) or not requested:
+        return jsonify({"error": "Expected a JSON object like {\"pins\": {\"17\": \"ON\"}}."}), 400
+    states = {}
+    for pin_key, value in requested.items():
+        try: pin_id = int(pin_key)
+        except (TypeError, ValueError): return jsonify({"error": f"Invalid pin '{pin_key}'."}), 400
+        if pin_id not in CONTROLLABLE_PINS or (RPI_GPIO_AVAILABLE and CONTROLLABLE_PINS[pin_id]["mode"] != GPIO.OUT):
+            return jsonify({"error": f"GPIO {pin_id} is not a controllable output pin."}), 400
+        state = _parse_pin_state(value)
+        if state is None: return jsonify({"error": f"Invalid state {value!r} for GPIO {pin_id}; use ON/OFF."}), 400
+        states[pin_id] = state
+    if RPI_GPIO_AVAILABLE:
+        with gpio_lock:
+            GPIO.output(list(states), [GPIO.HIGH if state == "ON" else GPIO.LOW for state in states.values()])
+    elif not app_state.set_pins(states):
+        return jsonify({"error": "Unknown pin in batch."}), 400
+    for pin_id, state in states.items(): _publish_pin_change(pin_id, state, "output")
+    summary = ", ".join(f"{CONTROLLABLE_PINS[pin_id]['name']} {state}" for pin_id, state in states.items())
+    notify(f"{'Real' if RPI_GPIO_AVAILABLE else 'Simulated'} GPIO batch update: {summary}.", source="gpio")
+    return jsonify({"pins": {str(pin_id): state for pin_id, state in states.items()}, "last_event_seq": gpio_events.last_seq})
+
+@app.route('/api/gpio/programs', methods=['POST'])
+@subsystems.requires('gpio')
+def submit_gpio_program():
+    # Runs a timed program, e.g. {"steps": [{"pulse": 17, "ms": 200}]} or {"steps": [{"blink": 17, "hz": 2, "count": 10}]}.
+    # See gpio_scheduler.py for the step format. Returns immediately; poll the returned job for progress.
+    output_pins = {pin_id for pin_id, config in CONTROLLABLE_PINS.items() if not RPI_GPIO_AVAILABLE or config["mode"] == GPIO.OUT}
+    try: timeline = compile_program(request.get_json(silent=True), allowed_pins=output_pins)
+    except ValueError as e: return jsonify({"error": str(e)}), 400
+    job = gpio_scheduler.submit(timeline)
+    notify(f"GPIO program {job['id']} started ({job['steps_total']} actions, {job['duration_ms']:.0f} ms).", source="gpio")
+    return jsonify(job), 202
+
+@app.route('/api/gpio/programs/<int:job_id>', methods=['GET', 'DELETE'])
+@subsystems.requires('gpio')
+def gpio_program(job_id):
+    job = gpio_scheduler.cancel(job_id) if request.method == 'DELETE' else gpio_scheduler.status(job_id)
+    if job is None: return jsonify({"error": f"No GPIO program with id {job_id}."}), 404
+    return jsonify(job)
+
+@app.route('/api/gpio/scheduler')
+@subsystems.requires('gpio')
+def gpio_scheduler_stats(): return jsonify(gpio_scheduler.stats())
+
+@app.route('/api/gpio/events')
+@subsystems.requires('gpio')
+def gpio_events_api():
+    since = request.args.get('since', 0, type=int)
+    return jsonify({"events": gpio_events.since(since), "last_event_seq": gpio_events.last_seq})
+
+@app.route('/api/gpio/events/stream')
+@subsystems.requires('gpio')
+def gpio_events_stream():
+    # Server-Sent Events. Browsers reconnect automatically and send Last-Event-ID, so no edge is lost
+    # across a short disconnect as long as it is still in the broker's history.
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None: since = request.args.get('since', gpio_events.last_seq, type=int)
+    if not _stream_slots.acquire(blocking=False):
+        return jsonify({"error": "Too many live event streams; poll /api/gpio/events instead."}), 503, {'Retry-After': '10'}
+    return Response(_LimitedStream(gpio_events.stream(since)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/gpio/inputs/<int:pin_id>/simulate', methods=['POST'])
+@subsystems.requires('gpio')
+def simulate_gpio_input(pin_id):
+    # Simulation only: flips a simulated input pin as if its edge had been detected.
+    if RPI_GPIO_AVAILABLE: return jsonify({"error": "Real GPIO is active; inputs cannot be simulated."}), 409
+    if pin_id not in INPUT_PINS: return jsonify({"error": f"GPIO {pin_id} is not a monitored input pin."}), 404
+    state = app_state.toggle_pin(pin_id)
+    event = _publish_pin_change(pin_id, state, "input", edge="rising" if state == "ON" else "falling")
+    return jsonify(event)
+
 @app.route('/file-manager/', defaults={'current_dir_path': ''})
 @app.route('/file-manager/<path:current_dir_path>')
+@subsystems.requires('file_manager')
 def file_manager(current_dir_path):
     if FILE_MANAGER_REAL_MODE:
         abs_current_path = _secure_join(FILE_MANAGER_BASE_DIR, current_dir_path)
@@ -305,7 +671,8 @@ def file_manager(current_dir_path):
                     "link_path": str(Path(current_dir_path) / item.name), 
                     "op_path": str(Path(current_dir_path) / item.name),
                     "size": format_bytes(item.stat().st_size) if item.is_file() else "-",
-                    "modified": datetime.datetime.fromtimestamp(item.stat().st_mtime).strftime('%Y-%m-%d %H:%M:%S')})
+                    "modified": datetime.datetime.fromtimestamp(item.stat().st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+                    "is_image": THUMBNAILS_AVAILABLE and item.is_file() and is_image_name(item.name)})
         except Exception as e:
             flash(f"Error listing files in '{current_dir_path}': {e}", "danger")
             return redirect(url_for('file_manager', current_dir_path=''))
@@ -315,17 +682,19 @@ def file_manager(current_dir_path):
         if parent_path_str == ".": parent_path_str = ""
         return render_template('file_manager.html', files=files_and_folders, current_path=current_dir_path, parent_path=parent_path_str, real_mode=True, FILE_MANAGER_BASE_DIR=FILE_MANAGER_BASE_DIR) # Pass base dir for display
     else: 
+        _count_fallback('file_manager', 'unavailable')
         processed_simulated_files = []
-        for s_file in simulated_files:
-            sim_op_path = (s_file['path'].lstrip('/') + s_file['name']).lstrip('/')
-            if not sim_op_path: sim_op_path = s_file['name']
+        for s_file in app_state.list_files():
+            sim_op_path = simulated_op_path(s_file)
             processed_simulated_files.append({"name": s_file['name'], "type": s_file['type'], "link_path": sim_op_path, 
                                               "op_path": sim_op_path, "size": "-", "modified": "-", 
-                                              "simulated_original_path_attr": s_file['path']})
+                                              "simulated_original_path_attr": s_file['path'],
+                                              "is_image": THUMBNAILS_AVAILABLE and s_file['type'] == 'file' and is_image_name(s_file['name'])})
         return render_template('file_manager.html', files=processed_simulated_files, current_path="Simulated Root", parent_path=None, real_mode=False)
 
 @app.route('/file-manager/upload/<path:current_dir_path>', methods=['POST'])
 @app.route('/file-manager/upload', defaults={'current_dir_path': ''}, methods=['POST'])
+@subsystems.requires('file_manager')
 def upload_file(current_dir_path):
     from werkzeug.utils import secure_filename
     redirect_path = current_dir_path if FILE_MANAGER_REAL_MODE else ''
@@ -341,18 +710,19 @@ def upload_file(current_dir_path):
             try:
                 file.save(abs_target_dir / filename)
                 flash(f"File '{filename}' uploaded successfully to '{current_dir_path}'.", "success")
-                simulated_notifications.insert(0, {"message": f"Real upload of {filename} to {current_dir_path}.", "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+                notify(f"Real upload of {filename} to {current_dir_path}.", level="success", source="file_manager")
             except Exception as e: flash(f"Error uploading file '{filename}': {e}", "danger")
     else: 
         if 'file' in request.files and request.files['file'].filename != '':
             file = request.files['file']
-            simulated_files.append({"name": file.filename, "type": "file", "path": "/"}) # Simplified sim path
+            app_state.add_file({"name": file.filename, "type": "file", "path": "/"}) # Simplified sim path
             flash(f"Simulated upload of '{file.filename}'.", "info")
-            simulated_notifications.insert(0, {"message": f"Simulated upload of {file.filename}.", "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+            notify(f"Simulated upload of {file.filename}.", source="file_manager")
         else: flash('No file selected for simulated upload.', 'warning')
     return redirect(url_for('file_manager', current_dir_path=redirect_path))
 
 @app.route('/file-manager/download/<path:item_path>')
+@subsystems.requires('file_manager')
 def download_file(item_path): # item_path is op_path
     parent_dir_for_redirect = str(Path(item_path).parent)
     if parent_dir_for_redirect == ".": parent_dir_for_redirect = ""
@@ -365,17 +735,33 @@ def download_file(item_path): # item_path is op_path
             except Exception as e: flash(f"Error downloading file '{abs_item_path.name}': {e}", "danger")
     else: 
         file_to_download = None
-        for f_item_sim_list in simulated_files:
-            original_sim_op_path = (f_item_sim_list['path'].lstrip('/') + f_item_sim_list['name']).lstrip('/')
-            if not original_sim_op_path: original_sim_op_path = f_item_sim_list['name']
-            if original_sim_op_path == item_path: file_to_download = f_item_sim_list; break
+        for f_item_sim_list in app_state.list_files():
+            if simulated_op_path(f_item_sim_list) == item_path: file_to_download = f_item_sim_list; break
         if file_to_download and file_to_download['type'] == 'file':
             return send_file(io.BytesIO(f"This is a simulated download of {file_to_download['name']}".encode()), 
                              mimetype='text/plain', as_attachment=True, download_name=file_to_download['name'])
         else: flash(f"Simulated file '{item_path}' not found for download.", "warning")
     return redirect(url_for('file_manager', current_dir_path=parent_dir_for_redirect if FILE_MANAGER_REAL_MODE else ''))
 
+@app.route('/file-manager/thumbnail/<path:item_path>')
+@subsystems.requires('file_manager')
+def thumbnail(item_path): # item_path is op_path
+    if not THUMBNAILS_AVAILABLE or not is_image_name(item_path): abort(404)
+    if FILE_MANAGER_REAL_MODE:
+        abs_item_path = _secure_join(FILE_MANAGER_BASE_DIR, item_path)
+        if abs_item_path is None or not abs_item_path.is_file(): abort(404)
+        source_path = abs_item_path
+    else: # Simulated files have no content; preview them with the camera placeholder
+        source_path = Path(app.root_path) / 'static/images/placeholder_camera.png'
+    try:
+        thumb_path = thumbnail_cache.get(source_path)
+    except Exception as e:
+        print(f"Error generating thumbnail for '{item_path}': {e}")
+        abort(404)
+    return send_file(thumb_path, mimetype='image/jpeg', max_age=300)
+
 @app.route('/file-manager/delete/<path:item_path>', methods=['GET', 'POST'])
+@subsystems.requires('file_manager')
 def delete_file_or_folder(item_path): # item_path is op_path
     current_dir_path_for_redirect = str(Path(item_path).parent)
     if current_dir_path_for_redirect == ".": current_dir_path_for_redirect = ""
@@ -388,31 +774,13 @@ def delete_file_or_folder(item_path): # item_path is op_path
                 elif abs_item_path.is_dir(): shutil.rmtree(abs_item_path); item_type = "Directory"
                 else: flash(f"Item '{item_name}' not found or is not a file/directory.", "warning"); return redirect(url_for('file_manager', current_dir_path=current_dir_path_for_redirect))
                 flash(f"{item_type} '{item_name}' deleted successfully.", "success")
-                simulated_notifications.insert(0, {"message": f"Real deletion of {item_type.lower()} {item_name}.", "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+                notify(f"Real deletion of {item_type.lower()} {item_name}.", level="warning", source="file_manager")
             except Exception as e: flash(f"Error deleting '{abs_item_path.name if 'abs_item_path' in locals() else item_path}': {e}", "danger")
     else: 
-        global simulated_files
-        item_found_and_deleted = False
-        final_sim_list = []
-        deleted_item_type_sim = ""
-        for f_s in simulated_files:
-            current_s_op_path = (f_s['path'].lstrip('/') + f_s['name']).lstrip('/')
-            if not current_s_op_path: current_s_op_path = f_s['name']
-            is_target = (current_s_op_path == item_path)
-            is_inside_deleted_dir = False
-            if not is_target and deleted_item_type_sim == 'directory' and current_s_op_path.startswith(item_path + '/'):
-                is_inside_deleted_dir = True # Basic check for items inside a deleted directory
-            if is_target:
-                item_found_and_deleted = True
-                deleted_item_type_sim = f_s['type']
-                if deleted_item_type_sim != 'directory': # If it's a file, or a dir that we are not recursively deleting for sim
-                    continue # Don't add to final list
-            if not is_target and not is_inside_deleted_dir:
-                final_sim_list.append(f_s)
+        item_found_and_deleted = app_state.delete_file(item_path)
         if item_found_and_deleted:
-            simulated_files = final_sim_list
             flash(f"Simulated deletion of '{item_path}'.", "info")
-            simulated_notifications.insert(0, {"message": f"Simulated deletion of {item_path}.", "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+            notify(f"Simulated deletion of {item_path}.", source="file_manager")
         else: flash(f"Simulated item '{item_path}' not found for deletion.", "warning")
     return redirect(url_for('file_manager', current_dir_path=current_dir_path_for_redirect if FILE_MANAGER_REAL_MODE else ''))
 
@@ -454,7 +822,7 @@ def ssh_command_execute():
                     flash(command_error, "danger")
                 else:
                     timeout_seconds = 10
-                    completed_process = subprocess.run(
+                    completed_process = _timed_call('subprocess', 'shell_command', subprocess.run,
                         command_parts, capture_output=True, text=True,
                         timeout=timeout_seconds, check=False, cwd=str(Path.home()) # Run in user's home dir
                     )
@@ -488,24 +856,29 @@ def clear_ssh_history():
     return redirect(url_for('ssh_shell_page'))
 
 @app.route('/system-monitoring')
+@subsystems.requires('psutil', 'system_stats')
 def system_monitoring():
     stats_to_display = dummy_stats.copy(); simulation_note = ""
     pi_info_data = get_real_pi_info()
+    live = system_stats.latest()
 
     if PSUTIL_AVAILABLE:
         try:
-            cpu_usage_val = psutil.cpu_percent(interval=0.5)
-            ram = psutil.virtual_memory()
+            if live and live.get("cpu") and live["cpu"]["total_percent"] is not None and not live["simulated"]:
+                cpu_usage_val = live["cpu"]["total_percent"]
+            else: # No rates yet: CPU use since the previous call, without blocking
+                cpu_usage_val = _timed_call('psutil', 'cpu_percent', psutil.cpu_percent, interval=None)
+            ram = _timed_call('psutil', 'virtual_memory', psutil.virtual_memory)
             ram_total_fmt = format_bytes(ram.total)
             ram_used_fmt = format_bytes(ram.used)
             ram_percent_val = ram.percent
             
-            disk = psutil.disk_usage('/')
+            disk = _timed_call('psutil', 'disk_usage', psutil.disk_usage, '/')
             disk_total_fmt = format_bytes(disk.total)
             disk_used_fmt = format_bytes(disk.used)
             disk_percent_val = disk.percent
             
-            net_io = psutil.net_io_counters()
+            net_io = _timed_call('psutil', 'net_io_counters', psutil.net_io_counters)
             net_sent_fmt = format_bytes(net_io.bytes_sent)
             net_received_fmt = format_bytes(net_io.bytes_recv)
             
@@ -529,6 +902,7 @@ def system_monitoring():
             }
         except Exception as e:
             print(f"Error fetching system stats with psutil: {e}. Falling back to simulated data.")
+            _count_fallback('system_monitoring', 'error')
             simulation_note = f" (Error: {e}. Using simulated data.)"
             # Apply simulation note to string display values if error occurs
             for key in ["cpu_usage", "ram_usage", "storage_usage", "network_sent", "network_received", "uptime"]:
@@ -541,6 +915,7 @@ def system_monitoring():
 
 
     else: # psutil not available
+        _count_fallback('system_monitoring', 'unavailable')
         simulation_note = " (psutil not available. Using simulated data.)"
         # Apply simulation note to string display values
         for key in ["cpu_usage", "ram_usage", "storage_usage", "network_sent", "network_received", "uptime"]:
@@ -552,12 +927,46 @@ def system_monitoring():
         stats_to_display.setdefault("ram_percent", dummy_stats["ram_percent"])
         stats_to_display.setdefault("disk_percent", dummy_stats["disk_percent"])
 
-    return render_template('system_monitoring.html', stats=stats_to_display, pi_info=pi_info_data)
+    return render_template('system_monitoring.html', stats=stats_to_display, pi_info=pi_info_data, live=live,
+                           refresh_ms=int(SYSTEM_STATS_INTERVAL * 1000))
+
+@app.route('/system-monitoring/rates')
+@subsystems.requires('system_stats')
+def system_monitoring_rates(): # HTML fragment the System Monitoring page polls to refresh its live cards
+    return render_template('system_rates.html', live=system_stats.latest())
+
+@app.route('/api/system/stats')
+@subsystems.requires('system_stats')
+def system_stats_api():
+    live = system_stats.latest()
+    if live is None: return jsonify({"error": "No sample collected yet."}), 503
+    return jsonify(live)
+
+@app.route('/fleet')
+@subsystems.requires('fleet')
+def fleet_page():
+    nodes = fleet.snapshot()
+    return render_template('fleet.html', nodes=nodes, summary=fleet.summary(nodes), errors=fleet_node_errors,
+                           nodes_file=FLEET_NODES_PATH, refresh_ms=int(FLEET_POLL_INTERVAL * 1000))
+
+@app.route('/fleet/nodes')
+@subsystems.requires('fleet')
+def fleet_nodes_fragment(): # HTML fragment the Fleet page polls; served from the cache, never waits on a node
+    nodes = fleet.snapshot()
+    return render_template('fleet_nodes.html', nodes=nodes, summary=fleet.summary(nodes))
+
+@app.route('/api/fleet')
+@subsystems.requires('fleet')
+def fleet_api():
+    nodes = fleet.snapshot()
+    return jsonify({"summary": fleet.summary(nodes), "interval_s": fleet.interval, "timeout_s": fleet.timeout,
+                    "errors": fleet_node_errors, "nodes": nodes})
 
 @app.route('/camera', endpoint='camera_page')
 def camera_page(): return render_template('camera.html')
 
 @app.route('/camera_feed')
+@subsystems.requires('camera')
 def camera_feed():
     if CAMERA_AVAILABLE:
         try:
@@ -565,37 +974,51 @@ def camera_feed():
             if picam2: 
                 if not picam2.started: 
                     config = picam2.create_still_configuration(main={"size": (1280, 720)}); picam2.configure(config); picam2.start()
-                picam2.capture_file(img_buffer, format='jpeg')
+                _timed_call('camera', 'capture', picam2.capture_file, img_buffer, format='jpeg')
             elif camera: 
                 if camera.resolution is None or camera.resolution == (0,0): camera.resolution = (1280, 720)
-                camera.capture(img_buffer, format='jpeg', use_video_port=True)
+                _timed_call('camera', 'capture', camera.capture, img_buffer, format='jpeg', use_video_port=True)
             img_buffer.seek(0)
-            return send_file(img_buffer, mimetype='image/jpeg')
+            response = send_file(img_buffer, mimetype='image/jpeg')
+            response.headers['Cache-Control'] = 'no-store' # A new frame every time
+            return response
         except Exception as e:
             print(f"Error capturing image: {e}")
-            simulated_notifications.insert(0, {"message": f"Error capturing image: {e}. Displaying placeholder.", "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
-    return send_from_directory(os.path.join(app.root_path, 'static/images'), 'placeholder_camera.png')
+            _count_fallback('camera', 'error')
+            notify(f"Error capturing image: {e}. Displaying placeholder.", level="danger", source="camera")
+    else: _count_fallback('camera', 'unavailable')
+    # Same URL as live frames, so never cached for long; revalidation still avoids re-sending it
+    return static_assets.send(CAMERA_PLACEHOLDER, request, immutable=False, compression=COMPRESSION_ENABLED) or abort(404)
 # Notes on Real-time Video Streaming: (MJPEG, multipart HTTP response, dedicated camera thread, etc.)
 
-@app.route('/sensors')
-def sensors():
+_sensor_lock = threading.Lock() # The DHT22 is bit-banged and the I2C bus has one master: one reader at a time
+
+def read_sensors():
+    # Returns (readings for the Sensors page, {metric: value} of the real readings for alert rules).
+    # Used by the page and by the background sensor sampler.
+    with _sensor_lock: return _read_sensors()
+
+def _read_sensors():
     sensor_readings = {'dht22': dummy_sensor_data['dht22'].copy(), 'ds18b20': dummy_sensor_data['ds18b20'].copy(), 
                        'bmp180': dummy_sensor_data['bmp180'].copy(), 'sense_hat': dummy_sensor_data['sense_hat'].copy()}
     for key in sensor_readings:
         for k_sub, v_sub in sensor_readings[key].items(): sensor_readings[key][k_sub] = f"{v_sub}"
         sensor_readings[key]['simulated_reason'] = "Real sensor read not attempted or failed by default."
+    sensor_values = {} # Real readings only, for alert rules
     try: # DHT22
         import Adafruit_DHT; DHT_SENSOR_TYPE = Adafruit_DHT.DHT22; DHT_PIN = 4
-        humidity, temperature = Adafruit_DHT.read_retry(DHT_SENSOR_TYPE, DHT_PIN)
-        if humidity is not None and temperature is not None: sensor_readings['dht22'] = {'temperature': f"{temperature:.1f}°C", 'humidity': f"{humidity:.1f}%"}
+        humidity, temperature = _timed_call('sensor', 'dht22', Adafruit_DHT.read_retry, DHT_SENSOR_TYPE, DHT_PIN)
+        if humidity is not None and temperature is not None:
+            sensor_readings['dht22'] = {'temperature': f"{temperature:.1f}°C", 'humidity': f"{humidity:.1f}%"}
+            sensor_values.update(dht22_temperature=temperature, dht22_humidity=humidity)
         else: sensor_readings['dht22']['simulated_reason'] = "Failed to get reading from DHT sensor."
     except ImportError: sensor_readings['dht22']['simulated_reason'] = "Adafruit_DHT library not found."
     except RuntimeError as e: sensor_readings['dht22']['simulated_reason'] = f"DHT runtime error: {e}"
     except Exception as e: sensor_readings['dht22']['simulated_reason'] = f"Unexpected DHT error: {e}"
     try: # DS18B20
         from w1thermsensor import W1ThermSensor, NoSensorFoundError, KernelModuleLoadError
-        ds_sensor = W1ThermSensor(); temperature = ds_sensor.get_temperature()
-        sensor_readings['ds18b20'] = {'temperature': f"{temperature:.1f}°C"}
+        ds_sensor = W1ThermSensor(); temperature = _timed_call('sensor', 'ds18b20', ds_sensor.get_temperature)
+        sensor_readings['ds18b20'] = {'temperature': f"{temperature:.1f}°C"}; sensor_values['ds18b20'] = temperature
     except ImportError: sensor_readings['ds18b20']['simulated_reason'] = "w1thermsensor library not found."
     except NoSensorFoundError: sensor_readings['ds18b20']['simulated_reason'] = "No DS18B20 sensor found."
     except KernelModuleLoadError as e: sensor_readings['ds18b20']['simulated_reason'] = f"DS18B20 kernel module error: {e}"
@@ -603,27 +1026,40 @@ def sensors():
     try: # BMP280
         import board; import busio; import adafruit_bmp280
         i2c = busio.I2C(board.SCL, board.SDA); bmp280 = adafruit_bmp280.Adafruit_BMP280_I2C(i2c)
-        sensor_readings['bmp180'] = {'temperature': f"{bmp280.temperature:.1f}°C", 'pressure': f"{bmp280.pressure:.1f} hPa"}
+        bmp_temperature, bmp_pressure = _timed_call('sensor', 'bmp280', lambda: (bmp280.temperature, bmp280.pressure))
+        sensor_readings['bmp180'] = {'temperature': f"{bmp_temperature:.1f}°C", 'pressure': f"{bmp_pressure:.1f} hPa"}
+        sensor_values.update(bmp280_temperature=bmp_temperature, bmp280_pressure=bmp_pressure)
         if 'altitude' in sensor_readings['bmp180']: del sensor_readings['bmp180']['altitude'] 
     except ImportError: sensor_readings['bmp180']['simulated_reason'] = "BMP280/board/busio library not found."
     except RuntimeError as e: sensor_readings['bmp180']['simulated_reason'] = f"BMP280 runtime error (check I2C): {e}"
     except Exception as e: sensor_readings['bmp180']['simulated_reason'] = f"BMP280 error: {e}"
     try: # Sense HAT
         from sense_hat import SenseHat; sense = SenseHat()
-        sensor_readings['sense_hat'] = {'temperature': f"{sense.get_temperature():.1f}°C", 'humidity': f"{sense.get_humidity():.1f}%", 
-                                        'pressure': f"{sense.get_pressure():.1f} hPa", 'joystick': "N/A", 'orientation': "N/A"}
+        sh_temperature, sh_humidity, sh_pressure = _timed_call('sensor', 'sense_hat', lambda: (sense.get_temperature(), sense.get_humidity(), sense.get_pressure()))
+        sensor_readings['sense_hat'] = {'temperature': f"{sh_temperature:.1f}°C", 'humidity': f"{sh_humidity:.1f}%", 
+                                        'pressure': f"{sh_pressure:.1f} hPa", 'joystick': "N/A", 'orientation': "N/A"}
+        sensor_values.update(sense_hat_temperature=sh_temperature, sense_hat_humidity=sh_humidity, sense_hat_pressure=sh_pressure)
     except ImportError: sensor_readings['sense_hat']['simulated_reason'] = "SenseHat library not found."
     except OSError as e: sensor_readings['sense_hat']['simulated_reason'] = f"Sense HAT OS error (not connected?): {e}"
     except Exception as e: sensor_readings['sense_hat']['simulated_reason'] = f"Sense HAT error: {e}"
+    return sensor_readings, sensor_values
+
+@app.route('/sensors')
+def sensors():
+    sensor_readings, _ = read_sensors() # Alert rules get their readings from sensor_sampler, not page views
+    for key, reading in sensor_readings.items():
+        if 'simulated_reason' in reading: _count_fallback(f"sensor_{key}", 'simulated')
     return render_template('sensors.html', sensors=sensor_readings)
 
 @app.route('/processes')
+@subsystems.requires('psutil')
 def processes():
     processes_to_display = dummy_processes; simulation_note = "" 
     if PSUTIL_AVAILABLE:
         real_processes = []
         try:
-            for proc in psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 'memory_percent']):
+            process_list = _timed_call('psutil', 'process_iter', lambda: list(psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 'memory_percent'])))
+            for proc in process_list:
                 try:
                     pinfo = proc.info; cpu_percent_formatted = f"{pinfo['cpu_percent']:.1f}%"; memory_percent_formatted = f"{pinfo['memory_percent']:.1f}%"
                     real_processes.append({'pid': pinfo['pid'], 'user': pinfo['username'], 'cpu': cpu_percent_formatted, 'mem': memory_percent_formatted, 'command': pinfo['name']})
@@ -636,10 +1072,12 @@ def processes():
                     if simulation_note not in proc_item.get('command', ''): proc_item['command'] = f"{proc_item.get('command', '')}{simulation_note}"
         except Exception as e: 
             print(f"Error iterating over processes with psutil: {e}. Falling back to simulated data.")
+            _count_fallback('processes', 'error')
             simulation_note = f" (Error: {e}. Using simulated data.)"
             for proc_item in processes_to_display: 
                 if "(Simulated)" not in proc_item.get('command', '') and simulation_note not in proc_item.get('command', ''): proc_item['command'] = f"{proc_item.get('command', '')}{simulation_note}"
     else:
+        _count_fallback('processes', 'unavailable')
         simulation_note = " (psutil not available. Using simulated data.)"
         for proc_item in processes_to_display: 
             if "(Simulated)" not in proc_item.get('command', '') and simulation_note not in proc_item.get('command', ''): proc_item['command'] = f"{proc_item.get('command', '')}{simulation_note}"
@@ -655,38 +1093,117 @@ def pi_info():
 def pinout(): return render_template('pinout_diagrams.html')
 
 @app.route('/pinout_image')
-def pinout_image(): return send_from_directory(os.path.join(app.root_path, 'static/images'), 'placeholder_pinout.png')
+def pinout_image(): return static_assets.send(PINOUT_IMAGE, request, version=request.args.get('v'), compression=COMPRESSION_ENABLED) or abort(404)
+
+def _parse_notification_time(value):
+    if not value: return None
+    try: return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        flash(f"Invalid date/time '{value}'. Use YYYY-MM-DD or YYYY-MM-DD HH:MM.", "warning")
+        return None
+
+def _query_notifications():
+    filters = {"source": request.args.get('source') or None, "level": request.args.get('level') or None,
+               "since": request.args.get('since', ''), "until": request.args.get('until', '')}
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = max(1, min(request.args.get('per_page', NOTIFICATIONS_PER_PAGE, type=int), 500))
+    items, total = notification_store.query(source=filters["source"], level=filters["level"],
+                                            since=_parse_notification_time(filters["since"]),
+                                            until=_parse_notification_time(filters["until"]),
+                                            page=page, per_page=per_page)
+    return items, total, page, per_page, filters
 
 @app.route('/notifications')
-def notifications(): return render_template('notifications.html', notifications=simulated_notifications)
+def notifications():
+    items, total, page, per_page, filters = _query_notifications()
+    total_pages = max((total + per_page - 1) // per_page, 1)
+    return render_template('notifications.html', notifications=items, total=total, page=page, total_pages=total_pages,
+                           filters=filters, sources=notification_store.sources(), levels=NOTIFICATION_LEVELS)
+
+@app.route('/api/notifications')
+def notifications_api():
+    items, total, page, per_page, filters = _query_notifications()
+    return jsonify({"notifications": items, "total": total, "page": page, "per_page": per_page})
 
 @app.route('/notifications/add', methods=['POST'])
 def add_notification():
     message = request.form.get('message')
-    if message: simulated_notifications.insert(0, {"message": message, "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+    if message: notify(message, level=request.form.get("level", "info"), source="user")
     return redirect(url_for('notifications'))
 
 @app.route('/notifications/clear', methods=['POST'])
 def clear_notifications():
-    global simulated_notifications; simulated_notifications = []
+    notification_store.clear()
     return redirect(url_for('notifications'))
 
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain', headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+@app.route('/api/subsystems')
+def subsystems_api(): return jsonify({"subsystems": subsystems.report()})
+
+@app.route('/api/alerts')
+@subsystems.requires('alerts')
+def alerts_api():
+    return jsonify({"enabled": alert_engine.enabled, "rules_file": str(ALERT_RULES_PATH), "errors": alert_rule_errors,
+                    "rules": alert_engine.status()})
+
+def _profiler_pid_mismatch():
+    # Each worker process has its own profiler. Clients pass ?pid= (from the start response) to the
+    # other profiler routes; a request that reached a different worker gets 409 and should be retried.
+    pid = request.values.get('pid', type=int)
+    if pid is None or pid == os.getpid(): return None
+    return jsonify({"error": f"Process {pid} is profiling, but this request reached process {os.getpid()}; retry.",
+                    "pid": os.getpid()}), 409
+
+@app.route('/admin/profiler')
+def profiler_status(): return _profiler_pid_mismatch() or jsonify(profiler.status())
+
+@app.route('/admin/profiler/start', methods=['POST'])
+def profiler_start():
+    # e.g. POST /admin/profiler/start?seconds=30&interval_ms=10 (add idle=1 to include waiting threads)
+    seconds = request.values.get('seconds', 30, type=float)
+    interval_ms = request.values.get('interval_ms', PROFILER_DEFAULT_INTERVAL_MS, type=float)
+    include_idle = request.values.get('idle', '0').lower() in ('1', 'true', 'yes')
+    try: status = profiler.start(seconds, interval=interval_ms / 1000, include_idle=include_idle)
+    except ValueError as e: return jsonify({"error": str(e)}), 400
+    except RuntimeError as e: return jsonify({"error": str(e)}), 409
+    notify(f"Sampling profiler started for {seconds:g} s (process {os.getpid()}).", level="warning", source="profiler")
+    return jsonify(status), 202
+
+@app.route('/admin/profiler/stop', methods=['POST'])
+def profiler_stop(): return _profiler_pid_mismatch() or jsonify(profiler.stop())
+
+@app.route('/admin/profiler/profile.collapsed')
+def profiler_download():
+    # Collapsed stacks of the current or last session; open in speedscope.app or pipe into flamegraph.pl
+    mismatch = _profiler_pid_mismatch()
+    if mismatch: return mismatch
+    status = profiler.status()
+    if not status["samples"]: return jsonify({"error": "No profile recorded yet; POST /admin/profiler/start first."}), 404
+    filename = f"raspcontroll-{os.getpid()}-{datetime.datetime.fromtimestamp(status['started']).strftime('%Y%m%d-%H%M%S')}.collapsed"
+    return Response(profiler.collapsed(), mimetype='text/plain',
+                    headers={'Content-Disposition': f'attachment; filename={filename}', 'Cache-Control': 'no-store'})
+
 @app.route('/power')
 def power(): return render_template('power_control.html')
 
 @app.route('/power/shutdown', methods=['POST'])
 def power_shutdown():
     print("Attempting system shutdown...")
-    simulated_notifications.insert(0, {"message": "System shutdown initiated.", "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+    notify("System shutdown initiated.", level="warning", source="power")
     os.system("sudo shutdown now") # Real command
     return "<h1>System Shutdown Initiated</h1><p>If this were a real Raspberry Pi, it would now be shutting down. Close this window.</p><a href='/'>Back to Home (if not shutting down)</a>"
 
 @app.route('/power/reboot', methods=['POST'])
 def power_reboot():
     print("Attempting system reboot...")
-    simulated_notifications.insert(0, {"message": "System reboot initiated.", "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+    notify("System reboot initiated.", level="warning", source="power")
     os.system("sudo reboot") # Real command
     return "<h1>System Reboot Initiated</h1><p>If this were a real Raspberry Pi, it would now be rebooting. Close this window.</p><a href='/'>Back to Home (if not rebooting)</a>"
 
 if __name__ == '__main__':
+    # Development server with the debugger enabled. For anything else use serve.py (see README).
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true': subsystems.ensure('alerts') # Only in the reloader's child process
     app.run(host='0.0.0.0', debug=True)
@@ -0,0 +1,523 @@
+# benchmark.py
+# Reproducible latency/throughput benchmark for every RaspControll route, using simulated hardware.
+#
+#   python3 benchmark.py                                    # test client and a real local server
+#   python3 benchmark.py --files 100000 --processes 5000    # bigger file tree / process table
+#   python3 benchmark.py --psutil-latency-ms 5 --gpio-latency-ms 1 --camera-latency-ms 120
+#   python3 benchmark.py --routes sensors --sensor-latency-ms 250  # slow DHT22-style sensor reads
+#   python3 benchmark.py --routes fleet --fleet-nodes 500   # fleet dashboard with 500 cached nodes
+#   python3 benchmark.py --save-baseline                    # store the results in benchmark_baseline.json
+#   python3 benchmark.py --compare                          # exit 1 if any route got slower than the baseline
+#
+# Hardware is replaced by in-process fakes with configurable latencies (psutil, subprocess calls,
+# the camera, sensors, simulated GPIO writes), the File Manager points at a synthetic directory
+# tree and state/notifications/thumbnails use fresh throwaway stores, so runs are repeatable and
+# nothing on the machine is touched: the subsystems' init functions (real GPIO, camera, File
+# Manager directory, background threads) are skipped, and GPIO programs run on a simulated
+# scheduler. The power routes are never called: they run `sudo shutdown`/`reboot`.
+# Baselines are only meaningful on the machine (and with the scenario) they were recorded with.
+
+# Standard Library Imports
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import resource
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import http.client
+from pathlib import Path
+from collections import namedtuple
+from contextlib import contextmanager, ExitStack
+from unittest.mock import patch
+
+BASELINE_PATH = Path(__file__).with_name("benchmark_baseline.json")
+FIXED_MTIME = 1_700_000_000 # Synthetic files get fixed timestamps so listings render identically every run
+FILE_EXTENSIONS = ("txt", "log", "csv", "jpg", "png", "py", "json", "bin")
+
+# Endpoints that are deliberately not benchmarked, with the reason (shown in the report).
+SKIPPED_ENDPOINTS = {
+    "static": "served by the web server / covered by /pinout_image",
+    "gpio_events_stream": "long-lived event stream; no per-request latency",
+    "power_shutdown": "runs `sudo shutdown now`",
+    "power_reboot": "runs `sudo reboot`",
+    "profiler_start": "starts a background sampling session",
+    "profiler_stop": "only meaningful while a sampling session runs",
+}
+
+Case = namedtuple("Case", "endpoint method path body content_type")
+
+def _case(endpoint, method, path, body=None, content_type=None):
+    if isinstance(body, dict) and content_type is None: # Form fields
+        from urllib.parse import urlencode
+        body, content_type = urlencode(body).encode(), "application/x-www-form-urlencoded"
+    elif body is not None and content_type == "application/json":
+        body = json.dumps(body).encode()
+    return Case(endpoint, method, path, body, content_type)
+
+def _multipart(field: str, filename: str, content: bytes):
+    boundary = "raspcontroll-benchmark"
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n").encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+def route_cases(sample_image: str = "sample.png", bulk_dir: str = "bulk") -> list:
+    # One request per endpoint. Mutating routes are given inputs that leave the scenario unchanged
+    # between iterations (the same upload overwritten, a delete of a missing file, ...).
+    upload_body, upload_type = _multipart("file", "bench_upload.txt", b"benchmark upload\n" * 64)
+    return [
+        _case("index", "GET", "/"),
+        _case("gpio", "GET", "/gpio"),
+        _case("toggle_gpio", "GET", "/gpio/toggle/17"),
+        _case("gpio_api", "GET", "/api/gpio"),
+        _case("gpio_batch", "POST", "/api/gpio/batch", {"pins": {"17": "ON", "18": "OFF"}}, "application/json"),
+        _case("submit_gpio_program", "POST", "/api/gpio/programs", {"steps": [{"pulse": 27, "ms": 5}]}, "application/json"),
+        _case("gpio_program", "GET", "/api/gpio/programs/1"),
+        _case("gpio_scheduler_stats", "GET", "/api/gpio/scheduler"),
+        _case("gpio_events_api", "GET", "/api/gpio/events?since=0"),
+        _case("simulate_gpio_input", "POST", "/api/gpio/inputs/22/simulate"),
+        _case("file_manager", "GET", "/file-manager/"),
+        _case("file_manager", "GET", f"/file-manager/{bulk_dir}"),
+        _case("upload_file", "POST", "/file-manager/upload", upload_body, upload_type),
+        _case("download_file", "GET", f"/file-manager/download/{sample_image}"),
+        _case("thumbnail", "GET", f"/file-manager/thumbnail/{sample_image}"),
+        _case("delete_file_or_folder", "POST", "/file-manager/delete/benchmark-missing.txt"),
+        _case("ssh_shell_page", "GET", "/ssh"),
+        _case("ssh_command_execute", "POST", "/ssh/command", {"command": "uptime"}),
+        _case("clear_ssh_history", "POST", "/ssh/clear_history"),
+        _case("system_monitoring", "GET", "/system-monitoring"),
+        _case("system_monitoring_rates", "GET", "/system-monitoring/rates"),
+        _case("system_stats_api", "GET", "/api/system/stats"),
+        _case("fleet_page", "GET", "/fleet"),
+        _case("fleet_nodes_fragment", "GET", "/fleet/nodes"),
+        _case("fleet_api", "GET", "/api/fleet"),
+        _case("camera_page", "GET", "/camera"),
+        _case("camera_feed", "GET", "/camera_feed"),
+        _case("sensors", "GET", "/sensors"),
+        _case("processes", "GET", "/processes"),
+        _case("pi_info", "GET", "/pi-info"),
+        _case("pinout", "GET", "/pinout"),
+        _case("pinout_image", "GET", "/pinout_image"),
+        _case("notifications", "GET", "/notifications"),
+        _case("notifications_api", "GET", "/api/notifications"),
+        _case("add_notification", "POST", "/notifications/add", {"message": "benchmark", "level": "info"}),
+        _case("clear_notifications", "POST", "/notifications/clear"),
+        _case("metrics_endpoint", "GET", "/metrics"),
+        _case("subsystems_api", "GET", "/api/subsystems"),
+        _case("alerts_api", "GET", "/api/alerts"),
+        _case("profiler_status", "GET", "/admin/profiler"),
+        _case("profiler_download", "GET", "/admin/profiler/profile.collapsed"),
+        _case("power", "GET", "/power"),
+    ]
+
+def uncovered_endpoints(flask_app, cases) -> set:
+    # Endpoints with neither a benchmark case nor a reason to skip them (i.e. a route added without a case).
+    covered = {case.endpoint for case in cases} | set(SKIPPED_ENDPOINTS)
+    return {rule.endpoint for rule in flask_app.url_map.iter_rules()} - covered
+
+# --- Simulated hardware -------------------------------------------------------------------------
+
+class FakePsutil:
+    # Just enough of psutil for app.py. Every call sleeps `latency_s`; cpu_percent(interval=...) also
+    # blocks for the interval (times `interval_scale`), like the real call does.
+    NoSuchProcess = type("NoSuchProcess", (Exception,), {})
+    AccessDenied = type("AccessDenied", (Exception,), {})
+    ZombieProcess = type("ZombieProcess", (NoSuchProcess,), {})
+
+    def __init__(self, processes: int = 1000, latency_s: float = 0.0, interval_scale: float = 1.0, seed: int = 0):
+        rng = random.Random(seed)
+        users = ("root", "pi", "www-data", "nobody")
+        self._processes = [{"pid": pid, "name": f"proc-{pid}", "username": rng.choice(users),
+                            "cpu_percent": round(rng.random() * 5, 1), "memory_percent": round(rng.random() * 2, 2)}
+                           for pid in range(1, processes + 1)]
+        self.latency_s = latency_s
+        self.interval_scale = interval_scale
+        self._ticks = 0
+
+    def _wait(self, extra: float = 0.0):
+        if self.latency_s + extra > 0: time.sleep(self.latency_s + extra)
+
+    def cpu_percent(self, interval=None, percpu=False):
+        self._wait((interval or 0) * self.interval_scale)
+        return [12.5, 8.0, 20.0, 5.5] if percpu else 11.5
+
+    def virtual_memory(self):
+        self._wait()
+        return _Namespace(total=4 * 1024**3, used=1536 * 1024**2, available=2560 * 1024**2, percent=37.5)
+
+    def disk_usage(self, path):
+        self._wait()
+        return _Namespace(total=32 * 1024**3, used=12 * 1024**3, free=20 * 1024**3, percent=37.5)
+
+    def net_io_counters(self, pernic=False):
+        self._wait()
+        self._ticks += 1
+        counters = {nic: _Namespace(bytes_sent=123_456_789 + self._ticks * 12_500 * (i + 1), bytes_recv=987_654_321 + self._ticks * 48_000 * (i + 1),
+                                    packets_sent=0, packets_recv=0) for i, nic in enumerate(("eth0", "wlan0"))}
+        return counters if pernic else counters["eth0"]
+
+    def cpu_times(self, percpu=False):
+        # Counters advance by a fixed amount per call, so every core reads 25% busy
+        self._wait()
+        self._ticks += 1
+        core = _CPUTimes(user=self._ticks * 1.0, system=0.0, idle=self._ticks * 3.0, iowait=0.0)
+        return [core] * 4 if percpu else core
+
+    def disk_io_counters(self, perdisk=False):
+        self._wait()
+        self._ticks += 1
+        disk = _Namespace(read_count=self._ticks * 5, write_count=self._ticks * 12, read_bytes=self._ticks * 81_920, write_bytes=self._ticks * 196_608)
+        return {"mmcblk0": disk} if perdisk else disk
+
+    def boot_time(self): return FIXED_MTIME
+
+    def process_iter(self, attrs=None):
+        self._wait()
+        return iter([_Namespace(info={k: p[k] for k in (attrs or p)}) for p in self._processes])
+
+_CPUTimes = namedtuple("_CPUTimes", "user system idle iowait")
+
+class _Namespace:
+    def __init__(self, **kwargs): self.__dict__.update(kwargs)
+
+class FakeSubprocess:
+    # Stands in for the subprocess module inside app.py: canned /proc/cpuinfo, free, os-release and
+    # uname output, and a successful run() for the command shell. Exceptions are the real ones.
+    TimeoutExpired = subprocess.TimeoutExpired
+    CalledProcessError = subprocess.CalledProcessError
+    OUTPUTS = {
+        ("cat", "/proc/cpuinfo"): "model name\t: ARMv7 Processor rev 4 (v7l)\nHardware\t: BCM2835\nSerial\t\t: 00000000benchmark\nModel\t\t: Raspberry Pi 4 Model B Rev 1.4\n",
+        ("free", "-m"): "              total        used        free\nMem:           3794         512        3282\n",
+        ("cat", "/etc/os-release"): 'PRETTY_NAME="Raspbian GNU/Linux 11 (bullseye)"\n',
+        ("uname", "-r"): "6.1.21-v7l+\n",
+    }
+
+    def __init__(self, latency_s: float = 0.0):
+        self.latency_s = latency_s
+
+    def check_output(self, args, **kwargs):
+        if self.latency_s: time.sleep(self.latency_s)
+        return self.OUTPUTS.get(tuple(args), "")
+
+    def run(self, args, **kwargs):
+        if self.latency_s: time.sleep(self.latency_s)
+        return subprocess.CompletedProcess(args, 0, stdout=" 12:00:00 up 3 days,  1 user\n", stderr="")
+
+class FakeCamera:
+    # Picamera2 look-alike returning a fixed image after `latency_s` (a still capture on a Pi takes 100+ ms).
+    def __init__(self, image: bytes, latency_s: float = 0.0):
+        self.image, self.latency_s, self.started = image, latency_s, False
+    def create_still_configuration(self, **kwargs): return kwargs
+    def configure(self, config): pass
+    def start(self): self.started = True
+    def capture_file(self, buffer, format='jpeg'):
+        if self.latency_s: time.sleep(self.latency_s)
+        buffer.write(self.image)
+
+class FakeSensors:
+    # Stands in for app.read_sensors(): real-looking readings from all four sensors, each read costing
+    # `latency_s` (a DHT22 read_retry takes hundreds of ms). Reads are serialised, like the real bus.
+    def __init__(self, latency_s: float = 0.0, seed: int = 0):
+        self.latency_s, self._lock, self._rng = latency_s, threading.Lock(), random.Random(seed)
+    def __call__(self):
+        with self._lock:
+            if self.latency_s: time.sleep(self.latency_s * 4)
+            t, h, p = self._rng.uniform(18, 26), self._rng.uniform(35, 60), self._rng.uniform(990, 1030)
+        readings = {'dht22': {'temperature': f"{t:.1f}°C", 'humidity': f"{h:.1f}%"},
+                    'ds18b20': {'temperature': f"{t:.1f}°C"},
+                    'bmp180': {'temperature': f"{t:.1f}°C", 'pressure': f"{p:.1f} hPa"},
+                    'sense_hat': {'temperature': f"{t:.1f}°C", 'humidity': f"{h:.1f}%", 'pressure': f"{p:.1f} hPa",
+                                  'joystick': "N/A", 'orientation': "N/A"}}
+        values = {"dht22_temperature": t, "dht22_humidity": h, "ds18b20": t, "bmp280_temperature": t, "bmp280_pressure": p,
+                  "sense_hat_temperature": t, "sense_hat_humidity": h, "sense_hat_pressure": p}
+        return readings, values
+
+class SlowState:
+    # Wraps the shared state so every simulated GPIO write costs `latency_s`, like a real pin write.
+    def __init__(self, state, latency_s: float = 0.0):
+        self._state, self.latency_s = state, latency_s
+    def __getattr__(self, name): return getattr(self._state, name)
+    def toggle_pin(self, pin_id):
+        if self.latency_s: time.sleep(self.latency_s)
+        return self._state.toggle_pin(pin_id)
+    def set_pins(self, states):
+        if self.latency_s: time.sleep(self.latency_s * len(states))
+        return self._state.set_pins(states)
+
+def simulated_fleet(nodes: int, seed: int = 0):
+    # A FleetAggregator whose cache already holds a snapshot of every node (a few unreachable), so the
+    # fleet routes are measured rendering `nodes` rows; the poller is never started.
+    from fleet import FleetAggregator
+    from system_stats import SystemStatsCollector
+    rng = random.Random(seed)
+    fleet = FleetAggregator([{"name": f"pi-{i:03d}", "url": f"http://10.0.{i // 250}.{i % 250 + 1}:5000"} for i in range(nodes)])
+    template = SystemStatsCollector(lambda: None)._simulated()
+    for i, snapshot in enumerate(fleet._snapshots.values()):
+        if i % 10 == 9:
+            snapshot.update(status="error", error="TimeoutError: timed out", latency_ms=3000.0, last_poll=time.time())
+            continue
+        stats = dict(template, cpu={"total_percent": round(rng.uniform(0, 100), 1), "per_core": template["cpu"]["per_core"]},
+                     ram_percent=round(rng.uniform(10, 95), 1), temperature_c=round(rng.uniform(40, 85), 1), time=time.time())
+        snapshot.update(status="ok", stats=stats, alerts_firing=["disk_percent > 90"] if i % 7 == 0 else [],
+                        latency_ms=round(rng.uniform(2, 40), 1), last_poll=time.time(), last_ok=time.time())
+    return fleet
+
+# --- Synthetic file tree ------------------------------------------------------------------------
+
+def build_file_tree(root: Path, files: int, seed: int = 0, sample_image: Path = None) -> Path:
+    # Creates <root>/bulk with `files` sparse files (deterministic names, sizes and mtimes), a few
+    # nested folders and one real image for the thumbnail/download routes. An existing tree built
+    # with the same parameters is reused, since creating 100k files takes a while on an SD card.
+    root = Path(root)
+    marker = root / ".benchmark-tree"
+    signature = f"{files} {seed}"
+    if marker.exists() and marker.read_text() == signature: return root
+    if root.exists(): shutil.rmtree(root)
+    rng = random.Random(seed)
+    bulk = root / "bulk"
+    bulk.mkdir(parents=True)
+    for i in range(files):
+        path = bulk / f"file_{i:06d}.{FILE_EXTENSIONS[i % len(FILE_EXTENSIONS)]}"
+        with open(path, "wb") as f: f.truncate(rng.randint(0, 4 * 1024**2)) # Sparse: real size in stat(), no disk used
+        os.utime(path, (FIXED_MTIME + i, FIXED_MTIME + i))
+    for d in range(10):
+        nested = root / "nested" / f"dir_{d:02d}"
+        nested.mkdir(parents=True)
+        for i in range(10): (nested / f"item_{i:02d}.txt").write_text(f"{d}/{i}\n")
+    if sample_image is not None: shutil.copyfile(sample_image, root / "sample.png")
+    marker.write_text(signature)
+    return root
+
+# --- Measurement --------------------------------------------------------------------------------
+
+def percentile(sorted_values: list, p: float) -> float:
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values: return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(p * len(sorted_values)) - 1))]
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024**2 if sys.platform == "darwin" else peak / 1024, 1) # bytes on macOS, KiB on Linux
+
+def _summarise(latencies: list, elapsed: float, statuses: dict, rss_before: float) -> dict:
+    latencies.sort()
+    return {"requests": len(latencies), "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3), "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+            "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+            "statuses": {str(k): v for k, v in sorted(statuses.items())},
+            "rss_growth_mb": round(peak_rss_mb() - rss_before, 1)}
+
+def bench_client(flask_app, case: Case, iterations: int, warmup: int, max_seconds: float) -> dict:
+    # In-process through Flask's test client: measures the app alone, without any HTTP server.
+    client = flask_app.test_client()
+    headers = {"Content-Type": case.content_type} if case.content_type else {}
+    def once():
+        response = client.open(case.path, method=case.method, data=case.body, headers=headers)
+        response.get_data() # Drain the body, including streamed/file responses
+        response.close()
+        return response.status_code
+    for _ in range(warmup): once()
+    rss_before, latencies, statuses = peak_rss_mb(), [], {}
+    start = time.perf_counter()
+    while len(latencies) < iterations and time.perf_counter() - start < max_seconds:
+        t0 = time.perf_counter()
+        status = once()
+        latencies.append(time.perf_counter() - t0)
+        statuses[status] = statuses.get(status, 0) + 1
+    return _summarise(latencies, time.perf_counter() - start, statuses, rss_before)
+
+@contextmanager
+def local_server(flask_app):
+    # A real threaded Werkzeug server on an ephemeral localhost port (it closes each connection after the response).
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.ERROR) # One access-log line per request would skew the timings
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name="benchmark-server", daemon=True)
+    thread.start()
+    try: yield server.server_port
+    finally: server.shutdown(); thread.join()
+
+def bench_server(port: int, case: Case, iterations: int, warmup: int, max_seconds: float, concurrency: int) -> dict:
+    # `concurrency` client threads, each with its own keep-alive connection, share `iterations` requests.
+    headers = {"Content-Type": case.content_type} if case.content_type else {}
+    lock, latencies, statuses = threading.Lock(), [], {}
+    def once(conn):
+        conn.request(case.method, case.path, body=case.body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    for _ in range(warmup): once(conn)
+    conn.close()
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    def worker():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        try:
+            while time.perf_counter() - start < max_seconds:
+                with lock:
+                    if len(latencies) >= iterations: return
+                    latencies.append(None) # Reserve a slot so the threads stop at exactly `iterations`
+                    slot = len(latencies) - 1
+                t0 = time.perf_counter()
+                status = once(conn)
+                with lock:
+                    latencies[slot] = time.perf_counter() - t0
+                    statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            conn.close()
+    threads = [threading.Thread(target=worker) for _ in range(max(1, concurrency))]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return _summarise([v for v in latencies if v is not None], time.perf_counter() - start, statuses, rss_before)
+
+# --- Scenario -----------------------------------------------------------------------------------
+
+@contextmanager
+def simulated_environment(tree_root: Path, processes: int = 1000, psutil_latency_ms: float = 0.0,
+                          subprocess_latency_ms: float = 0.0, camera_latency_ms: float = 0.0,
+                          gpio_latency_ms: float = 0.0, cpu_interval_scale: float = 1.0, seed: int = 0,
+                          fleet_nodes: int = 50, sensor_latency_ms: float = 0.0):
+    # Imports app.py and swaps its hardware backends and stores for the fakes above. Everything is
+    # restored on exit, so this can also run inside the test suite.
+    import app as app_module
+    from shared_state import MemoryState
+    from notification_store import NotificationStore
+    from thumbnails import ThumbnailCache
+    from system_stats import SystemStatsCollector
+    from gpio_scheduler import PinScheduler, SimulatedPinBackend
+    placeholder = Path(app_module.app.root_path) / "static/images/placeholder_camera.png"
+    fake_psutil = FakePsutil(processes, psutil_latency_ms / 1000, cpu_interval_scale, seed)
+    system_stats = SystemStatsCollector(lambda: fake_psutil) # Sampled here, never started as a thread
+    system_stats.sample(); system_stats.sample() # A baseline and a first set of rates
+    # Subsystems that haven't been initialised are marked ready without running their init functions:
+    # those would open the real GPIO and camera, create the File Manager directory and start threads.
+    with tempfile.TemporaryDirectory(prefix="raspcontroll-bench-") as tmp, ExitStack() as stack:
+        stack.enter_context(app_module.subsystems.bypassed())
+        fakes = {
+            "psutil": fake_psutil, "PSUTIL_AVAILABLE": True, "system_stats": system_stats,
+            "gpio_scheduler": PinScheduler(SimulatedPinBackend(on_write=app_module._on_scheduled_write)),
+            "subprocess": FakeSubprocess(subprocess_latency_ms / 1000),
+            "picam2": FakeCamera(placeholder.read_bytes(), camera_latency_ms / 1000), "camera": None, "CAMERA_AVAILABLE": True,
+            "RPI_GPIO_AVAILABLE": False, "read_sensors": FakeSensors(sensor_latency_ms / 1000, seed),
+            "app_state": SlowState(MemoryState(app_module._initial_pin_states, app_module.simulated_files), gpio_latency_ms / 1000),
+            "notification_store": NotificationStore(max_items=app_module.NOTIFICATIONS_MAX),
+            "thumbnail_cache": ThumbnailCache(Path(tmp) / "thumbnails", size=app_module.THUMBNAIL_SIZE, workers=app_module.THUMBNAIL_WORKERS),
+            "FILE_MANAGER_BASE_DIR": Path(tree_root).resolve(), "FILE_MANAGER_REAL_MODE": True,
+            "fleet": simulated_fleet(fleet_nodes, seed),
+        }
+        for name, value in fakes.items(): stack.enter_context(patch.object(app_module, name, value))
+        yield app_module.app
+
+def run_benchmark(args) -> dict:
+    scenario = {k: getattr(args, k) for k in ("files", "processes", "psutil_latency_ms", "subprocess_latency_ms",
+                                              "camera_latency_ms", "gpio_latency_ms", "sensor_latency_ms", "cpu_interval_scale",
+                                              "fleet_nodes", "iterations", "concurrency", "seed")}
+    tree_dir = Path(args.tree_dir) if args.tree_dir else Path(tempfile.mkdtemp(prefix="raspcontroll-tree-"))
+    results = {}
+    try:
+        import app as app_module
+        placeholder = Path(app_module.app.root_path) / "static/images/placeholder_camera.png"
+        t0 = time.perf_counter()
+        build_file_tree(tree_dir, args.files, args.seed, sample_image=placeholder)
+        print(f"File tree with {args.files} files ready in {time.perf_counter() - t0:.1f} s ({tree_dir}).")
+        cases = route_cases()
+        if args.routes: cases = [c for c in cases if any(r in c.path or r == c.endpoint for r in args.routes)]
+        with simulated_environment(tree_dir, args.processes, args.psutil_latency_ms, args.subprocess_latency_ms,
+                                   args.camera_latency_ms, args.gpio_latency_ms, args.cpu_interval_scale, args.seed,
+                                   args.fleet_nodes, args.sensor_latency_ms) as flask_app:
+            missing = uncovered_endpoints(flask_app, route_cases())
+            if missing: print(f"Warning: endpoints without a benchmark case: {', '.join(sorted(missing))}")
+            if "client" in args.modes:
+                for case in cases:
+                    results[f"client {case.method} {case.path}"] = bench_client(flask_app, case, args.iterations, args.warmup, args.max_seconds)
+            if "server" in args.modes:
+                with local_server(flask_app) as port:
+                    for case in cases:
+                        results[f"server {case.method} {case.path}"] = bench_server(port, case, args.iterations, args.warmup,
+                                                                                    args.max_seconds, args.concurrency)
+    finally:
+        if not args.tree_dir: shutil.rmtree(tree_dir, ignore_errors=True)
+    return {"scenario": scenario, "machine": {"platform": platform.platform(), "python": platform.python_version()},
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "peak_rss_mb": peak_rss_mb(), "results": results}
+
+def compare(current: dict, baseline: dict, tolerance: float = 0.2, min_delta_ms: float = 1.0) -> list:
+    # Returns (route, metric, baseline_ms, current_ms) for every p50/p99 that is more than `tolerance`
+    # (fractional) and `min_delta_ms` slower than the baseline. The absolute floor keeps sub-millisecond
+    # routes from flagging on scheduler noise.
+    regressions = []
+    for route, result in current["results"].items():
+        base = baseline.get("results", {}).get(route)
+        if not base: continue
+        for metric in ("p50_ms", "p99_ms"):
+            if result[metric] > base[metric] * (1 + tolerance) and result[metric] - base[metric] > min_delta_ms:
+                regressions.append((route, metric, base[metric], result[metric]))
+    return regressions
+
+def print_report(report: dict, baseline: dict = None):
+    base_results = (baseline or {}).get("results", {})
+    print(f"\n{'route':<58} {'n':>5} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>8} {'status':<12} {'vs base p50':>11}")
+    for route, r in report["results"].items():
+        base = base_results.get(route)
+        change = f"{(r['p50_ms'] / base['p50_ms'] - 1) * 100:+.0f}%" if base and base["p50_ms"] else ""
+        statuses = ",".join(f"{k}x{v}" for k, v in r["statuses"].items())
+        print(f"{route:<58} {r['requests']:>5} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['throughput_rps']:>8.1f} {statuses:<12} {change:>11}")
+    print(f"\nPeak RSS: {report['peak_rss_mb']} MB")
+    for endpoint, reason in SKIPPED_ENDPOINTS.items(): print(f"Not benchmarked: {endpoint} ({reason})")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark every RaspControll route with simulated hardware.")
+    parser.add_argument("--modes", nargs="+", choices=("client", "server"), default=["client", "server"])
+    parser.add_argument("--routes", nargs="*", help="Only run cases whose path contains, or endpoint equals, one of these")
+    parser.add_argument("--files", type=int, default=10_000, help="Files in the synthetic directory (10k-100k is realistic for an SD card)")
+    parser.add_argument("--processes", type=int, default=1000, help="Size of the fake process table")
+    parser.add_argument("--psutil-latency-ms", type=float, default=1.0)
+    parser.add_argument("--subprocess-latency-ms", type=float, default=5.0)
+    parser.add_argument("--camera-latency-ms", type=float, default=150.0)
+    parser.add_argument("--gpio-latency-ms", type=float, default=0.1)
+    parser.add_argument("--sensor-latency-ms", type=float, default=10.0, help="Per sensor; a Sensors page read covers four")
+    parser.add_argument("--cpu-interval-scale", type=float, default=1.0, help="Multiplier for psutil.cpu_percent(interval=...) blocking time")
+    parser.add_argument("--fleet-nodes", type=int, default=50, help="Nodes in the simulated fleet (cached snapshots)")
+    parser.add_argument("--iterations", type=int, default=50, help="Requests per route and mode")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--max-seconds", type=float, default=10.0, help="Time limit per route and mode")
+    parser.add_argument("--concurrency", type=int, default=4, help="Client threads against the real server")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tree-dir", help="Keep the synthetic file tree here and reuse it between runs")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="Exit with status 1 if a route regressed against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown as a fraction (0.2 = 20%%)")
+    parser.add_argument("--json", help="Also write the full results to this file")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args)
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else None
+    print_report(report, baseline)
+    if args.json: Path(args.json).write_text(json.dumps(report, indent=2))
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(report, indent=2))
+        print(f"Baseline saved to {baseline_path}")
+    if args.compare:
+        if baseline is None:
+            print(f"No baseline at {baseline_path}; run with --save-baseline first.", file=sys.stderr)
+            return 2
+        if baseline.get("scenario") != report["scenario"]:
+            print("Warning: the baseline was recorded with a different scenario; results may not be comparable.", file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance)
+        for route, metric, before, after in regressions:
+            print(f"REGRESSION {route} {metric}: {before:.2f} ms -> {after:.2f} ms")
+        if regressions: return 1
+        print("No regressions against the baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
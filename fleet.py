@@ -0,0 +1,153 @@
+# fleet.py
+# Fleet mode: polls other RaspControll instances and keeps the latest snapshot of each one
+#
+# Nodes file format, one node per line ('#' starts a comment):
+#
+#   garage      http://192.168.1.20:5000
+#   greenhouse  http://greenhouse.local:5000
+#   http://192.168.1.31:5000                 # name defaults to the host
+
+# Standard Library Imports
+import json
+import time
+import threading
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, wait
+
+STALE_AFTER_INTERVALS = 3 # A node's last good snapshot is "stale" once it is this many intervals old
+
+def load_nodes(path) -> tuple:
+    # Returns (nodes, errors); a missing file means fleet mode is off.
+    nodes, errors, names = [], [], set()
+    try: lines = open(path, encoding='utf-8').read().splitlines()
+    except FileNotFoundError: return nodes, errors
+    for number, line in enumerate(lines, 1):
+        parts = line.split('#', 1)[0].split()
+        if not parts: continue
+        name, url = (parts[0], parts[1]) if len(parts) == 2 else (None, parts[0])
+        split = urlsplit(url)
+        if len(parts) > 2 or split.scheme not in ('http', 'https') or not split.hostname:
+            errors.append(f"{path}:{number}: expected '[name] http://host:port', got '{line.strip()}'.")
+            continue
+        name = name or split.hostname
+        if name in names:
+            errors.append(f"{path}:{number}: duplicate node name '{name}'.")
+            continue
+        names.add(name)
+        nodes.append({"name": name, "url": url.rstrip('/')})
+    return nodes, errors
+
+class FleetAggregator:
+    # A background thread polls every node each `interval` seconds on a fixed-size thread pool, so
+    # at most max_workers requests are in flight however large the fleet is. Pages and the API only
+    # read the cached snapshots and never wait for the network, and the polling rate does not depend
+    # on how many people are viewing the fleet.
+    # Each node keeps one persistent HTTP/1.1 connection that is reused across polls (keep-alive),
+    # so a poll costs no TCP handshake. Every socket operation is limited by `timeout`. A node whose
+    # previous poll is still running is skipped rather than polled twice.
+    def __init__(self, nodes, interval: float = 10.0, timeout: float = 3.0, max_workers: int = 8):
+        self.nodes = list(nodes)
+        self.interval = interval
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._connections = {} # node name -> http.client connection, reused between polls
+        self._in_flight = set()
+        self._snapshots = {node["name"]: {"name": node["name"], "url": node["url"], "status": "pending", "error": None,
+                                          "last_poll": None, "last_ok": None, "latency_ms": None, "stats": None,
+                                          "alerts_firing": []} for node in self.nodes}
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None or not self.nodes: return
+            self._thread = threading.Thread(target=self._run, name='fleet-poller', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread: self._thread.join()
+        if self._executor: self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections.values(): conn.close()
+            self._connections.clear()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try: self.poll_all()
+            except Exception as e: print(f"Fleet poll failed: {e}")
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def poll_all(self) -> float:
+        # Polls every node once (concurrently) and returns how long the round took in seconds
+        started = time.monotonic()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(self.nodes))),
+                                                    thread_name_prefix='fleet-poll')
+            due = [node for node in self.nodes if node["name"] not in self._in_flight]
+            self._in_flight.update(node["name"] for node in due)
+        futures = [self._executor.submit(self._poll_node, node) for node in due]
+        # Two requests per node, each bounded by the socket timeout; don't wait longer than that.
+        wait(futures, timeout=2 * self.timeout + 1)
+        return time.monotonic() - started
+
+    def _connection(self, node) -> http.client.HTTPConnection:
+        conn = self._connections.get(node["name"])
+        if conn is None:
+            split = urlsplit(node["url"])
+            conn_class = http.client.HTTPSConnection if split.scheme == 'https' else http.client.HTTPConnection
+            conn = self._connections[node["name"]] = conn_class(split.hostname, split.port, timeout=self.timeout)
+        return conn
+
+    def _get_json(self, node, path: str):
+        prefix = urlsplit(node["url"]).path
+        for attempt in (1, 2):
+            conn = self._connection(node)
+            reused = conn.sock is not None
+            try:
+                conn.request('GET', prefix + path, headers={'Accept': 'application/json'})
+                response = conn.getresponse()
+                body = response.read() # Always read the whole body so the connection can be reused
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if reused and attempt == 1: continue # The node closed the idle connection; reconnect once
+                raise
+            except Exception:
+                conn.close()
+                raise
+            if response.status != 200: raise RuntimeError(f"{path} returned HTTP {response.status}")
+            return json.loads(body)
+
+    def _poll_node(self, node):
+        started = time.monotonic()
+        try:
+            stats = self._get_json(node, '/api/system/stats')
+            alerts = self._get_json(node, '/api/alerts')
+            firing = [rule["rule"] for rule in alerts.get("rules", []) if rule.get("state") == "firing"]
+            update = {"status": "ok", "error": None, "last_ok": time.time(), "stats": stats, "alerts_firing": firing}
+        except Exception as e:
+            update = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+        update.update(last_poll=time.time(), latency_ms=round((time.monotonic() - started) * 1000, 1))
+        with self._lock:
+            self._snapshots[node["name"]].update(update)
+            self._in_flight.discard(node["name"])
+
+    def snapshot(self) -> list:
+        now = time.time()
+        with self._lock:
+            nodes = [dict(s) for s in self._snapshots.values()]
+        for node in nodes:
+            node["stale"] = node["last_ok"] is None or now - node["last_ok"] > STALE_AFTER_INTERVALS * self.interval
+        return nodes
+
+    def summary(self, nodes: list = None) -> dict:
+        nodes = self.snapshot() if nodes is None else nodes
+        reachable = [n for n in nodes if n["status"] == "ok"]
+        return {"nodes": len(nodes), "reachable": len(reachable), "unreachable": len(nodes) - len(reachable),
+                "alerts_firing": sum(len(n["alerts_firing"]) for n in reachable),
+                "throttled": sum(1 for n in reachable if ((n["stats"] or {}).get("throttling") or {}).get("now"))}
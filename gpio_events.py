@@ -0,0 +1,64 @@
+# gpio_events.py
+# In-process event broker for GPIO pin changes (edge callbacks, toggles, batch writes)
+
+# Standard Library Imports
+import json
+import time
+import threading
+from collections import deque
+
+class EventBroker:
+    # Events get a monotonically increasing sequence number and are kept in a bounded history.
+    # Publishers (e.g. RPi.GPIO edge callbacks, which run on RPi.GPIO's own thread) never block on
+    # slow clients: subscribers remember the last sequence number they saw and wait on a Condition
+    # for anything newer. A client that falls further behind than the history simply misses events.
+    # Sequence numbers restart at 1 with the process, so a client that reconnects after a restart
+    # with an id newer than anything published here gets the whole history instead of waiting forever.
+    def __init__(self, history: int = 1000):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._seq = 0
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def publish(self, event: dict) -> dict:
+        with self._cond:
+            self._seq += 1
+            event = dict(event, seq=self._seq, time=time.time())
+            self._events.append(event)
+            self._cond.notify_all()
+        return event
+
+    def _resume_from(self, seq: int) -> int:
+        # Called with self._cond held. An id from before a restart is newer than the last one published.
+        return 0 if seq > self._seq else seq
+
+    def since(self, seq: int) -> list:
+        with self._cond:
+            seq = self._resume_from(seq)
+            if not self._events or self._events[-1]['seq'] <= seq: return []
+            return [e for e in self._events if e['seq'] > seq]
+
+    def wait(self, seq: int, timeout: float = 15.0) -> list:
+        # Blocks until there are events newer than `seq` or `timeout` expires (then returns []).
+        with self._cond:
+            seq = self._resume_from(seq)
+            self._cond.wait_for(lambda: self._seq > seq, timeout=timeout)
+        return self.since(seq)
+
+    def stream(self, seq: int = 0, keepalive: float = 15.0):
+        # Generator of Server-Sent Events text, starting after `seq`. Sends a comment line as a
+        # keepalive so proxies don't close idle connections and dead clients are noticed.
+        # The first line goes out immediately: WSGI servers only send the response headers with the
+        # first chunk, so without it clients wouldn't see the stream open until the first event.
+        yield "retry: 3000\n\n"
+        while True:
+            events = self.wait(seq, timeout=keepalive)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                seq = event['seq']
+                yield f"id: {seq}\nevent: gpio\ndata: {json.dumps(event)}\n\n"
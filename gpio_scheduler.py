@@ -0,0 +1,280 @@
+# gpio_scheduler.py
+# Timed GPIO programs (pulses, blinking, PWM) executed by a dedicated scheduler thread
+
+# Standard Library Imports
+import time
+import heapq
+import itertools
+import threading
+from collections import deque, OrderedDict
+
+MIN_STEP_MS = 1 # Shorter waits can't be honoured reliably from Python on a Pi
+MAX_PROGRAM_STEPS = 10000
+MAX_PROGRAM_SECONDS = 3600
+
+# A program is a JSON object {"steps": [...], "repeat": N}. Each step is one of:
+#   {"pin": 17, "state": "ON"}                          set a pin
+#   {"wait_ms": 200}                                     wait
+#   {"pulse": 17, "ms": 200}                             ON, wait, OFF
+#   {"blink": 17, "hz": 2, "count": 10, "duty": 0.5}     `count` pulses at `hz`
+#   {"pwm": 18, "hz": 100, "duty": 25, "ms": 5000}       PWM for `ms` (duty in %), then stop
+# It is compiled into a timeline of (offset_seconds, action) measured from the program start, so
+# each action is scheduled against the monotonic clock and timing errors never accumulate.
+
+def _parse_state(value):
+    if isinstance(value, bool): return value
+    if isinstance(value, int) and value in (0, 1): return bool(value)
+    if isinstance(value, str) and value.upper() in ("ON", "OFF", "HIGH", "LOW"): return value.upper() in ("ON", "HIGH")
+    raise ValueError(f"Invalid pin state {value!r}; use ON/OFF.")
+
+def _number(step, key, minimum=None, maximum=None, default=None):
+    value = step.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)): raise ValueError(f"'{key}' must be a number in step {step}.")
+    if minimum is not None and value < minimum: raise ValueError(f"'{key}' must be at least {minimum} in step {step}.")
+    if maximum is not None and value > maximum: raise ValueError(f"'{key}' must be at most {maximum} in step {step}.")
+    return value
+
+def compile_program(program: dict, allowed_pins=None, max_steps: int = MAX_PROGRAM_STEPS) -> list:
+    # Returns a list of (offset_seconds, action) tuples; raises ValueError for invalid programs.
+    # The size limits are checked before anything is expanded, so an oversized program is rejected
+    # in constant time rather than after building (or running out of memory on) its timeline.
+    if not isinstance(program, dict) or not isinstance(program.get("steps"), list) or not program["steps"]:
+        raise ValueError("A program needs a non-empty 'steps' list.")
+    repeat = int(_number(program, "repeat", minimum=1, default=1))
+    too_many = f"Program is too long (more than {max_steps} actions)."
+    too_long = f"Program is too long (more than {MAX_PROGRAM_SECONDS} seconds)."
+
+    def check_pin(pin):
+        if isinstance(pin, bool) or not isinstance(pin, int): raise ValueError(f"Invalid pin {pin!r}.")
+        if allowed_pins is not None and pin not in allowed_pins: raise ValueError(f"GPIO {pin} is not a controllable output pin.")
+        return pin
+
+    def add(actions, duration):
+        # Appends one step's actions, refusing before the timeline grows past either limit
+        nonlocal t
+        if len(iteration) + len(actions) > max_steps: raise ValueError(too_many)
+        if t + duration > MAX_PROGRAM_SECONDS: raise ValueError(too_long)
+        iteration.extend((t + offset, action) for offset, action in actions)
+        t += duration
+
+    # Compile the steps once, then check repeat x (actions, duration) before copying them.
+    iteration, t = [], 0.0
+    for step in program["steps"]:
+        if not isinstance(step, dict): raise ValueError(f"Invalid step {step!r}.")
+        if "wait_ms" in step:
+            add([], _number(step, "wait_ms", minimum=MIN_STEP_MS) / 1000)
+        elif "pulse" in step:
+            pin = check_pin(step["pulse"]); width = _number(step, "ms", minimum=MIN_STEP_MS) / 1000
+            add([(0.0, ("set", pin, True)), (width, ("set", pin, False))], width)
+        elif "blink" in step:
+            pin = check_pin(step["blink"])
+            period = 1 / _number(step, "hz", minimum=0.001, maximum=1000 / (2 * MIN_STEP_MS))
+            on_time = period * _number(step, "duty", minimum=0.01, maximum=0.99, default=0.5)
+            if on_time < MIN_STEP_MS / 1000 or period - on_time < MIN_STEP_MS / 1000:
+                raise ValueError(f"Blink on/off times must be at least {MIN_STEP_MS} ms; use a 'pwm' step for faster signals.")
+            count = int(_number(step, "count", minimum=1, default=1))
+            if len(iteration) + 2 * count > max_steps: raise ValueError(too_many)
+            if t + count * period > MAX_PROGRAM_SECONDS: raise ValueError(too_long)
+            for _ in range(count):
+                add([(0.0, ("set", pin, True)), (on_time, ("set", pin, False))], period)
+        elif "pwm" in step:
+            pin = check_pin(step["pwm"])
+            hz = _number(step, "hz", minimum=0.1, maximum=50000); duty = _number(step, "duty", minimum=0, maximum=100)
+            duration = _number(step, "ms", minimum=MIN_STEP_MS) / 1000
+            add([(0.0, ("pwm", pin, hz, duty)), (duration, ("pwm_stop", pin))], duration)
+        elif "pin" in step:
+            add([(0.0, ("set", check_pin(step["pin"]), _parse_state(step.get("state"))))], 0.0)
+        else:
+            raise ValueError(f"Unknown step {step!r}.")
+    if repeat * len(iteration) > max_steps: raise ValueError(too_many)
+    if repeat * t > MAX_PROGRAM_SECONDS: raise ValueError(too_long)
+    timeline = [(n * t + offset, action) for n in range(repeat) for offset, action in iteration]
+    timeline.sort(key=lambda entry: entry[0]) # Stable: simultaneous actions keep program order
+    return timeline
+
+class SimulatedPinBackend:
+    # Records every write with its monotonic timestamp; used in simulation mode and in tests.
+    def __init__(self, on_write=None, history: int = 10000):
+        self.on_write = on_write
+        self.levels = {}
+        self.pwm = {}
+        self.log = deque(maxlen=history) # (monotonic_time, pin, action, value)
+
+    def write(self, pin, high):
+        self.levels[pin] = high
+        self.log.append((time.monotonic(), pin, "set", high))
+        if self.on_write: self.on_write(pin, high)
+
+    def start_pwm(self, pin, hz, duty):
+        self.pwm[pin] = (hz, duty)
+        self.log.append((time.monotonic(), pin, "pwm", (hz, duty)))
+
+    def stop_pwm(self, pin):
+        self.pwm.pop(pin, None)
+        self.log.append((time.monotonic(), pin, "pwm_stop", None))
+
+class RPiGPIOBackend:
+    # Writes through RPi.GPIO. Its PWM runs in a C thread inside the library, which is much steadier
+    # than toggling from Python; for jitter-free hardware PWM on GPIO 12/13/18/19 use pigpio instead.
+    def __init__(self, gpio, lock, on_write=None):
+        self.gpio = gpio
+        self.lock = lock # Shared with request handlers that also write pins
+        self.on_write = on_write
+        self._pwm = {}
+
+    def write(self, pin, high):
+        with self.lock: self.gpio.output(pin, self.gpio.HIGH if high else self.gpio.LOW)
+        if self.on_write: self.on_write(pin, high)
+
+    def start_pwm(self, pin, hz, duty):
+        with self.lock:
+            pwm = self._pwm.get(pin)
+            if pwm is None:
+                pwm = self._pwm[pin] = self.gpio.PWM(pin, hz)
+                pwm.start(duty)
+            else:
+                pwm.ChangeFrequency(hz); pwm.ChangeDutyCycle(duty)
+
+    def stop_pwm(self, pin):
+        with self.lock:
+            pwm = self._pwm.pop(pin, None)
+            if pwm: pwm.stop()
+
+class PinScheduler:
+    # One thread executes all queued actions in due-time order. It sleeps on a Condition until
+    # shortly before the next action is due and then spins for the last `spin_s` seconds, trading
+    # a little CPU for sub-millisecond accuracy. The difference between due and actual execution
+    # time of every action is kept for jitter statistics.
+    def __init__(self, backend, spin_s: float = 0.0005, jitter_samples: int = 2000, max_jobs: int = 100):
+        self.backend = backend
+        self.spin_s = spin_s
+        self.max_jobs = max_jobs
+        self._cond = threading.Condition()
+        self._queue = [] # heap of (due_monotonic, seq, job_id, action)
+        self._seq = itertools.count()
+        self._job_ids = itertools.count(1)
+        self._jobs = OrderedDict()
+        self._jitter = deque(maxlen=jitter_samples)
+        self._executed = 0
+        self._thread = None
+
+    def _ensure_thread(self):
+        # Called with self._cond held. The thread only starts once a program is submitted.
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='gpio-scheduler', daemon=True)
+            self._thread.start()
+
+    def submit(self, timeline: list, start_delay: float = 0.005) -> dict:
+        with self._cond:
+            job_id = next(self._job_ids)
+            start = time.monotonic() + start_delay
+            job = {"id": job_id, "state": "pending", "steps_total": len(timeline), "steps_done": 0,
+                   "duration_ms": round(timeline[-1][0] * 1000, 3) if timeline else 0, "error": None,
+                   "pwm_pins": set(), "touched_pins": set()}
+            self._jobs[job_id] = job
+            while len(self._jobs) > self.max_jobs: # Forget the oldest finished jobs
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if oldest["state"] in ("pending", "running"): break
+                del self._jobs[oldest_id]
+            for offset, action in timeline:
+                heapq.heappush(self._queue, (start + offset, next(self._seq), job_id, action))
+            self._ensure_thread()
+            self._cond.notify()
+            return self._public(job)
+
+    def cancel(self, job_id: int) -> dict | None:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None: return None
+            if job["state"] in ("pending", "running"):
+                job["state"] = "cancelled" # Remaining actions are skipped when popped
+                pins, pwm_pins = set(job["touched_pins"]), set(job["pwm_pins"])
+            else: pins, pwm_pins = set(), set()
+        self._reset_pins(job_id, pins, pwm_pins)
+        return self.status(job_id)
+
+    def _reset_pins(self, job_id, pins, pwm_pins):
+        # A cancelled or failed job must not leave an output stuck mid-program (e.g. HIGH halfway
+        # through a blink): stop its PWM and drive every pin it touched LOW.
+        for pin in pwm_pins:
+            try: self.backend.stop_pwm(pin)
+            except Exception as e: print(f"GPIO scheduler: job {job_id} could not stop PWM on GPIO {pin}: {e}")
+        for pin in sorted(pins):
+            try: self.backend.write(pin, False)
+            except Exception as e: print(f"GPIO scheduler: job {job_id} could not reset GPIO {pin}: {e}")
+
+    def status(self, job_id: int) -> dict | None:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return self._public(job) if job else None
+
+    @staticmethod
+    def _public(job):
+        return {k: v for k, v in job.items() if k not in ("pwm_pins", "touched_pins")}
+
+    def _execute(self, action):
+        kind, pin = action[0], action[1]
+        if kind == "set": self.backend.write(pin, action[2])
+        elif kind == "pwm": self.backend.start_pwm(pin, action[2], action[3])
+        elif kind == "pwm_stop": self.backend.stop_pwm(pin)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._queue:
+                    self._cond.wait()
+                    continue
+                due, _, job_id, action = self._queue[0]
+                remaining = due - time.monotonic()
+                if remaining > self.spin_s:
+                    self._cond.wait(remaining - self.spin_s) # Woken early if an earlier action is submitted
+                    continue
+                heapq.heappop(self._queue)
+                job = self._jobs.get(job_id)
+                if job is None or job["state"] not in ("pending", "running"): continue
+                job["state"] = "running"
+            while time.monotonic() < due: pass
+            executed_at = time.monotonic()
+            try:
+                self._execute(action)
+                error = None
+            except Exception as e:
+                error = str(e)
+                print(f"GPIO scheduler: job {job_id} failed on {action}: {e}")
+            reset = None
+            with self._cond:
+                self._jitter.append(executed_at - due)
+                self._executed += 1
+                job["touched_pins"].add(action[1])
+                if action[0] == "pwm": job["pwm_pins"].add(action[1])
+                elif action[0] == "pwm_stop": job["pwm_pins"].discard(action[1])
+                if error:
+                    job["state"], job["error"] = "failed", error
+                    reset = (set(job["touched_pins"]), set(job["pwm_pins"]))
+                elif job["state"] == "cancelled": # Cancelled while this action ran: undo it too
+                    reset = ({action[1]}, {action[1]} if action[0] == "pwm" else set())
+                else:
+                    job["steps_done"] += 1
+                    if job["steps_done"] == job["steps_total"] and job["state"] == "running": job["state"] = "done"
+            if reset: self._reset_pins(job_id, *reset)
+
+    def wait(self, job_id: int, timeout: float = None) -> dict | None:
+        # Blocks until the job is no longer pending/running (used by tests and scripts).
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            status = self.status(job_id)
+            if status is None or status["state"] not in ("pending", "running"): return status
+            if deadline is not None and time.monotonic() >= deadline: return status
+            time.sleep(0.005)
+
+    def stats(self) -> dict:
+        with self._cond:
+            samples = sorted(self._jitter)
+            executed, queued = self._executed, len(self._queue)
+            active = sum(1 for job in self._jobs.values() if job["state"] in ("pending", "running"))
+        result = {"executed_actions": executed, "queued_actions": queued, "active_jobs": active, "jitter_samples": len(samples)}
+        if samples:
+            pct = lambda q: samples[min(int(q * len(samples)), len(samples) - 1)] * 1e6
+            result.update({"jitter_mean_us": round(sum(samples) / len(samples) * 1e6, 1), "jitter_p50_us": round(pct(0.5), 1),
+                           "jitter_p99_us": round(pct(0.99), 1), "jitter_max_us": round(samples[-1] * 1e6, 1)})
+        return result
@@ -0,0 +1,133 @@
+# http_cache.py
+# HTTP caching and compression: content-hash fingerprinted static URLs with long-lived cache headers,
+# precompressed static files, gzip/brotli compression of rendered responses and ETag/304 revalidation
+
+# Standard Library Imports
+import gzip
+import hashlib
+import mimetypes
+import threading
+from pathlib import Path
+
+# Third-party Library Imports
+from flask import Response, send_file
+from werkzeug.security import safe_join
+
+# Brotli (pip install brotli) compresses text ~15-20% smaller than gzip; without it responses use gzip.
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+COMPRESSIBLE_TYPES = {'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+                      'application/json', 'image/svg+xml'}
+MIN_COMPRESS_SIZE = 512 # Below this the headers cost more than compression saves
+# Rendered responses are compressed on every request, so use fast levels; static files are
+# compressed once per version, so use the best.
+DYNAMIC_LEVELS = {'br': 4, 'gzip': 6}
+STATIC_LEVELS = {'br': 11, 'gzip': 9}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable' # One year: the URL changes when the file does
+MAX_CACHED_ASSET_SIZE = 1024 * 1024 # Larger static files are streamed from disk, uncompressed
+
+def choose_encoding(accept_encodings) -> str | None:
+    # accept_encodings is werkzeug's parsed Accept-Encoding header (request.accept_encodings)
+    if BROTLI_AVAILABLE and accept_encodings.quality('br') > 0: return 'br'
+    if accept_encodings.quality('gzip') > 0: return 'gzip'
+    return None
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == 'br': return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0) # mtime=0: identical input, identical output
+
+def compress_response(response, accept_encodings, levels=DYNAMIC_LEVELS):
+    # Compresses a buffered response in place. Streams (event streams, file downloads) are left alone.
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or response.mimetype not in COMPRESSIBLE_TYPES or 'Content-Encoding' in response.headers
+            or 'no-transform' in response.headers.get('Cache-Control', '')):
+        return response
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE: return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None: return response
+    compressed = compress(data, encoding, levels[encoding])
+    if len(compressed) < len(data):
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def revalidate_response(response, request):
+    # Rendered pages and API responses: a weak ETag over the uncompressed body (so every encoding
+    # shares it) and "no-cache", so browsers revalidate and get an empty 304 when nothing changed.
+    # Views that set their own Cache-Control or ETag are left alone.
+    if (request.method in ('GET', 'HEAD') and response.status_code == 200 and not response.is_streamed
+            and not response.direct_passthrough and response.mimetype in ('text/html', 'application/json')
+            and 'ETag' not in response.headers and 'Cache-Control' not in response.headers):
+        response.add_etag(weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.make_conditional(request)
+    return response
+
+class StaticAssets:
+    # Content hashes and compressed variants of the files under `root`, computed once per file
+    # version (keyed by mtime and size). After that, fingerprinting a URL or serving a file costs a
+    # stat() and a dictionary lookup, and a compressed file is never compressed again.
+    def __init__(self, root):
+        self.root = str(root)
+        self._lock = threading.Lock()
+        self._entries = {} # filename -> {"stat": (mtime_ns, size), "hash", "data", "variants": {encoding: bytes}}
+
+    def _entry(self, filename: str) -> dict | None:
+        path = safe_join(self.root, filename)
+        if path is None: return None
+        try: st = Path(path).stat()
+        except OSError: return None
+        if not Path(path).is_file(): return None
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry and entry["stat"] == key: return entry
+        data = Path(path).read_bytes() if st.st_size <= MAX_CACHED_ASSET_SIZE else None
+        digest = hashlib.sha256(data).hexdigest() if data is not None else f"{key[0]:x}-{key[1]:x}"
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        entry = {"stat": key, "path": path, "hash": digest[:16], "data": data, "mimetype": mimetype, "variants": {}}
+        with self._lock: self._entries[filename] = entry
+        return entry
+
+    def fingerprint(self, filename: str) -> str | None:
+        entry = self._entry(filename)
+        return entry["hash"] if entry else None
+
+    def _variant(self, entry: dict, encoding: str) -> bytes | None:
+        with self._lock:
+            if encoding in entry["variants"]: return entry["variants"][encoding]
+        compressed = compress(entry["data"], encoding, STATIC_LEVELS[encoding])
+        variant = compressed if len(compressed) < len(entry["data"]) else None # None: not worth it
+        with self._lock: entry["variants"][encoding] = variant
+        return variant
+
+    def send(self, filename: str, request, version: str = None, immutable: bool = True, compression: bool = True):
+        # Returns a response for `filename`, or None if it doesn't exist. A request whose `version`
+        # matches the current fingerprint may be cached for a year; anything else is revalidated.
+        # With compression=False the file is always sent as is.
+        entry = self._entry(filename)
+        if entry is None: return None
+        cache_control = IMMUTABLE_CACHE_CONTROL if immutable and version == entry["hash"] else 'no-cache'
+        if entry["data"] is None:
+            response = send_file(entry["path"], mimetype=entry["mimetype"], conditional=True, etag=entry["hash"])
+            response.headers['Cache-Control'] = cache_control
+            return response
+        body, encoding = entry["data"], None
+        if compression and entry["mimetype"] in COMPRESSIBLE_TYPES and len(body) >= MIN_COMPRESS_SIZE:
+            encoding = choose_encoding(request.accept_encodings)
+            variant = self._variant(entry, encoding) if encoding else None
+            if variant is None: encoding = None
+            else: body = variant
+        response = Response(body, mimetype=entry["mimetype"])
+        response.set_etag(f"{entry['hash']}-{encoding}" if encoding else entry["hash"]) # One ETag per representation
+        response.headers['Cache-Control'] = cache_control
+        response.last_modified = entry["stat"][0] / 1e9
+        if encoding: response.headers['Content-Encoding'] = encoding
+        if compression and entry["mimetype"] in COMPRESSIBLE_TYPES: response.vary.add('Accept-Encoding')
+        return response.make_conditional(request)
@@ -0,0 +1,145 @@
+# metrics.py
+# Low-overhead latency histograms and counters for RaspControll, exported in Prometheus text format
+
+# Standard Library Imports
+import os
+import json
+import time
+import bisect
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+# Bucket upper bounds in seconds. Covers fast page renders (ms) up to slow sensor retries and shell commands.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra: parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class MetricsRegistry:
+    # Each observation is one bisect into a short bucket list plus a few integer increments under a
+    # single lock, so it is cheap enough to leave on in production. Label values must come from a
+    # small fixed set (endpoint names, not URLs) to keep the number of series bounded.
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {} # name -> {labels_tuple: [bucket_counts..., sum, count]}
+        self._counters = {} # name -> {labels_tuple: value}
+        self._help = {}
+        self._share_dir = None
+        self._share_interval = 5.0
+        self._share_stop = threading.Event()
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.setdefault(name, {}).get(key)
+            if series is None:
+                series = self._histograms[name][key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1 # Last slot is the +Inf bucket
+            series[-2] += value
+            series[-1] += 1
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counters = self._counters.setdefault(name, {})
+            counters[key] = counters.get(key, 0) + amount
+
+    @contextmanager
+    def timed(self, name: str, **labels):
+        start = time.perf_counter()
+        try: yield
+        finally: self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"histograms": {n: {k: list(v) for k, v in s.items()} for n, s in self._histograms.items()},
+                    "counters": {n: dict(s) for n, s in self._counters.items()}}
+
+    def share(self, directory, interval: float = 5.0):
+        # Multi-process mode (several gunicorn workers behind one port, so a scrape reaches any one of
+        # them): every process writes its snapshot to <directory>/<pid>.json each `interval` seconds
+        # and render() adds up all the files. Files of exited workers are kept, so counters never go
+        # backwards. Other workers' numbers are at most `interval` seconds old.
+        self._share_dir = Path(directory)
+        self._share_dir.mkdir(parents=True, exist_ok=True)
+        self._share_interval = interval
+        self._start_sharing()
+        # Threads don't survive fork(): each forked worker starts its own, with its own empty values.
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._histograms, self._counters = {}, {}
+        self._share_stop = threading.Event()
+        self._start_sharing()
+
+    def _start_sharing(self):
+        def run():
+            while not self._share_stop.wait(self._share_interval):
+                try: self._write_share()
+                except OSError as e: print(f"Metrics: could not write {self._share_dir}: {e}")
+        threading.Thread(target=run, name='metrics-share', daemon=True).start()
+
+    def stop_sharing(self):
+        self._share_stop.set()
+
+    def _write_share(self, snap: dict = None):
+        snap = snap or self.snapshot()
+        data = {kind: {name: [[list(map(list, key)), value] for key, value in series.items()]
+                       for name, series in snap[kind].items()} for kind in ("histograms", "counters")}
+        target = self._share_dir / f"{os.getpid()}.json"
+        tmp = target.with_suffix('.tmp')
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, target) # Atomic: other workers never read a half-written file
+
+    def _merged_snapshot(self) -> dict:
+        snap = self.snapshot()
+        self._write_share(snap)
+        merged = {"histograms": {}, "counters": {}}
+        for path in self._share_dir.glob('*.json'):
+            try: data = json.loads(path.read_text())
+            except (OSError, ValueError): continue # Being replaced right now; its values come next scrape
+            for name, series in data["histograms"].items():
+                for key, values in series:
+                    key = tuple(map(tuple, key))
+                    total = merged["histograms"].setdefault(name, {}).get(key)
+                    merged["histograms"][name][key] = values if total is None else [a + b for a, b in zip(total, values)]
+            for name, series in data["counters"].items():
+                for key, value in series:
+                    key = tuple(map(tuple, key))
+                    counters = merged["counters"].setdefault(name, {})
+                    counters[key] = counters.get(key, 0) + value
+        return merged
+
+    def render(self) -> str:
+        # Prometheus text exposition format (version 0.0.4)
+        snap = self._merged_snapshot() if self._share_dir else self.snapshot()
+        lines = []
+        for name, series in sorted(snap["histograms"].items()):
+            if name in self._help: lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, values in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), values[:-2]):
+                    cumulative += count
+                    le_label = f'le="{bound}"'
+                    lines.append(f"{name}_bucket{_format_labels(key, le_label)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {values[-2]:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {values[-1]}")
+        for name, series in sorted(snap["counters"].items()):
+            if name in self._help: lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
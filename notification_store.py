@@ -0,0 +1,105 @@
+# notification_store.py
+# Bounded, optionally persistent notification store for RaspControll
+
+# Standard Library Imports
+import json
+import time
+import datetime
+import itertools
+import threading
+from collections import deque
+from pathlib import Path
+
+NOTIFICATION_LEVELS = ('info', 'success', 'warning', 'danger') # Match Bootstrap alert/badge classes
+
+class NotificationStore:
+    # Notifications are kept newest-first in a deque with a fixed maxlen, so adding is O(1)
+    # and memory stays flat however long the instance runs: the oldest entries simply drop off.
+    # If `persist_path` is given, every notification is appended to a JSON-lines file and the
+    # most recent `max_items` are reloaded on startup. All access goes through one lock, so request
+    # threads never see the deque change mid-iteration.
+    def __init__(self, max_items: int = 500, persist_path: Path | None = None):
+        self.max_items = max_items
+        self.persist_path = Path(persist_path) if persist_path else None
+        self._lock = threading.Lock()
+        self._items = deque(maxlen=max_items)
+        self._ids = itertools.count(1)
+        self._persisted_lines = 0
+        if self.persist_path: self._load()
+
+    def _load(self):
+        try:
+            with open(self.persist_path, 'r') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            print(f"Notifications: could not read {self.persist_path}: {e}. Starting empty.")
+            return
+        self._persisted_lines = len(lines)
+        for line in lines[-self.max_items:]:
+            try: self._items.appendleft(json.loads(line))
+            except ValueError: pass # Skip a truncated/corrupt line rather than losing the rest
+        if self._items: self._ids = itertools.count(max(n.get('id', 0) for n in self._items) + 1)
+
+    def _append_to_disk(self, notification: dict):
+        try:
+            self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+            if self._persisted_lines >= 2 * self.max_items:
+                self._rewrite_disk() # Compact: the file never holds more than twice what we keep
+            else:
+                with open(self.persist_path, 'a') as f: f.write(json.dumps(notification) + "\n")
+                self._persisted_lines += 1
+        except OSError as e:
+            print(f"Notifications: could not persist to {self.persist_path}: {e}")
+
+    def _rewrite_disk(self):
+        tmp_path = self.persist_path.with_suffix(self.persist_path.suffix + '.tmp')
+        with open(tmp_path, 'w') as f:
+            for notification in reversed(self._items): f.write(json.dumps(notification) + "\n")
+        tmp_path.replace(self.persist_path)
+        self._persisted_lines = len(self._items)
+
+    def add(self, message: str, level: str = 'info', source: str = 'system') -> dict:
+        if level not in NOTIFICATION_LEVELS: level = 'info'
+        now = time.time()
+        notification = {
+            "message": message, "level": level, "source": source,
+            "created": now, "timestamp": datetime.datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with self._lock:
+            notification["id"] = next(self._ids)
+            self._items.appendleft(notification)
+            if self.persist_path: self._append_to_disk(notification)
+        return notification
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            if self.persist_path:
+                try: self._rewrite_disk()
+                except OSError as e: print(f"Notifications: could not clear {self.persist_path}: {e}")
+
+    def query(self, source: str | None = None, level: str | None = None, since: float | None = None,
+              until: float | None = None, page: int = 1, per_page: int = 50) -> tuple[list, int]:
+        # Returns (notifications on the requested page, total matching). Entries are stored in time
+        # order, so the scan skips everything newer than `until` and stops at the first one older than `since`.
+        matches = []
+        with self._lock: items = list(self._items)
+        for notification in items:
+            created = notification.get('created', 0)
+            if until is not None and created > until: continue
+            if since is not None and created < since: break
+            if source and notification.get('source') != source: continue
+            if level and notification.get('level') != level: continue
+            matches.append(notification)
+        page = max(page, 1)
+        start = (page - 1) * per_page
+        return matches[start:start + per_page], len(matches)
+
+    def sources(self) -> list:
+        with self._lock: return sorted({n.get('source', 'system') for n in self._items})
+
+    def __iter__(self):
+        with self._lock: return iter(list(self._items))
+    def __len__(self): return len(self._items)
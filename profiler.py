@@ -0,0 +1,139 @@
+# profiler.py
+# Built-in sampling profiler: samples the Python stacks of every thread for a limited time and
+# aggregates them into collapsed stacks (the input format of flamegraph.pl, speedscope and inferno)
+
+# Standard Library Imports
+import os
+import re
+import sys
+import time
+import threading
+from collections import Counter
+
+# Leaf frames of threads that are blocked waiting for work (idle request/server threads, the GPIO
+# scheduler, event stream clients). They are skipped unless include_idle is set, so the profile
+# shows where busy threads spend their time rather than mostly who is waiting.
+IDLE_LEAVES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"), ("socketserver.py", "serve_forever"),
+    ("queue.py", "get"), ("socket.py", "accept"), ("socket.py", "readinto"),
+}
+
+class SamplingProfiler:
+    # A daemon thread wakes every `interval` seconds and reads sys._current_frames(), a snapshot of
+    # the current frame of every thread. No signals are involved, so it can be started from any
+    # request thread and works the same under Werkzeug, waitress and gunicorn. Only one session runs
+    # at a time, and only for up to max_seconds. Time spent in C code (I/O, sleep, Pillow) is
+    # attributed to the Python function that called it.
+    def __init__(self, max_seconds: float = 300.0, max_depth: int = 64):
+        self.max_seconds = max_seconds
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._labels = {} # code object -> frame label; code objects live as long as their function
+        self._stacks = Counter()
+        self._session = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval: float = 0.01, include_idle: bool = False) -> dict:
+        if not 0 < seconds <= self.max_seconds:
+            raise ValueError(f"seconds must be between 0 and {self.max_seconds:g}.")
+        if not 0.001 <= interval <= 1.0:
+            raise ValueError("The sampling interval must be between 1 and 1000 ms.")
+        with self._lock:
+            if self.running: raise RuntimeError("The profiler is already running.")
+            self._stacks = Counter()
+            self._stop.clear()
+            self._session = {"started": time.time(), "seconds": seconds, "interval_ms": interval * 1000,
+                             "include_idle": include_idle, "samples": 0, "stacks_recorded": 0, "idle_skipped": 0,
+                             "sampling_ms": 0.0, "finished": None}
+            self._thread = threading.Thread(target=self._run, args=(time.monotonic() + seconds, interval, include_idle),
+                                            name='sampling-profiler', daemon=True)
+            self._thread.start()
+        return self.status()
+
+    def stop(self) -> dict:
+        self._stop.set()
+        if self._thread: self._thread.join()
+        return self.status()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            # The function's first line rather than the current line, so samples aggregate per function
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
+
+    def _collapse(self, frame) -> tuple:
+        # Returns (root-to-leaf labels, leaf (file, function)) for one thread's stack
+        labels = []
+        leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        labels.reverse()
+        return labels, leaf
+
+    def _run(self, deadline: float, interval: float, include_idle: bool):
+        me = threading.get_ident()
+        next_tick = time.monotonic()
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            t0 = time.perf_counter()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            frames = sys._current_frames()
+            batch, idle = [], 0
+            for ident, frame in frames.items():
+                if ident == me: continue
+                labels, leaf = self._collapse(frame)
+                if not include_idle and leaf in IDLE_LEAVES:
+                    idle += 1
+                    continue
+                # Thread names like "Thread-12 (process_request_thread)" are numbered per request;
+                # dropping the number merges all request threads into one root.
+                thread_label = re.sub(r"\d+", "N", names.get(ident, "unknown")).replace(";", ":")
+                batch.append(";".join([thread_label] + labels))
+            del frames # Don't keep other threads' frames (and their locals) alive
+            with self._lock:
+                self._stacks.update(batch)
+                self._session["samples"] += 1
+                self._session["stacks_recorded"] += len(batch)
+                self._session["idle_skipped"] += idle
+                self._session["sampling_ms"] += (time.perf_counter() - t0) * 1000
+            next_tick += interval
+            self._stop.wait(max(0.0, next_tick - time.monotonic()))
+        with self._lock:
+            self._session["finished"] = time.time()
+
+    def collapsed(self) -> str:
+        # One "frame;frame;frame count" line per distinct stack, hottest first
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def hot_functions(self, limit: int = 20) -> list:
+        # Per function: samples where it was running ("self") and where it was on the stack ("total")
+        with self._lock:
+            stacks = list(self._stacks.items())
+        own, total = Counter(), Counter()
+        for stack, count in stacks:
+            frames = stack.split(";")[1:] # Drop the thread name
+            if not frames: continue
+            own[frames[-1]] += count
+            for frame in set(frames): total[frame] += count
+        return [{"function": name, "self": count, "total": total[name]} for name, count in own.most_common(limit)]
+
+    def status(self) -> dict:
+        with self._lock:
+            if self._session is None: return {"running": False, "samples": 0, "pid": os.getpid()}
+            session = dict(self._session, pid=os.getpid()) # Each worker process has its own profiler
+        session["running"] = self.running
+        if session["running"]:
+            session["remaining_s"] = round(max(0.0, session["started"] + session["seconds"] - time.time()), 1)
+        session["mean_sample_cost_ms"] = round(session.pop("sampling_ms") / session["samples"], 3) if session["samples"] else 0.0
+        session["hot_functions"] = self.hot_functions()
+        return session
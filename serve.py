@@ -0,0 +1,196 @@
+# serve.py
+# Production entry point for RaspControll: thread-pool or multi-process serving without the debugger.
+#
+#   python3 serve.py                          # one process, 8 threads (waitress if installed, else Werkzeug)
+#   python3 serve.py --threads 16
+#   python3 serve.py --workers 3 --threads 8  # several processes via gunicorn (pip install gunicorn)
+#
+# With several worker processes, only one of them may own the GPIO pins and the camera. The first
+# worker to take an exclusive lock on HARDWARE_LOCK_PATH becomes the owner and also listens on
+# 127.0.0.1:<owner port>; the other workers forward every request for a route that needs the 'gpio',
+# 'camera', 'fleet' or 'alerts' subsystem to it. Shared state (simulated pins/files, notifications) is switched to the
+# SQLite backend so all workers see the same data, and /metrics reports the sum over all workers.
+# Live GPIO event streams are hardware routes too, so every one of them holds a slot in the owner:
+# --max-streams is then effectively a limit for the whole server, not for each worker.
+
+# Standard Library Imports
+import io
+import os
+import sys
+import fcntl
+import argparse
+import threading
+import http.client
+from pathlib import Path
+
+HARDWARE_SUBSYSTEMS = {'gpio', 'camera', 'fleet', 'alerts'} # 'fleet', 'alerts': one per host, not one per worker
+HARDWARE_LOCK_PATH = Path.home() / ".cache" / "RaspControll" / "hardware.lock"
+FORWARDED_HEADER = 'X-RaspControll-Forwarded'
+OWNER_RETRY_AFTER = 5 # Seconds; sent with the 503 when the hardware owner doesn't answer
+# Hop-by-hop headers must not be passed through a proxy (RFC 7230 section 6.1)
+HOP_BY_HOP = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers',
+              'transfer-encoding', 'upgrade', 'content-length', 'host'}
+
+class HardwareOwnership:
+    def __init__(self, lock_path: Path = HARDWARE_LOCK_PATH, port: int = 5001, timeout: float = 60.0, on_claim=None):
+        self.lock_path = Path(lock_path)
+        self.port = port
+        self.on_claim = on_claim # Called once this process becomes the owner
+        self.timeout = timeout # Must exceed the SSE keepalive interval for forwarded streams
+        self.is_owner = False
+        self._lock_file = None
+        self._server = None
+        self._claim_lock = threading.Lock()
+
+    def try_claim(self, app) -> bool:
+        # Takes the ownership lock without blocking; the owner starts the internal listener.
+        with self._claim_lock:
+            if self.is_owner: return True
+            self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+            lock_file = open(self.lock_path, 'a+')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            # The lock is released by the OS when this process exits, so a restarted worker can take over.
+            from werkzeug.serving import make_server
+            try:
+                self._server = make_server('127.0.0.1', self.port, app, threaded=True)
+            except (OSError, SystemExit): # e.g. the owner port is taken; Werkzeug reports that with sys.exit(1)
+                lock_file.close() # Releases the lock, so the next worker to try can still become the owner
+                print(f"Process {os.getpid()} could not listen on 127.0.0.1:{self.port}; not taking hardware ownership.")
+                return False
+            self.port = self._server.server_port # Resolves port 0 to the one actually bound
+            lock_file.seek(0); lock_file.truncate(); lock_file.write(f"{os.getpid()} {self.port}\n"); lock_file.flush()
+            threading.Thread(target=self._server.serve_forever, name='hardware-owner', daemon=True).start()
+            self._lock_file = lock_file
+            self.is_owner = True
+            print(f"Process {os.getpid()} owns the GPIO/camera hardware (internal port {self.port}).")
+            if self.on_claim: self.on_claim()
+            return True
+
+    def release(self):
+        with self._claim_lock:
+            if self._server: self._server.shutdown(); self._server = None
+            if self._lock_file: self._lock_file.close(); self._lock_file = None
+            self.is_owner = False
+
+    def forward(self, environ, start_response):
+        from werkzeug.wrappers import Request
+        request = Request(environ)
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP}
+        headers[FORWARDED_HEADER] = '1'
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=self.timeout)
+        path = request.full_path if request.query_string else request.path
+        body = request.get_data()
+        # Put the body back: if the owner can't be reached, this request may still be served locally.
+        environ['wsgi.input'], environ['CONTENT_LENGTH'] = io.BytesIO(body), str(len(body))
+        conn.request(request.method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        start_response(f"{response.status} {response.reason}",
+                       [(k, v) for k, v in response.getheaders() if k.lower() not in HOP_BY_HOP])
+        def body():
+            try:
+                while True:
+                    chunk = response.read1(65536) # Returns as soon as data arrives, so streams stay live
+                    if not chunk: break
+                    yield chunk
+            finally:
+                conn.close()
+        return body()
+
+class HardwareForwardingMiddleware:
+    # WSGI middleware for non-owner workers: requests for hardware routes go to the owner process.
+    def __init__(self, app, ownership: HardwareOwnership, hardware_subsystems=HARDWARE_SUBSYSTEMS):
+        self.app = app # The Flask app (used for URL matching and as the fallback handler)
+        self.wsgi_app = app.wsgi_app
+        self.ownership = ownership
+        self.hardware_subsystems = set(hardware_subsystems)
+
+    def _needs_hardware(self, environ) -> bool:
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except Exception:
+            return False # 404/405 etc. are handled locally
+        view = self.app.view_functions.get(endpoint)
+        return bool(self.hardware_subsystems.intersection(getattr(view, 'required_subsystems', ())))
+
+    def __call__(self, environ, start_response):
+        if (self.ownership.is_owner or environ.get('HTTP_X_RASPCONTROLL_FORWARDED')
+                or not self._needs_hardware(environ)):
+            return self.wsgi_app(environ, start_response)
+        try:
+            return self.ownership.forward(environ, start_response)
+        except (ConnectionError, OSError) as e: # Also socket timeouts from an owner that is just busy
+            # If the owner went away (e.g. restarted by gunicorn), take over. Otherwise it still holds
+            # the hardware, and serving the route here would open GPIO/camera in a second process.
+            print(f"Hardware owner unreachable ({e}); trying to take ownership.")
+            if self.ownership.try_claim(self.app): return self.wsgi_app(environ, start_response)
+            start_response('503 Service Unavailable', [('Content-Type', 'text/plain; charset=utf-8'),
+                                                       ('Retry-After', str(OWNER_RETRY_AFTER))])
+            return [b"The process that owns the GPIO/camera hardware is not responding. Try again shortly.\n"]
+
+def run_threaded(app, host: str, port: int, threads: int):
+    try:
+        from waitress import serve
+        print(f"Serving with waitress on {host}:{port} ({threads} threads).")
+        serve(app, host=host, port=port, threads=threads)
+    except ImportError:
+        # Werkzeug's threaded server starts a thread per request, so --threads is not a hard cap here.
+        from werkzeug.serving import run_simple
+        print(f"waitress not installed; serving with Werkzeug's threaded server on {host}:{port} (debugger off).")
+        run_simple(host, port, app, threaded=True, use_debugger=False, use_reloader=False)
+
+def run_gunicorn(app, host: str, port: int, workers: int, threads: int, ownership: HardwareOwnership):
+    from gunicorn.app.base import BaseApplication
+
+    class RaspControllGunicorn(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{host}:{port}")
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread') # Threads per worker so slow requests don't block a whole process
+            self.cfg.set('timeout', 120)
+            self.cfg.set('post_fork', lambda server, worker: ownership.try_claim(app)) # Claim after fork, never in the master
+        def load(self):
+            return HardwareForwardingMiddleware(app, ownership)
+
+    print(f"Serving with gunicorn on {host}:{port} ({workers} workers x {threads} threads).")
+    RaspControllGunicorn().run()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run RaspControll in production mode (debugger off).")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8, help="Request threads per process")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes (more than 1 requires gunicorn)")
+    parser.add_argument('--owner-port', type=int, default=5001, help="Internal port of the hardware-owning worker")
+    parser.add_argument('--max-streams', type=int, default=None, help="Concurrent live event streams (default: threads / 2); with --workers, all are served by the hardware owner")
+    args = parser.parse_args(argv)
+
+    # These must be set before app.py is imported, since it reads them at import time.
+    os.environ.setdefault('RASPCONTROLL_MAX_STREAMS', str(args.max_streams or max(1, args.threads // 2)))
+    if args.workers > 1:
+        os.environ.setdefault('RASPCONTROLL_STATE_BACKEND', 'sqlite')
+        # Any worker may answer a scrape of /metrics, so each one shares its metrics through this directory.
+        # Files from a previous run are removed first; Prometheus treats the drop as a counter reset.
+        metrics_dir = Path(os.environ.setdefault('RASPCONTROLL_METRICS_DIR', str(HARDWARE_LOCK_PATH.parent / "metrics")))
+        for stale in metrics_dir.glob('*.json'): stale.unlink(missing_ok=True)
+    import app as app_module
+    app = app_module.app
+
+    if args.workers > 1:
+        # Only the hardware owner evaluates alert rules, so each alert is raised once rather than once per worker.
+        app_module.alert_engine.enabled = False
+        try:
+            run_gunicorn(app, args.host, args.port, args.workers, args.threads,
+                         HardwareOwnership(port=args.owner_port, on_claim=lambda: app_module.subsystems.ensure('alerts')))
+            return
+        except ImportError:
+            print("gunicorn is not installed (pip install gunicorn); falling back to a single process.", file=sys.stderr)
+    app_module.subsystems.ensure('alerts')
+    run_threaded(app, args.host, args.port, args.threads)
+
+if __name__ == '__main__':
+    main()
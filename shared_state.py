@@ -0,0 +1,187 @@
+# shared_state.py
+# Shared mutable state for RaspControll: simulated GPIO pin states, the simulated file list and notifications.
+#
+# MemoryState keeps everything in this process behind a lock; it is safe with a threaded server
+# but every worker process gets its own copy. SQLiteState (and SQLiteNotificationStore) keep the
+# same data in a SQLite database in WAL mode, so several worker processes (e.g. gunicorn -w 4)
+# see and modify one consistent copy.
+
+# Standard Library Imports
+import time
+import sqlite3
+import datetime
+import threading
+from pathlib import Path
+
+from notification_store import NOTIFICATION_LEVELS
+
+def simulated_op_path(entry: dict) -> str:
+    # The path used in File Manager URLs for a simulated entry, e.g. "Folder1/image.jpg"
+    op_path = (entry['path'].lstrip('/') + entry['name']).lstrip('/')
+    return op_path or entry['name']
+
+def _remove_simulated_item(files: list, item_path: str) -> tuple[list, bool]:
+    # Removes the entry at item_path and, if it is a folder, everything inside it.
+    remaining = [f for f in files if simulated_op_path(f) != item_path and not simulated_op_path(f).startswith(item_path + '/')]
+    return remaining, len(remaining) != len(files)
+
+class MemoryState:
+    def __init__(self, pins: dict, files: list):
+        self._lock = threading.RLock()
+        self._pins = dict(pins) # pin_id -> "ON"/"OFF"
+        self._files = [dict(f) for f in files]
+
+    def pin_states(self) -> dict:
+        with self._lock: return dict(self._pins)
+
+    def toggle_pin(self, pin_id: int) -> str | None:
+        with self._lock:
+            if pin_id not in self._pins: return None
+            self._pins[pin_id] = "ON" if self._pins[pin_id] == "OFF" else "OFF"
+            return self._pins[pin_id]
+
+    def set_pins(self, states: dict) -> bool:
+        # All-or-nothing: if any pin is unknown, nothing is changed.
+        if not states: return True
+        with self._lock:
+            if any(pin_id not in self._pins for pin_id in states): return False
+            self._pins.update(states)
+            return True
+
+    def list_files(self) -> list:
+        with self._lock: return [dict(f) for f in self._files]
+
+    def add_file(self, entry: dict):
+        with self._lock: self._files.append(dict(entry))
+
+    def delete_file(self, item_path: str) -> bool:
+        with self._lock:
+            self._files, removed = _remove_simulated_item(self._files, item_path)
+            return removed
+
+class _SQLiteBase:
+    # One connection per thread (sqlite3 connections must not be shared across threads);
+    # WAL lets readers proceed while another process writes.
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._conn())
+
+class _Transaction:
+    # BEGIN IMMEDIATE takes the write lock up front, so read-modify-write sequences are atomic across processes.
+    def __init__(self, conn): self.conn = conn
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+class SQLiteState(_SQLiteBase):
+    def __init__(self, db_path: Path, pins: dict, files: list):
+        super().__init__(db_path)
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS pins (id INTEGER PRIMARY KEY, state TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS files (seq INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, type TEXT, path TEXT, op_path TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            # Seed only once, so a restarting (or second) worker doesn't reset state the others have changed.
+            conn.executemany("INSERT OR IGNORE INTO pins (id, state) VALUES (?, ?)", [(pin_id, str(state)) for pin_id, state in pins.items()])
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'files_seeded'").fetchone() is None:
+                for entry in files: self._insert_file(conn, entry)
+                conn.execute("INSERT INTO meta (key, value) VALUES ('files_seeded', '1')")
+
+    def pin_states(self) -> dict:
+        return {row['id']: row['state'] for row in self._conn().execute("SELECT id, state FROM pins")}
+
+    def toggle_pin(self, pin_id: int) -> str | None:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT state FROM pins WHERE id = ?", (pin_id,)).fetchone()
+            if row is None: return None
+            new_state = "ON" if row['state'] == "OFF" else "OFF"
+            conn.execute("UPDATE pins SET state = ? WHERE id = ?", (new_state, pin_id))
+            return new_state
+
+    def set_pins(self, states: dict) -> bool:
+        if not states: return True
+        with self._transaction() as conn:
+            placeholders = ",".join("?" * len(states))
+            known = conn.execute(f"SELECT COUNT(*) FROM pins WHERE id IN ({placeholders})", list(states)).fetchone()[0]
+            if known != len(states): return False
+            conn.executemany("UPDATE pins SET state = ? WHERE id = ?", [(state, pin_id) for pin_id, state in states.items()])
+            return True
+
+    @staticmethod
+    def _insert_file(conn, entry: dict):
+        conn.execute("INSERT INTO files (name, type, path, op_path) VALUES (?, ?, ?, ?)",
+                     (entry['name'], entry['type'], entry['path'], simulated_op_path(entry)))
+
+    def list_files(self) -> list:
+        return [{"name": r['name'], "type": r['type'], "path": r['path']}
+                for r in self._conn().execute("SELECT name, type, path FROM files ORDER BY seq")]
+
+    def add_file(self, entry: dict):
+        with self._transaction() as conn: self._insert_file(conn, entry)
+
+    def delete_file(self, item_path: str) -> bool:
+        with self._transaction() as conn:
+            cur = conn.execute("DELETE FROM files WHERE op_path = ? OR substr(op_path, 1, ?) = ?",
+                               (item_path, len(item_path) + 1, item_path + '/'))
+            return cur.rowcount > 0
+
+class SQLiteNotificationStore(_SQLiteBase):
+    # Same interface as notification_store.NotificationStore, shared by all worker processes.
+    def __init__(self, db_path: Path, max_items: int = 500):
+        super().__init__(db_path)
+        self.max_items = max_items
+        with self._transaction() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS notifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, message TEXT, level TEXT, source TEXT, created REAL, timestamp TEXT)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS notifications_created ON notifications (created)")
+
+    def add(self, message: str, level: str = 'info', source: str = 'system') -> dict:
+        if level not in NOTIFICATION_LEVELS: level = 'info'
+        now = time.time()
+        notification = {"message": message, "level": level, "source": source, "created": now,
+                        "timestamp": datetime.datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")}
+        with self._transaction() as conn:
+            cur = conn.execute("INSERT INTO notifications (message, level, source, created, timestamp) VALUES (?, ?, ?, ?, ?)",
+                               (message, level, source, now, notification['timestamp']))
+            notification['id'] = cur.lastrowid
+            # Keep the table bounded: ids are monotonic, so this is a cheap primary-key range delete.
+            conn.execute("DELETE FROM notifications WHERE id <= ?", (cur.lastrowid - self.max_items,))
+        return notification
+
+    def clear(self):
+        with self._transaction() as conn: conn.execute("DELETE FROM notifications")
+
+    def query(self, source: str | None = None, level: str | None = None, since: float | None = None,
+              until: float | None = None, page: int = 1, per_page: int = 50) -> tuple[list, int]:
+        clauses, params = [], []
+        for column, op, value in (('source', '=', source), ('level', '=', level), ('created', '>=', since), ('created', '<=', until)):
+            if value is None or value == '': continue
+            clauses.append(f"{column} {op} ?"); params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) FROM notifications {where}", params).fetchone()[0]
+        rows = conn.execute(f"SELECT * FROM notifications {where} ORDER BY id DESC LIMIT ? OFFSET ?",
+                            params + [per_page, (max(page, 1) - 1) * per_page]).fetchall()
+        return [dict(r) for r in rows], total
+
+    def sources(self) -> list:
+        return [r[0] for r in self._conn().execute("SELECT DISTINCT source FROM notifications ORDER BY source")]
+
+    def __iter__(self): return iter(self.query(per_page=self.max_items)[0])
+    def __len__(self): return self._conn().execute("SELECT COUNT(*) FROM notifications").fetchone()[0]
@@ -0,0 +1,80 @@
+# subsystems.py
+# Lazy initialisation registry for RaspControll's hardware backends (camera, GPIO, psutil, file manager)
+
+# Standard Library Imports
+import time
+import functools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+class SubsystemRegistry:
+    # Each subsystem registers an init function that runs once, on first use, instead of at import.
+    # Importing app.py therefore touches no hardware: the camera is only opened when someone views it,
+    # and a worker process that never serves GPIO requests never configures GPIO.
+    # Init functions handle their own fallbacks to simulation; an unexpected exception marks the
+    # subsystem as failed (and is reported) without breaking the request that triggered it.
+    def __init__(self):
+        self._lock = threading.RLock() # Re-entrant: one subsystem's init may ensure another
+        self._subsystems = OrderedDict()
+
+    def register(self, name: str, init_fn, description: str = ""):
+        self._subsystems[name] = {"name": name, "description": description, "init": init_fn,
+                                  "state": "pending", "init_ms": None, "initialised_at": None, "error": None}
+
+    def subsystem(self, name: str, description: str = ""):
+        # Decorator form of register()
+        def decorator(init_fn):
+            self.register(name, init_fn, description)
+            return init_fn
+        return decorator
+
+    def ensure(self, *names):
+        for name in names:
+            entry = self._subsystems[name]
+            if entry["state"] != "pending": continue # Fast path once initialised, no locking
+            with self._lock:
+                if entry["state"] != "pending": continue
+                start = time.perf_counter()
+                try:
+                    entry["init"]()
+                    entry["state"] = "ready"
+                except Exception as e:
+                    entry["state"], entry["error"] = "failed", str(e)
+                    print(f"Subsystem '{name}' failed to initialise: {e}")
+                entry["init_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                entry["initialised_at"] = time.time()
+                print(f"Subsystem '{name}' initialised in {entry['init_ms']} ms ({entry['state']}).")
+
+    def ensure_all(self):
+        self.ensure(*self._subsystems)
+
+    @contextmanager
+    def bypassed(self):
+        # Marks every pending subsystem as ready without running its init function, and puts them
+        # back to pending on exit. Used by the benchmark, which replaces the hardware with fakes and
+        # must not open the real GPIO, camera or directories.
+        with self._lock:
+            skipped = [entry for entry in self._subsystems.values() if entry["state"] == "pending"]
+            for entry in skipped: entry["state"] = "ready"
+        try: yield
+        finally:
+            with self._lock:
+                for entry in skipped: entry["state"] = "pending"
+
+    def is_initialised(self, name: str) -> bool:
+        return self._subsystems[name]["state"] != "pending"
+
+    def requires(self, *names):
+        # Route decorator: initialises the named subsystems before the view runs.
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                self.ensure(*names)
+                return view(*args, **kwargs)
+            wrapper.required_subsystems = names # Lets serve.py route hardware requests to the owning process
+            return wrapper
+        return decorator
+
+    def report(self) -> list:
+        return [{k: v for k, v in entry.items() if k != "init"} for entry in self._subsystems.values()]
@@ -0,0 +1,165 @@
+# system_stats.py
+# Background collector for live system rates: per-core CPU, per-interface network throughput,
+# per-disk IOPS/bandwidth, CPU temperature and Raspberry Pi throttling flags
+
+# Standard Library Imports
+import re
+import time
+import shutil
+import threading
+import subprocess
+from pathlib import Path
+
+CPU_TEMPERATURE_PATH = Path("/sys/class/thermal/thermal_zone0/temp")
+THROTTLED_SYSFS_PATH = Path("/sys/devices/platform/soc/soc:firmware/get_throttled")
+IGNORED_DISKS = re.compile(r"^(loop|ram|zram)\d+$") # Virtual block devices
+IGNORED_INTERFACES = {"lo"}
+
+# Bits of the firmware's get_throttled value. The same flag 16 bits higher means "has occurred since boot".
+THROTTLE_FLAGS = {0: "under_voltage", 1: "frequency_capped", 2: "throttled", 3: "soft_temperature_limit"}
+
+def decode_throttled(value: int) -> dict:
+    return {"raw": hex(value),
+            "now": [name for bit, name in THROTTLE_FLAGS.items() if value & (1 << bit)],
+            "since_boot": [name for bit, name in THROTTLE_FLAGS.items() if value & (1 << (bit + 16))]}
+
+def _rate(current, previous, elapsed: float) -> float:
+    # A counter that went backwards was reset (interface re-created, counter wrap): report 0, not a negative rate
+    delta = current - previous
+    return round(delta / elapsed, 1) if delta >= 0 and elapsed > 0 else 0.0
+
+def _cpu_total(times: dict) -> float:
+    return sum(v for k, v in times.items() if k not in ('guest', 'guest_nice'))
+
+class SystemStatsCollector:
+    # Samples cumulative counters every `interval` seconds on a daemon thread and keeps only the
+    # previous raw snapshot: each rate is (current - previous) / elapsed, so a sample costs
+    # O(cores + interfaces + disks) no matter how long the collector has been running, and no
+    # request ever blocks to measure CPU usage. The thread starts on first use (start()).
+    # get_psutil returns the psutil module, or None to produce simulated values.
+    def __init__(self, get_psutil, interval: float = 2.0, disk_path: str = "/"):
+        self.get_psutil = get_psutil
+        self.interval = interval
+        self.disk_path = disk_path
+        self._lock = threading.Lock()
+        self._sample_lock = threading.Lock() # sample() may also be called directly (tests, the first baseline)
+        self._thread = None
+        self._stop = threading.Event()
+        self._previous = None # (monotonic time, raw counters) of the last sample
+        self._latest = None
+        self._listeners = []
+        self._vcgencmd = shutil.which("vcgencmd")
+
+    def start(self):
+        # Takes the baseline sample right away, so rates are available one interval later.
+        with self._lock:
+            if self._thread is not None: return
+            self._thread = threading.Thread(target=self._run, name='system-stats', daemon=True)
+        try: self.sample()
+        except Exception as e: print(f"System stats sample failed: {e}")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread: self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try: self.sample()
+            except Exception as e: print(f"System stats sample failed: {e}")
+
+    def add_listener(self, fn):
+        # fn(stats) is called after every sample, on the sampling thread (e.g. to evaluate alert rules)
+        self._listeners.append(fn)
+
+    def latest(self) -> dict | None:
+        with self._lock: return self._latest
+
+    # --- Raw readings ---
+
+    def _read_counters(self, ps) -> dict:
+        cores = [t._asdict() for t in ps.cpu_times(percpu=True)]
+        net = {name: (c.bytes_recv, c.bytes_sent) for name, c in (ps.net_io_counters(pernic=True) or {}).items()
+               if name not in IGNORED_INTERFACES}
+        disks = {name: (c.read_count, c.write_count, c.read_bytes, c.write_bytes)
+                 for name, c in (ps.disk_io_counters(perdisk=True) or {}).items() if not IGNORED_DISKS.match(name)}
+        return {"cores": cores, "net": net, "disks": disks}
+
+    def read_temperature(self, ps=None) -> float | None:
+        try: return round(int(CPU_TEMPERATURE_PATH.read_text().strip()) / 1000, 1) # millidegrees Celsius
+        except (OSError, ValueError): pass
+        try:
+            for entries in (ps.sensors_temperatures() if ps and hasattr(ps, "sensors_temperatures") else {}).values():
+                if entries: return round(entries[0].current, 1)
+        except Exception: pass
+        return None
+
+    def read_throttled(self) -> dict | None:
+        try: return decode_throttled(int(THROTTLED_SYSFS_PATH.read_text().strip(), 16))
+        except (OSError, ValueError): pass
+        if self._vcgencmd: # Older kernels without the sysfs node
+            try:
+                output = subprocess.check_output([self._vcgencmd, "get_throttled"], text=True, timeout=2)
+                return decode_throttled(int(output.strip().split("=")[1], 16)) # "throttled=0x50000"
+            except (OSError, ValueError, IndexError, subprocess.SubprocessError): pass
+        return None
+
+    # --- Rates ---
+
+    def sample(self) -> dict:
+        with self._sample_lock: stats = self._sample()
+        for listener in self._listeners:
+            try: listener(stats)
+            except Exception as e: print(f"System stats listener failed: {e}")
+        return stats
+
+    def _sample(self) -> dict:
+        ps = self.get_psutil()
+        now = time.monotonic()
+        if ps is None:
+            stats = self._simulated()
+        else:
+            counters = self._read_counters(ps)
+            previous = self._previous
+            self._previous = (now, counters)
+            stats = {"simulated": False, "interval_s": None, "cpu": None, "network": {}, "disks": {}}
+            if previous is not None:
+                elapsed = now - previous[0]
+                stats["interval_s"] = round(elapsed, 3)
+                stats.update(self._rates(previous[1], counters, elapsed))
+            memory = ps.virtual_memory()
+            stats["ram_percent"] = memory.percent
+            stats["disk_percent"] = ps.disk_usage(self.disk_path).percent
+            stats["temperature_c"] = self.read_temperature(ps)
+            stats["throttling"] = self.read_throttled()
+        stats["time"] = time.time()
+        with self._lock: self._latest = stats
+        return stats
+
+    def _rates(self, before: dict, after: dict, elapsed: float) -> dict:
+        per_core = []
+        for old, new in zip(before["cores"], after["cores"]):
+            # On Linux, guest time is already counted in user (and guest_nice in nice), as psutil notes
+            total = _cpu_total(new) - _cpu_total(old)
+            idle = (new["idle"] + new.get("iowait", 0)) - (old["idle"] + old.get("iowait", 0))
+            per_core.append(round(100 * (total - idle) / total, 1) if total > 0 else 0.0)
+        network = {name: {"rx_bytes_per_s": _rate(rx, before["net"][name][0], elapsed),
+                          "tx_bytes_per_s": _rate(tx, before["net"][name][1], elapsed)}
+                   for name, (rx, tx) in after["net"].items() if name in before["net"]}
+        disks = {}
+        for name, (reads, writes, read_bytes, write_bytes) in after["disks"].items():
+            if name not in before["disks"]: continue
+            old = before["disks"][name]
+            disks[name] = {"read_iops": _rate(reads, old[0], elapsed), "write_iops": _rate(writes, old[1], elapsed),
+                           "read_bytes_per_s": _rate(read_bytes, old[2], elapsed), "write_bytes_per_s": _rate(write_bytes, old[3], elapsed)}
+        total_percent = round(sum(per_core) / len(per_core), 1) if per_core else None
+        return {"cpu": {"total_percent": total_percent, "per_core": per_core}, "network": network, "disks": disks}
+
+    def _simulated(self) -> dict:
+        return {"simulated": True, "interval_s": self.interval,
+                "cpu": {"total_percent": 25.0, "per_core": [31.0, 18.5, 27.0, 23.5]},
+                "network": {"eth0": {"rx_bytes_per_s": 48_000.0, "tx_bytes_per_s": 12_500.0},
+                            "wlan0": {"rx_bytes_per_s": 0.0, "tx_bytes_per_s": 0.0}},
+                "disks": {"mmcblk0": {"read_iops": 2.5, "write_iops": 6.0, "read_bytes_per_s": 40_960.0, "write_bytes_per_s": 98_304.0}},
+                "ram_percent": 50.0, "disk_percent": 31.25, "temperature_c": 48.5,
+                "throttling": decode_throttled(0)}
@@ -3,6 +3,19 @@ from unittest.mock import patch, MagicMock, mock_open
 from app import app # Your Flask app
 from pathlib import Path # For mocking Path.home() if needed
 import datetime # For mocking datetime in psutil boot_time
+import tempfile
+import os
+import threading
+import time
+import subprocess
+import sys
+import json
+
+def setUpModule():
+    # Hardware subsystems initialise lazily on first use. Initialise them up front so that a test
+    # patching e.g. app.RPI_GPIO_AVAILABLE isn't overwritten by a first-use initialisation.
+    import app as app_module
+    app_module.subsystems.ensure_all()
 
 @patch('app.subprocess.run') 
 @patch('app.CAMERA_AVAILABLE', False)      
@@ -274,5 +287,994 @@ class RealModeAppTests(unittest.TestCase):
             self.assertIn(b'100 B', response.data) 
             self.assertIn(b'File Manager', response.data)
 
+class ThumbnailTests(unittest.TestCase):
+    def setUp(self):
+        from PIL import Image
+        from thumbnails import ThumbnailCache
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src_dir = Path(self.tmp.name) / "src"; self.src_dir.mkdir()
+        self.photo = self.src_dir / "photo.jpg"
+        Image.new('RGB', (1600, 1200), color=(200, 10, 10)).save(self.photo, format='JPEG')
+        self.cache = ThumbnailCache(Path(self.tmp.name) / "cache", max_bytes=1024**2, size=(160, 160), workers=1)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_thumbnail_generated_and_cached(self):
+        from PIL import Image
+        thumb = self.cache.get(self.photo)
+        with Image.open(thumb) as img:
+            self.assertLessEqual(max(img.size), 160)
+        mtime = thumb.stat().st_mtime_ns
+        self.assertEqual(self.cache.get(self.photo), thumb)
+        self.assertEqual(thumb.stat().st_mtime_ns, mtime) # Served from cache, not re-rendered
+        self.assertEqual(self.cache.stats()["entries"], 1)
+
+    def test_modified_source_gets_new_key(self):
+        from PIL import Image
+        first = self.cache.get(self.photo)
+        Image.new('RGB', (800, 800), color=(0, 0, 255)).save(self.photo, format='JPEG')
+        os.utime(self.photo, ns=(0, self.photo.stat().st_mtime_ns + 10**9))
+        self.assertNotEqual(self.cache.get(self.photo), first)
+
+    def test_cache_evicts_when_over_budget(self):
+        from PIL import Image
+        first = self.cache.get(self.photo)
+        self.cache.max_bytes = first.stat().st_size # Room for exactly one thumbnail
+        other = self.src_dir / "other.png"
+        Image.new('RGB', (640, 480), color=(0, 200, 0)).save(other)
+        second = self.cache.get(other)
+        self.assertTrue(second.exists())
+        self.assertFalse(first.exists())
+        self.assertEqual(self.cache.stats()["entries"], 1)
+
+    def test_thumbnail_larger_than_budget_is_still_served(self):
+        from PIL import Image
+        self.cache.max_bytes = 10 # Smaller than any thumbnail
+        first = self.cache.get(self.photo)
+        self.assertTrue(first.exists())
+        other = self.src_dir / "other.png"
+        Image.new('RGB', (640, 480), color=(0, 200, 0)).save(other)
+        second = self.cache.get(other)
+        self.assertTrue(second.exists()) # Kept although over budget...
+        self.assertFalse(first.exists()) # ...while older entries make room
+        app.config['TESTING'] = True
+        with patch('app.FILE_MANAGER_REAL_MODE', False), patch('app.thumbnail_cache', self.cache):
+            self.assertEqual(app.test_client().get('/file-manager/thumbnail/Folder1/image.jpg').status_code, 200)
+
+    def test_failed_write_leaves_no_temporary_file(self):
+        from PIL import Image
+        def broken_save(img, fp, *args, **kwargs):
+            Path(fp).write_bytes(b"partial")
+            raise OSError("No space left on device")
+        with patch.object(Image.Image, 'save', broken_save):
+            with self.assertRaises(OSError): self.cache.get(self.photo)
+        self.assertEqual(list((Path(self.tmp.name) / "cache").iterdir()), [])
+
+    def test_thumbnail_route_simulated(self):
+        app.config['TESTING'] = True
+        client = app.test_client()
+        with patch('app.FILE_MANAGER_REAL_MODE', False), patch('app.thumbnail_cache', self.cache):
+            response = client.get('/file-manager/thumbnail/Folder1/image.jpg')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'image/jpeg')
+            self.assertEqual(client.get('/file-manager/thumbnail/File1.txt').status_code, 404)
+            listing = client.get('/file-manager/')
+            self.assertIn(b'/file-manager/thumbnail/Folder1/image.jpg', listing.data)
+
+class NotificationStoreTests(unittest.TestCase):
+    def test_store_is_bounded_newest_first(self):
+        from notification_store import NotificationStore
+        store = NotificationStore(max_items=3)
+        for i in range(5): store.add(f"event {i}")
+        self.assertEqual(len(store), 3)
+        self.assertEqual([n['message'] for n in store], ['event 4', 'event 3', 'event 2'])
+
+    def test_query_filters_and_pagination(self):
+        from notification_store import NotificationStore
+        store = NotificationStore(max_items=100)
+        for i in range(10): store.add(f"gpio {i}", source='gpio')
+        store.add("upload", level='success', source='file_manager')
+        items, total = store.query(source='gpio', page=2, per_page=4)
+        self.assertEqual(total, 10)
+        self.assertEqual([n['message'] for n in items], ['gpio 5', 'gpio 4', 'gpio 3', 'gpio 2'])
+        items, total = store.query(level='success')
+        self.assertEqual((total, items[0]['source']), (1, 'file_manager'))
+        store._items[-1]['created'] = 0 # Oldest entry far in the past
+        items, total = store.query(since=1)
+        self.assertEqual(total, 10)
+
+    def test_persistence_reloads_and_compacts(self):
+        from notification_store import NotificationStore
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "notifications.jsonl"
+            store = NotificationStore(max_items=2, persist_path=path)
+            for i in range(6): store.add(f"event {i}")
+            reloaded = NotificationStore(max_items=2, persist_path=path)
+            self.assertEqual([n['message'] for n in reloaded], ['event 5', 'event 4'])
+            self.assertLessEqual(len(path.read_text().splitlines()), 4)
+            self.assertGreater(reloaded.add("next")['id'], 6)
+            reloaded.clear()
+            self.assertEqual(len(NotificationStore(max_items=2, persist_path=path)), 0)
+
+    def test_notifications_api_and_filter(self):
+        import app as app_module
+        app.config['TESTING'] = True
+        client = app.test_client()
+        with patch('app.notification_store', app_module.NotificationStore(max_items=10)):
+            app_module.notify("pin toggled", source="gpio")
+            app_module.notify("disk nearly full", level="danger", source="alerts")
+            data = client.get('/api/notifications?source=gpio').get_json()
+            self.assertEqual(data['total'], 1)
+            self.assertEqual(data['notifications'][0]['message'], 'pin toggled')
+            page = client.get('/notifications?level=danger')
+            self.assertIn(b'disk nearly full', page.data)
+            self.assertNotIn(b'pin toggled', page.data)
+
+    def test_notifications_paging_parameters_are_clamped(self):
+        import app as app_module
+        app.config['TESTING'] = True
+        client = app.test_client()
+        with patch('app.notification_store', app_module.NotificationStore(max_items=10)):
+            app_module.notify("only entry")
+            for query in ('per_page=0', 'per_page=-5', 'page=0', 'page=-3&per_page=-1'):
+                self.assertEqual(client.get(f'/notifications?{query}').status_code, 200, query)
+                data = client.get(f'/api/notifications?{query}').get_json()
+                self.assertEqual((data['page'], data['total']), (1, 1), query)
+                self.assertGreaterEqual(data['per_page'], 1)
+                self.assertEqual(data['notifications'][0]['message'], 'only entry')
+
+class SharedStateTests(unittest.TestCase):
+    PINS = {17: "OFF", 18: "ON"}
+    FILES = [{"name": "File1.txt", "type": "file", "path": "/"}, {"name": "Folder1", "type": "directory", "path": "/"},
+             {"name": "image.jpg", "type": "file", "path": "/Folder1/"}]
+
+    def _hammer_toggles(self, state, threads=8, toggles=50):
+        workers = [threading.Thread(target=lambda: [state.toggle_pin(17) for _ in range(toggles)]) for _ in range(threads)]
+        for w in workers: w.start()
+        for w in workers: w.join()
+
+    def test_memory_state_concurrent_toggles(self):
+        from shared_state import MemoryState
+        state = MemoryState(self.PINS, self.FILES)
+        self._hammer_toggles(state) # An even number of toggles must end where it started
+        self.assertEqual(state.pin_states(), {17: "OFF", 18: "ON"})
+        self.assertIsNone(state.toggle_pin(99))
+
+    def test_delete_folder_removes_contents(self):
+        from shared_state import MemoryState, SQLiteState
+        with tempfile.TemporaryDirectory() as tmp:
+            for state in (MemoryState(self.PINS, self.FILES), SQLiteState(Path(tmp) / "state.db", self.PINS, self.FILES)):
+                self.assertTrue(state.delete_file("Folder1"))
+                self.assertEqual([f['name'] for f in state.list_files()], ["File1.txt"])
+                self.assertFalse(state.delete_file("Folder1"))
+
+    def test_sqlite_state_shared_between_instances(self):
+        from shared_state import SQLiteState
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Path(tmp) / "state.db"
+            worker_a = SQLiteState(db, self.PINS, self.FILES)
+            worker_b = SQLiteState(db, self.PINS, self.FILES) # A second worker must not re-seed
+            self.assertEqual(worker_a.toggle_pin(17), "ON")
+            self.assertEqual(worker_b.pin_states()[17], "ON")
+            worker_b.add_file({"name": "upload.txt", "type": "file", "path": "/"})
+            self.assertEqual(len(worker_a.list_files()), 4)
+            self._hammer_toggles(worker_a, threads=4, toggles=10)
+            self.assertEqual(worker_b.pin_states()[17], "ON")
+
+    def test_sqlite_notification_store_bounded(self):
+        from shared_state import SQLiteNotificationStore
+        with tempfile.TemporaryDirectory() as tmp:
+            store = SQLiteNotificationStore(Path(tmp) / "state.db", max_items=3)
+            for i in range(5): store.add(f"event {i}", source="gpio" if i % 2 else "power")
+            self.assertEqual(len(store), 3)
+            self.assertEqual([n['message'] for n in store], ['event 4', 'event 3', 'event 2'])
+            items, total = store.query(source="gpio")
+            self.assertEqual((total, items[0]['message']), (1, 'event 3'))
+            store.clear()
+            self.assertEqual(len(store), 0)
+
+class GpioBatchAndEventTests(unittest.TestCase):
+    def setUp(self):
+        import app as app_module
+        from shared_state import MemoryState
+        from gpio_events import EventBroker
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.patches = [patch('app.RPI_GPIO_AVAILABLE', False),
+                        patch('app.app_state', MemoryState({17: "OFF", 18: "ON", 27: "OFF", 22: "OFF"}, [])),
+                        patch('app.gpio_events', EventBroker())]
+        for p in self.patches: p.start()
+        self.app_module = app_module
+
+    def tearDown(self):
+        for p in self.patches: p.stop()
+
+    def test_batch_sets_all_pins(self):
+        response = self.client.post('/api/gpio/batch', json={"pins": {"17": "ON", "18": False, "27": 1}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["pins"], {"17": "ON", "18": "OFF", "27": "ON"})
+        self.assertEqual(self.app_module.app_state.pin_states(), {17: "ON", 18: "OFF", 27: "ON", 22: "OFF"})
+        events = self.client.get('/api/gpio/events?since=0').get_json()["events"]
+        self.assertEqual([(e["pin"], e["state"]) for e in events], [(17, "ON"), (18, "OFF"), (27, "ON")])
+
+    def test_batch_is_all_or_nothing(self):
+        for payload in ({"pins": {"17": "ON", "99": "ON"}}, {"pins": {"17": "ON", "18": "maybe"}}, {"pins": {"17": "ON", "22": "ON"}}, {}):
+            self.assertEqual(self.client.post('/api/gpio/batch', json=payload).status_code, 400)
+        self.assertEqual(self.app_module.app_state.pin_states()[17], "OFF")
+        self.assertEqual(self.app_module.gpio_events.last_seq, 0)
+
+    def test_batch_real_mode_writes_once_under_lock(self):
+        mock_GPIO = MagicMock(); mock_GPIO.OUT = 0; mock_GPIO.HIGH = 1; mock_GPIO.LOW = 0
+        pins = {17: {"name": "GPIO 17", "mode": 0, "id": 17}, 18: {"name": "GPIO 18", "mode": 0, "id": 18}}
+        with patch('app.RPI_GPIO_AVAILABLE', True), patch('app.GPIO', mock_GPIO, create=True), patch('app.CONTROLLABLE_PINS', pins):
+            response = self.client.post('/api/gpio/batch', json={"pins": {"17": "ON", "18": "OFF"}})
+        self.assertEqual(response.status_code, 200)
+        mock_GPIO.output.assert_called_once_with([17, 18], [1, 0])
+
+    def test_simulated_input_edge_is_streamed(self):
+        response = self.client.post('/api/gpio/inputs/22/simulate')
+        self.assertEqual(response.get_json()["edge"], "rising")
+        stream = self.client.get('/api/gpio/events/stream?since=0', buffered=False)
+        self.assertEqual(stream.mimetype, 'text/event-stream')
+        chunks = iter(stream.response)
+        self.assertEqual(next(chunks), b'retry: 3000\n\n') # Sent at once so the stream opens without waiting
+        event_chunk = next(chunks)
+        stream.close()
+        self.assertIn(b'event: gpio', event_chunk)
+        self.assertIn(b'"pin": 22', event_chunk)
+        self.assertEqual(self.client.post('/api/gpio/inputs/17/simulate').status_code, 404)
+
+    def test_broker_wakes_waiting_subscriber(self):
+        from gpio_events import EventBroker
+        broker = EventBroker(history=2)
+        threading.Timer(0.05, lambda: broker.publish({"pin": 22})).start()
+        events = broker.wait(0, timeout=5)
+        self.assertEqual([e["seq"] for e in events], [1])
+        self.assertEqual(broker.wait(1, timeout=0.01), [])
+        for i in range(3): broker.publish({"pin": i})
+        self.assertEqual([e["seq"] for e in broker.since(0)], [3, 4]) # Bounded history
+
+    def test_stale_last_event_id_after_restart_replays_history(self):
+        # The browser remembers id 500 from before the restart; this process has only published one event.
+        self.client.post('/api/gpio/inputs/22/simulate')
+        stream = self.client.get('/api/gpio/events/stream', headers={'Last-Event-ID': '500'}, buffered=False)
+        chunks = iter(stream.response)
+        next(chunks)
+        event_chunk = next(chunks)
+        stream.close()
+        self.assertIn(b'id: 1\n', event_chunk)
+        self.assertIn(b'"pin": 22', event_chunk)
+        self.assertEqual([e["seq"] for e in self.app_module.gpio_events.since(500)], [1])
+
+class GpioSchedulerTests(unittest.TestCase):
+    def test_compile_program(self):
+        from gpio_scheduler import compile_program
+        timeline = compile_program({"steps": [{"pulse": 17, "ms": 200}, {"wait_ms": 100}, {"blink": 18, "hz": 2, "count": 2}]})
+        self.assertEqual([(round(t, 6), action) for t, action in timeline], [(0.0, ("set", 17, True)), (0.2, ("set", 17, False)),
+                                    (0.3, ("set", 18, True)), (0.55, ("set", 18, False)),
+                                    (0.8, ("set", 18, True)), (1.05, ("set", 18, False))])
+        for bad in ({"steps": []}, {"steps": [{"pulse": 99, "ms": 5}]}, {"steps": [{"wait_ms": 0}]},
+                    {"steps": [{"blink": 17, "hz": 2000}]}, {"steps": [{"pin": 17, "state": "maybe"}]}):
+            with self.assertRaises(ValueError): compile_program(bad, allowed_pins={17, 18})
+
+    def test_scheduler_runs_program_on_time(self):
+        from gpio_scheduler import PinScheduler, SimulatedPinBackend, compile_program
+        backend = SimulatedPinBackend()
+        scheduler = PinScheduler(backend)
+        job = scheduler.submit(compile_program({"steps": [{"pulse": 17, "ms": 30}], "repeat": 2}))
+        status = scheduler.wait(job["id"], timeout=5)
+        self.assertEqual((status["state"], status["steps_done"]), ("done", 4))
+        times = [t for t, pin, action, value in backend.log]
+        self.assertEqual([value for _, _, _, value in backend.log], [True, False, True, False])
+        self.assertAlmostEqual(times[1] - times[0], 0.03, delta=0.02)
+        stats = scheduler.stats()
+        self.assertEqual(stats["executed_actions"], 4)
+        self.assertIn("jitter_p99_us", stats)
+
+    def test_cancel_skips_remaining_and_stops_pwm(self):
+        from gpio_scheduler import PinScheduler, SimulatedPinBackend, compile_program
+        backend = SimulatedPinBackend()
+        scheduler = PinScheduler(backend)
+        job = scheduler.submit(compile_program({"steps": [{"pwm": 18, "hz": 100, "duty": 25, "ms": 10000}]}))
+        for _ in range(200):
+            if 18 in backend.pwm: break
+            threading.Event().wait(0.005)
+        self.assertEqual(backend.pwm[18], (100, 25))
+        self.assertEqual(scheduler.cancel(job["id"])["state"], "cancelled")
+        self.assertNotIn(18, backend.pwm)
+        self.assertIsNone(scheduler.status(999))
+
+    def test_oversized_programs_are_rejected_before_expansion(self):
+        from gpio_scheduler import compile_program
+        for bad in ({"steps": [{"blink": 17, "hz": 500, "count": 2_000_000}]},
+                    {"steps": [{"blink": 17, "hz": 1, "count": 5000}]}, # 5000 s
+                    {"steps": [{"wait_ms": 1}], "repeat": 10**15},
+                    {"steps": [{"pin": 17, "state": "ON"}], "repeat": 10**15}):
+            start = time.perf_counter()
+            with self.assertRaises(ValueError): compile_program(bad)
+            self.assertLess(time.perf_counter() - start, 0.05)
+        self.assertEqual(len(compile_program({"steps": [{"pulse": 17, "ms": 5}], "repeat": 5000})), 10000)
+
+    def test_cancelled_and_failed_jobs_drive_pins_low(self):
+        from gpio_scheduler import PinScheduler, SimulatedPinBackend, compile_program
+        backend = SimulatedPinBackend()
+        scheduler = PinScheduler(backend)
+        job = scheduler.submit(compile_program({"steps": [{"blink": 17, "hz": 1, "count": 10, "duty": 0.9}]}))
+        for _ in range(200):
+            if backend.levels.get(17): break
+            threading.Event().wait(0.005)
+        self.assertTrue(backend.levels[17]) # HIGH halfway through the blink
+        scheduler.cancel(job["id"])
+        self.assertFalse(backend.levels[17])
+
+        class FailingPwm(SimulatedPinBackend):
+            def start_pwm(self, pin, hz, duty): raise RuntimeError("PWM unavailable")
+        backend = FailingPwm()
+        scheduler = PinScheduler(backend)
+        job = scheduler.submit(compile_program({"steps": [{"pin": 17, "state": "ON"}, {"pwm": 18, "hz": 100, "duty": 50, "ms": 50}]}))
+        status = scheduler.wait(job["id"], timeout=5)
+        self.assertEqual(status["state"], "failed")
+        self.assertEqual((backend.levels[17], backend.levels[18]), (False, False))
+
+    def test_program_api(self):
+        import app as app_module
+        from shared_state import MemoryState
+        from gpio_scheduler import PinScheduler, SimulatedPinBackend
+        app.config['TESTING'] = True
+        client = app.test_client()
+        with patch('app.RPI_GPIO_AVAILABLE', False), patch('app.app_state', MemoryState({17: "OFF", 18: "OFF", 27: "OFF"}, [])), \
+             patch('app.gpio_scheduler', PinScheduler(SimulatedPinBackend(on_write=app_module._on_scheduled_write))):
+            response = client.post('/api/gpio/programs', json={"steps": [{"pin": 17, "state": "ON"}]})
+            self.assertEqual(response.status_code, 202)
+            job_id = response.get_json()["id"]
+            self.assertEqual(app_module.gpio_scheduler.wait(job_id, timeout=5)["state"], "done")
+            self.assertEqual(client.get(f'/api/gpio/programs/{job_id}').get_json()["state"], "done")
+            self.assertEqual(app_module.app_state.pin_states()[17], "ON")
+            self.assertEqual(client.post('/api/gpio/programs', json={"steps": [{"pulse": 5, "ms": 10}]}).status_code, 400)
+            self.assertEqual(client.get('/api/gpio/programs/999').status_code, 404)
+            self.assertEqual(client.get('/api/gpio/scheduler').get_json()["executed_actions"], 1)
+
+class SubsystemRegistryTests(unittest.TestCase):
+    def test_init_runs_once_on_first_use(self):
+        from subsystems import SubsystemRegistry
+        registry = SubsystemRegistry()
+        calls = []
+        registry.register('camera', lambda: calls.append('camera'))
+        @registry.requires('camera')
+        def view(): return 'ok'
+        self.assertFalse(registry.is_initialised('camera'))
+        workers = [threading.Thread(target=view) for _ in range(8)]
+        for w in workers: w.start()
+        for w in workers: w.join()
+        self.assertEqual(calls, ['camera'])
+        report = registry.report()[0]
+        self.assertEqual(report['state'], 'ready')
+        self.assertIsNotNone(report['init_ms'])
+
+    def test_failed_init_is_reported(self):
+        from subsystems import SubsystemRegistry
+        registry = SubsystemRegistry()
+        def broken(): raise OSError("no /dev/gpiomem")
+        registry.register('gpio', broken)
+        registry.ensure('gpio')
+        self.assertEqual((registry.report()[0]['state'], registry.report()[0]['error']), ('failed', 'no /dev/gpiomem'))
+
+    def test_import_touches_no_hardware(self):
+        code = "import app, json; print(json.dumps([r['state'] for r in app.subsystems.report()]))"
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        self.assertEqual(output.stdout.strip().splitlines()[-1], '["pending", "pending", "pending", "pending", "pending", "pending", "pending"]')
+
+    def test_subsystems_api(self):
+        app.config['TESTING'] = True
+        names = [s['name'] for s in app.test_client().get('/api/subsystems').get_json()['subsystems']]
+        self.assertEqual(names, ['psutil', 'system_stats', 'gpio', 'camera', 'file_manager', 'alerts', 'fleet'])
+
+class ProductionServingTests(unittest.TestCase):
+    def _make_app(self):
+        from flask import Flask, request as flask_request
+        from subsystems import SubsystemRegistry
+        registry = SubsystemRegistry()
+        registry.register('gpio', lambda: None)
+        hw_app = Flask('hardware_test')
+        @hw_app.route('/gpio-state')
+        @registry.requires('gpio')
+        def gpio_state(): return flask_request.headers.get('X-RaspControll-Forwarded', 'local')
+        @hw_app.route('/plain')
+        def plain(): return flask_request.headers.get('X-RaspControll-Forwarded', 'local')
+        @hw_app.route('/gpio-echo', methods=['POST'])
+        @registry.requires('gpio')
+        def gpio_echo(): return flask_request.get_data()
+        return hw_app
+
+    def test_single_owner_and_forwarding(self):
+        from serve import HardwareOwnership, HardwareForwardingMiddleware
+        from werkzeug.test import Client
+        hw_app = self._make_app()
+        with tempfile.TemporaryDirectory() as tmp:
+            lock = Path(tmp) / "hardware.lock"
+            owner = HardwareOwnership(lock, port=0)
+            self.assertTrue(owner.try_claim(hw_app))
+            try:
+                follower = HardwareOwnership(lock, port=owner.port)
+                self.assertFalse(follower.try_claim(hw_app)) # Only one process may own the hardware
+                client = Client(HardwareForwardingMiddleware(hw_app, follower))
+                self.assertEqual(client.get('/gpio-state').get_data(), b'1') # Served by the owner
+                self.assertEqual(client.get('/plain').get_data(), b'local')
+                self.assertEqual(Client(HardwareForwardingMiddleware(hw_app, owner)).get('/gpio-state').get_data(), b'local')
+            finally:
+                owner.release()
+            self.assertTrue(follower.try_claim(hw_app)) # Takes over once the owner is gone
+            follower.release()
+
+    def test_unreachable_owner(self):
+        import socket
+        from serve import HardwareOwnership, HardwareForwardingMiddleware
+        from werkzeug.test import Client
+        hw_app = self._make_app()
+        with socket.socket() as s: # A port nothing listens on
+            s.bind(("127.0.0.1", 0))
+            dead_port = s.getsockname()[1]
+        with tempfile.TemporaryDirectory() as tmp:
+            lock = Path(tmp) / "hardware.lock"
+            owner = HardwareOwnership(lock, port=0)
+            self.assertTrue(owner.try_claim(hw_app))
+            try:
+                # The owner still holds the lock but doesn't answer: refuse rather than open the hardware here
+                client = Client(HardwareForwardingMiddleware(hw_app, HardwareOwnership(lock, port=dead_port)))
+                response = client.post('/gpio-echo', data=b'payload')
+                self.assertEqual((response.status_code, response.headers.get('Retry-After')), (503, '5'))
+            finally:
+                owner.release()
+            # The owner is gone: take over and serve locally with the original request body
+            follower = HardwareOwnership(lock, port=dead_port)
+            response = Client(HardwareForwardingMiddleware(hw_app, follower)).post('/gpio-echo', data=b'payload')
+            self.assertTrue(follower.is_owner)
+            follower.release()
+            self.assertEqual((response.status_code, response.get_data()), (200, b'payload'))
+
+    def test_owner_port_in_use_releases_lock(self):
+        import socket
+        from serve import HardwareOwnership, HardwareForwardingMiddleware
+        from werkzeug.test import Client
+        hw_app = self._make_app()
+        with tempfile.TemporaryDirectory() as tmp, socket.socket() as busy:
+            busy.bind(("127.0.0.1", 0)); busy.listen()
+            lock = Path(tmp) / "hardware.lock"
+            ownership = HardwareOwnership(lock, port=busy.getsockname()[1], timeout=0.5)
+            self.assertFalse(ownership.try_claim(hw_app))
+            self.assertFalse(ownership.is_owner)
+            response = Client(HardwareForwardingMiddleware(hw_app, ownership)).get('/gpio-state')
+            self.assertEqual(response.status_code, 503)
+            other = HardwareOwnership(lock, port=0) # The lock was not kept by the failed claim
+            self.assertTrue(other.try_claim(hw_app))
+            other.release()
+
+    def test_alerts_api_is_answered_by_the_owner(self):
+        # Only the owner evaluates alert rules; another worker's engine would report every rule as "ok"
+        from serve import HardwareOwnership, HardwareForwardingMiddleware
+        from werkzeug.test import Client
+        from alerts import AlertEngine, AlertRule
+        served_by_owner = []
+        def owner_app(environ, start_response):
+            served_by_owner.append(environ['PATH_INFO'])
+            return app(environ, start_response)
+        engine = AlertEngine([AlertRule("disk_percent > 90")])
+        engine.observe({"disk_percent": 95.0})
+        with tempfile.TemporaryDirectory() as tmp, patch('app.alert_engine', engine):
+            lock = Path(tmp) / "hardware.lock"
+            owner = HardwareOwnership(lock, port=0)
+            self.assertTrue(owner.try_claim(owner_app))
+            try:
+                worker = Client(HardwareForwardingMiddleware(app, HardwareOwnership(lock, port=owner.port)))
+                data = worker.get('/api/alerts').get_json()
+            finally:
+                owner.release()
+        self.assertEqual(served_by_owner, ['/api/alerts'])
+        self.assertEqual([r["state"] for r in data["rules"]], ["firing"])
+
+    def test_event_streams_are_capped(self):
+        import app as app_module
+        app.config['TESTING'] = True
+        client = app.test_client()
+        with patch('app._stream_slots', threading.BoundedSemaphore(1)):
+            first = client.get('/api/gpio/events/stream', buffered=False)
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(client.get('/api/gpio/events/stream', buffered=False).status_code, 503)
+            first.close()
+            second = client.get('/api/gpio/events/stream', buffered=False)
+            self.assertEqual(second.status_code, 200)
+            second.close()
+
+class MetricsTests(unittest.TestCase):
+    def test_registry_renders_cumulative_buckets(self):
+        from metrics import MetricsRegistry
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        registry.describe('latency', "Test latency")
+        for value in (0.05, 0.5, 5.0): registry.observe('latency', value, endpoint='index')
+        registry.inc('fallbacks', feature='gpio')
+        text = registry.render()
+        self.assertIn('# TYPE latency histogram', text)
+        self.assertIn('latency_bucket{endpoint="index",le="0.1"} 1', text)
+        self.assertIn('latency_bucket{endpoint="index",le="1.0"} 2', text)
+        self.assertIn('latency_bucket{endpoint="index",le="+Inf"} 3', text)
+        self.assertIn('latency_count{endpoint="index"} 3', text)
+        self.assertIn('fallbacks{feature="gpio"} 1', text)
+
+    def test_shared_registries_are_summed_across_processes(self):
+        from metrics import MetricsRegistry
+        with tempfile.TemporaryDirectory() as tmp:
+            worker_a, worker_b = MetricsRegistry(buckets=(0.1,)), MetricsRegistry(buckets=(0.1,))
+            worker_a.share(tmp, interval=60); worker_b.share(tmp, interval=60)
+            try:
+                worker_a.observe('latency', 0.05, endpoint='index'); worker_a.inc('fallbacks', feature='gpio')
+                worker_b.observe('latency', 0.5, endpoint='index'); worker_b.inc('fallbacks', feature='gpio', amount=2)
+                with patch('metrics.os.getpid', return_value=1): worker_b.render() # Another worker answered a scrape
+                text = worker_a.render() # Whichever worker is scraped reports the total
+            finally:
+                worker_a.stop_sharing(); worker_b.stop_sharing()
+        self.assertIn('latency_bucket{endpoint="index",le="0.1"} 1', text)
+        self.assertIn('latency_count{endpoint="index"} 2', text)
+        self.assertIn('fallbacks{feature="gpio"} 3', text)
+
+    def test_metrics_endpoint_reports_routes_and_fallbacks(self):
+        app.config['TESTING'] = True
+        client = app.test_client()
+        with patch('app.RPI_GPIO_AVAILABLE', False):
+            self.assertEqual(client.get('/gpio').status_code, 200)
+        response = client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        text = response.get_data(as_text=True)
+        self.assertIn('raspcontroll_request_duration_seconds_count{endpoint="gpio",method="GET",status="200"}', text)
+        self.assertIn('raspcontroll_simulation_fallbacks_total{feature="gpio",reason="unavailable"}', text)
+
+    def test_unhandled_exceptions_are_counted_as_500(self):
+        import app as app_module
+        def broken(): raise RuntimeError("sensor bus exploded")
+        series = 'raspcontroll_request_duration_seconds_count{endpoint="pinout",method="GET",status="500"}'
+        def count():
+            line = next((l for l in app_module.metrics.render().splitlines() if l.startswith(series)), f"{series} 0")
+            return int(float(line.rsplit(' ', 1)[1]))
+        before = count()
+        with patch.dict(app.view_functions, {'pinout': broken}):
+            with patch.dict(app.config, {'TESTING': False, 'PROPAGATE_EXCEPTIONS': False}), patch.object(app.logger, 'error'):
+                self.assertEqual(app.test_client().get('/pinout').status_code, 500)
+            with patch.dict(app.config, {'TESTING': True}):
+                with self.assertRaises(RuntimeError): app.test_client().get('/pinout') # Propagated (debug/testing)
+        self.assertEqual(count(), before + 2)
+
+class BenchmarkTests(unittest.TestCase):
+    def test_every_route_has_a_benchmark_case(self):
+        import benchmark
+        self.assertEqual(benchmark.uncovered_endpoints(app, benchmark.route_cases()), set())
+
+    def test_client_benchmark_with_simulated_hardware(self):
+        import benchmark
+        import app as app_module
+        psutil_before = app_module.psutil
+        with tempfile.TemporaryDirectory() as tmp:
+            root = benchmark.build_file_tree(Path(tmp) / "tree", 200, sample_image=Path(app.root_path) / 'static/images/placeholder_camera.png')
+            self.assertEqual(len(list((root / "bulk").iterdir())), 200)
+            cases = {case.path: case for case in benchmark.route_cases()}
+            with benchmark.simulated_environment(root, processes=300, cpu_interval_scale=0) as flask_app:
+                listing = benchmark.bench_client(flask_app, cases['/file-manager/bulk'], iterations=3, warmup=1, max_seconds=10)
+                processes = benchmark.bench_client(flask_app, cases['/processes'], iterations=3, warmup=0, max_seconds=10)
+                self.assertIn(b'proc-300', flask_app.test_client().get('/processes').data)
+                self.assertIn('ds18b20', app_module.read_sensors()[1]) # Sensors are faked too, never probed
+        self.assertIs(app_module.psutil, psutil_before) # Fakes are removed again
+        self.assertNotIsInstance(app_module.read_sensors, benchmark.FakeSensors)
+        self.assertEqual(listing["statuses"], {"200": 3})
+        self.assertEqual(processes["requests"], 3)
+        self.assertLessEqual(listing["p50_ms"], listing["p99_ms"])
+
+    def test_simulated_environment_touches_no_hardware(self):
+        # Fresh interpreter with a throwaway HOME: nothing may be initialised, created or started
+        code = ("import app, benchmark, json, os, tempfile, threading\n"
+                "with tempfile.TemporaryDirectory() as tree, benchmark.simulated_environment(tree, processes=10) as flask_app:\n"
+                "    client = flask_app.test_client()\n"
+                "    job = client.post('/api/gpio/programs', json={'steps': [{'pulse': 27, 'ms': 5}]}).get_json()\n"
+                "    app.gpio_scheduler.wait(job['id'], timeout=5)\n"
+                "    statuses = [client.get(p).status_code for p in ('/gpio', '/camera_feed', '/file-manager/', '/api/system/stats', '/fleet')]\n"
+                "    backend = type(app.gpio_scheduler.backend).__name__\n"
+                "print(json.dumps({'statuses': statuses, 'backend': backend, 'home': os.listdir(os.path.expanduser('~')),\n"
+                "                  'states': [s['state'] for s in app.subsystems.report()],\n"
+                "                  'threads': sorted(t.name for t in threading.enumerate() if t.name in ('system-stats', 'fleet-poller'))}))\n")
+        with tempfile.TemporaryDirectory() as home:
+            output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)), env={**os.environ, 'HOME': home})
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        self.assertEqual(result['statuses'], [200] * 5)
+        self.assertEqual(result['backend'], 'SimulatedPinBackend')
+        self.assertNotIn('RaspControll_files', result['home'])
+        self.assertEqual(set(result['states']), {'pending'}) # Restored, and no init function ran
+        self.assertEqual(result['threads'], [])
+
+    def test_compare_flags_only_real_regressions(self):
+        from benchmark import compare
+        baseline = {"results": {"client GET /a": {"p50_ms": 10.0, "p99_ms": 20.0}, "client GET /b": {"p50_ms": 0.2, "p99_ms": 0.3}}}
+        current = {"results": {"client GET /a": {"p50_ms": 15.0, "p99_ms": 21.0}, "client GET /b": {"p50_ms": 0.5, "p99_ms": 0.6},
+                               "client GET /new": {"p50_ms": 99.0, "p99_ms": 99.0}}}
+        self.assertEqual(compare(current, baseline, tolerance=0.2), [("client GET /a", "p50_ms", 10.0, 15.0)])
+
+class ProfilerTests(unittest.TestCase):
+    def test_profiler_samples_busy_threads_and_exports_collapsed_stacks(self):
+        import app as app_module
+        from profiler import SamplingProfiler
+        app.config['TESTING'] = True
+        client = app.test_client()
+        self.assertEqual(client.post('/admin/profiler/start?seconds=0').status_code, 400)
+        stop = threading.Event()
+        def busy_benchmark_loop():
+            total = 0
+            while not stop.is_set():
+                for i in range(1000): total += i * i
+        worker = threading.Thread(target=busy_benchmark_loop, name='busy-7')
+        worker.start()
+        try:
+            with patch('app.profiler', SamplingProfiler()):
+                self.assertEqual(client.get('/admin/profiler/profile.collapsed').status_code, 404)
+                response = client.post('/admin/profiler/start?seconds=5&interval_ms=2')
+                self.assertEqual(response.status_code, 202)
+                pid = response.get_json()["pid"]
+                self.assertEqual(pid, os.getpid())
+                self.assertEqual(client.post('/admin/profiler/start?seconds=5').status_code, 409) # One session at a time
+                # Another worker's profiler: refused with this process's pid, and this session keeps running
+                other = client.post(f'/admin/profiler/stop?pid={pid + 1}')
+                self.assertEqual((other.status_code, other.get_json()["pid"]), (409, pid))
+                self.assertEqual(client.get(f'/admin/profiler/profile.collapsed?pid={pid + 1}').status_code, 409)
+                self.assertTrue(client.get(f'/admin/profiler?pid={pid}').get_json()["running"])
+                time.sleep(0.3)
+                status = client.post(f'/admin/profiler/stop?pid={pid}').get_json()
+                download = client.get(f'/admin/profiler/profile.collapsed?pid={pid}')
+        finally:
+            stop.set(); worker.join()
+        self.assertFalse(status["running"])
+        self.assertGreater(status["samples"], 10)
+        self.assertIn("busy_benchmark_loop", " ".join(f["function"] for f in status["hot_functions"]))
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('attachment', download.headers['Content-Disposition'])
+        lines = download.get_data(as_text=True).splitlines()
+        busy = [line for line in lines if line.startswith('busy-N;')]
+        self.assertTrue(busy)
+        stack, count = busy[0].rsplit(' ', 1)
+        self.assertIn('busy_benchmark_loop (test_app.py:', stack)
+        self.assertGreater(int(count), 0)
+        self.assertFalse(any('sampling-profiler' in line for line in lines)) # The sampler doesn't sample itself
+
+class SystemStatsTests(unittest.TestCase):
+    def _psutil(self, cores, nics, disks):
+        from collections import namedtuple
+        times = namedtuple('scputimes', 'user system idle iowait')
+        net = namedtuple('snetio', 'bytes_sent bytes_recv')
+        disk = namedtuple('sdiskio', 'read_count write_count read_bytes write_bytes')
+        ps = MagicMock()
+        ps.cpu_times.return_value = [times(*c) for c in cores]
+        ps.net_io_counters.return_value = {name: net(*v) for name, v in nics.items()}
+        ps.disk_io_counters.return_value = {name: disk(*v) for name, v in disks.items()}
+        ps.virtual_memory.return_value.percent = 40.0
+        ps.disk_usage.return_value.percent = 91.5
+        return ps
+
+    def test_rates_from_counter_deltas(self):
+        from system_stats import SystemStatsCollector
+        ps = self._psutil([(10, 0, 90, 0), (50, 0, 50, 0)], {'lo': (5, 5), 'eth0': (1000, 5000)},
+                          {'mmcblk0': (10, 20, 4096, 8192), 'loop0': (0, 0, 0, 0)})
+        collector = SystemStatsCollector(lambda: ps)
+        with patch('system_stats.time.monotonic', side_effect=[100.0, 102.0]):
+            first = collector.sample()
+            self.assertIsNone(first['cpu']) # A single snapshot has no rates yet
+            self.assertEqual(first['disk_percent'], 91.5)
+            ps.cpu_times.return_value = [type(t)(t.user + 50, 0, t.idle + 50, 0) for t in ps.cpu_times.return_value]
+            ps.net_io_counters.return_value = {'lo': ps.net_io_counters.return_value['lo'],
+                                               'eth0': type(ps.net_io_counters.return_value['eth0'])(3000, 4000)} # tx counter reset
+            ps.disk_io_counters.return_value['mmcblk0'] = type(ps.disk_io_counters.return_value['mmcblk0'])(14, 40, 12288, 40960)
+            second = collector.sample()
+        self.assertEqual(second['interval_s'], 2.0)
+        self.assertEqual(second['cpu'], {'total_percent': 50.0, 'per_core': [50.0, 50.0]})
+        self.assertEqual(second['network'], {'eth0': {'rx_bytes_per_s': 0.0, 'tx_bytes_per_s': 1000.0}})
+        self.assertEqual(second['disks'], {'mmcblk0': {'read_iops': 2.0, 'write_iops': 10.0, 'read_bytes_per_s': 4096.0, 'write_bytes_per_s': 16384.0}})
+        self.assertIs(collector.latest(), second)
+
+    def test_guest_time_is_not_counted_twice(self):
+        from collections import namedtuple
+        from system_stats import SystemStatsCollector
+        times = namedtuple('scputimes', 'user nice system idle iowait guest guest_nice')
+        ps = self._psutil([], {}, {})
+        ps.cpu_times.return_value = [times(100, 0, 0, 100, 0, 0, 0)]
+        collector = SystemStatsCollector(lambda: ps)
+        collector.sample()
+        # A VM guest kept the core busy for 50 ticks: counted in user and again in guest
+        ps.cpu_times.return_value = [times(150, 0, 0, 150, 0, 50, 0)]
+        self.assertEqual(collector.sample()['cpu']['per_core'], [50.0])
+
+    def test_decode_throttled(self):
+        from system_stats import decode_throttled
+        self.assertEqual(decode_throttled(0x50005), {'raw': '0x50005', 'now': ['under_voltage', 'throttled'],
+                                                     'since_boot': ['under_voltage', 'throttled']})
+
+    def test_page_and_api_in_simulation(self):
+        app.config['TESTING'] = True
+        client = app.test_client()
+        with patch('app.PSUTIL_AVAILABLE', False):
+            import app as app_module
+            app_module.system_stats.sample()
+            data = client.get('/api/system/stats').get_json()
+            page = client.get('/system-monitoring').data
+            fragment = client.get('/system-monitoring/rates').data
+        self.assertTrue(data['simulated'])
+        self.assertEqual(len(data['cpu']['per_core']), 4)
+        self.assertIn(b'Network Throughput', page)
+        self.assertIn(b'eth0', fragment)
+        self.assertIn(b'/s</td>', fragment)
+
+class AlertTests(unittest.TestCase):
+    def test_rule_parsing(self):
+        from alerts import AlertRule, load_rules
+        rule = AlertRule("disk_percent > 90 for 5 min")
+        self.assertEqual((rule.metric, rule.op, rule.threshold, rule.for_s, rule.level), ('disk_percent', '>', 90.0, 300.0, 'warning'))
+        self.assertAlmostEqual(rule.clear, 85.5) # Default hysteresis: 5% of the threshold
+        rule = AlertRule("ds18b20 > 60°C level=danger clear=55 repeat=1h name=tank")
+        self.assertEqual((rule.unit, rule.clear, rule.repeat_s, rule.name, rule.for_s), ('°C', 55.0, 3600.0, 'tank', 0.0))
+        for bad in ("disk_percent = 90", "disk_percent > 90 for 5 fortnights", "ram_percent > 90 colour=red", "cpu_percent > 50 clear=60"):
+            with self.assertRaises(ValueError): AlertRule(bad)
+        with tempfile.NamedTemporaryFile('w', suffix='.rules', delete=False) as f:
+            f.write("# comment\n\ndisk_percent > 90 for 5m  # trailing comment\nnonsense here\n")
+        try: rules, errors = load_rules(f.name)
+        finally: os.remove(f.name)
+        self.assertEqual([r.metric for r in rules], ['disk_percent'])
+        self.assertEqual(len(errors), 1)
+        self.assertIn(':4:', errors[0])
+        self.assertEqual(load_rules('/nonexistent/alerts.rules'), ([], []))
+
+    def test_duration_hysteresis_and_deduplication(self):
+        from alerts import AlertEngine, AlertRule
+        events = []
+        engine = AlertEngine([AlertRule("disk_percent > 90 for 60s clear=85"), AlertRule("ram_percent > 80")], on_event=events.append)
+        engine.observe({"disk_percent": 95}, now=0)
+        engine.observe({"disk_percent": 95}, now=30)
+        self.assertEqual(events, []) # Not yet held for 60 s
+        engine.observe({"disk_percent": 80}, now=40) # Dropped below: the duration starts over
+        engine.observe({"disk_percent": 95}, now=50)
+        engine.observe({"disk_percent": 95}, now=100)
+        self.assertEqual(events, [])
+        engine.observe({"disk_percent": 96}, now=110)
+        self.assertEqual([(e["status"], e["value"]) for e in events], [("firing", 96.0)])
+        for t, value in ((120, 97), (130, 88), (140, 91)): engine.observe({"disk_percent": value}, now=t)
+        self.assertEqual(len(events), 1) # Deduplicated, and 88 is inside the hysteresis band
+        engine.observe({"disk_percent": 84}, now=150)
+        self.assertEqual([e["status"] for e in events], ["firing", "resolved"])
+        self.assertEqual(events[-1]["level"], "success")
+        engine.observe({"unrelated": 1, "ram_percent": 81}, now=160) # No duration: fires at once
+        self.assertEqual(events[-1]["rule"], "ram_percent > 80")
+        self.assertEqual({s["rule"]: s["state"] for s in engine.status()}, {"disk_percent > 90 for 60s": "ok", "ram_percent > 80": "firing"})
+
+    def test_repeat_and_disabled_engine(self):
+        from alerts import AlertEngine, AlertRule
+        engine = AlertEngine([AlertRule("temperature_c > 70 repeat=10m")])
+        self.assertEqual(len(engine.observe({"temperature_c": 75}, now=0)), 1)
+        self.assertEqual(engine.observe({"temperature_c": 75}, now=300), [])
+        self.assertTrue(engine.observe({"temperature_c": 75}, now=600)[0]["repeat"])
+        engine.enabled = False
+        self.assertEqual(engine.observe({"temperature_c": 20}, now=700), [])
+
+    def test_system_stats_raise_notifications_and_webhook(self):
+        import app as app_module
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        from alerts import AlertEngine, AlertRule, WebhookSender
+        received = []
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                received.append(self.rfile.read(int(self.headers['Content-Length'])))
+                self.send_response(204); self.end_headers()
+            def log_message(self, *args): pass
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.handle_request, daemon=True).start()
+        engine = AlertEngine([AlertRule("disk_percent > 90"), AlertRule("under_voltage > 0 level=danger")], on_event=app_module._on_alert)
+        sample = {"simulated": False, "ram_percent": 40.0, "disk_percent": 93.0, "temperature_c": 50.0, "cpu": None,
+                  "throttling": {"raw": "0x50005", "now": ["under_voltage", "throttled"], "since_boot": []}}
+        from notification_store import NotificationStore
+        with patch('app.alert_engine', engine), patch('app.notification_store', NotificationStore(max_items=10)), \
+             patch('app.alert_webhook', WebhookSender(f"http://127.0.0.1:{server.server_port}/hook")):
+            engine.observe(app_module._system_alert_values(sample))
+            self.assertEqual(engine.observe(app_module._system_alert_values({**sample, "simulated": True})), [])
+            items, total = app_module.notification_store.query(source="alerts")
+            api = app.test_client().get('/api/alerts').get_json()
+            for _ in range(100):
+                if received: break
+                time.sleep(0.02)
+        server.server_close()
+        self.assertEqual(total, 2)
+        self.assertEqual({i["level"] for i in items}, {"warning", "danger"})
+        self.assertIn("Alert: disk_percent > 90 (now 93)", [i["message"].rstrip('.') for i in items])
+        self.assertEqual([r["state"] for r in api["rules"]], ["firing", "firing"])
+        self.assertEqual(len(received), 1) # The test server accepts a single request
+        self.assertEqual(json.loads(received[0])["status"], "firing")
+
+    def test_sensor_rules_are_sampled_without_page_views(self):
+        import app as app_module
+        from alerts import AlertEngine, AlertRule, SensorSampler
+        events = []
+        engine = AlertEngine([AlertRule("ds18b20 > 60°C")], on_event=events.append)
+        sampler = SensorSampler(lambda: app_module.read_sensors()[1], engine.observe, interval=0.01)
+        readings = ({}, {"ds18b20": 65.0})
+        with patch('app.read_sensors', return_value=readings), patch('app.sensor_sampler', sampler), \
+             patch('app.alert_engine', engine), patch('app.alert_rules', engine._rules), patch('app.subsystems.ensure'):
+            app_module.start_alerting()
+            for _ in range(200):
+                if events: break
+                time.sleep(0.01)
+            sampler.stop()
+        self.assertEqual([(e["rule"], e["status"]) for e in events], [("ds18b20 > 60°C", "firing")])
+        idle = SensorSampler(lambda: {}, engine.observe)
+        with patch('app.sensor_sampler', idle), patch('app.alert_rules', [AlertRule("disk_percent > 90")]), patch('app.subsystems.ensure'):
+            app_module.start_alerting()
+        self.assertIsNone(idle._thread) # No sensor rules: the sensors are never polled in the background
+
+class FleetTests(unittest.TestCase):
+    def test_load_nodes(self):
+        from fleet import load_nodes
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "fleet.nodes"
+            path.write_text("# the shed\ngarage http://10.0.0.2:5000/\nhttp://greenhouse.local:5000  # unnamed\n"
+                            "broken ftp://10.0.0.3\ngarage http://10.0.0.4:5000\n")
+            nodes, errors = load_nodes(path)
+            self.assertEqual(load_nodes(Path(tmp) / "missing"), ([], []))
+        self.assertEqual(nodes, [{"name": "garage", "url": "http://10.0.0.2:5000"},
+                                 {"name": "greenhouse.local", "url": "http://greenhouse.local:5000"}])
+        self.assertEqual(len(errors), 2)
+        self.assertIn("duplicate node name 'garage'", errors[1])
+
+    def test_polls_local_instances_concurrently_with_timeouts(self):
+        import socket
+        from contextlib import ExitStack
+        from flask import Flask
+        from benchmark import local_server
+        from fleet import FleetAggregator
+        slow_app = Flask("slow")
+        slow_app.add_url_rule('/api/system/stats', 'slow', lambda: time.sleep(2) or "{}")
+        with socket.socket() as s: # A port nothing listens on
+            s.bind(("127.0.0.1", 0))
+            dead_port = s.getsockname()[1]
+        with ExitStack() as stack:
+            ports = [stack.enter_context(local_server(app)) for _ in range(3)] # Simulation-mode instances
+            slow_port = stack.enter_context(local_server(slow_app))
+            nodes = [{"name": f"pi-{i}", "url": f"http://127.0.0.1:{port}"} for i, port in enumerate(ports)]
+            nodes += [{"name": "slow", "url": f"http://127.0.0.1:{slow_port}"}, {"name": "dead", "url": f"http://127.0.0.1:{dead_port}"}]
+            fleet = FleetAggregator(nodes, interval=60, timeout=0.5, max_workers=8)
+            elapsed = fleet.poll_all()
+            by_name = {n["name"]: n for n in fleet.snapshot()}
+            summary = fleet.summary()
+            fleet.stop()
+        self.assertLess(elapsed, 1.9) # Bounded by the timeout, not by the slow node
+        for name in ("pi-0", "pi-1", "pi-2"):
+            self.assertEqual(by_name[name]["status"], "ok")
+            self.assertTrue(by_name[name]["stats"]["simulated"])
+            self.assertFalse(by_name[name]["stale"])
+        self.assertIn("timed out", by_name["slow"]["error"])
+        self.assertIn("ConnectionRefused", by_name["dead"]["error"])
+        self.assertTrue(by_name["dead"]["stale"])
+        self.assertEqual((summary["nodes"], summary["reachable"], summary["unreachable"]), (5, 3, 2))
+
+    def test_reuses_keep_alive_connections(self):
+        # The Werkzeug development server closes every connection, so use an HTTP/1.1 stub node
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        from fleet import FleetAggregator
+        connections = []
+        class Node(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            def setup(self):
+                super().setup()
+                connections.append(self.client_address)
+            def do_GET(self):
+                body = json.dumps({"rules": []} if self.path == '/api/alerts' else {"simulated": True, "cpu": None}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, *args): pass
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Node)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        fleet = FleetAggregator([{"name": "node", "url": f"http://127.0.0.1:{server.server_port}"}], timeout=2)
+        for _ in range(3): fleet.poll_all()
+        status = fleet.snapshot()[0]["status"]
+        fleet.stop()
+        server.shutdown()
+        server.server_close()
+        self.assertEqual(status, "ok")
+        self.assertEqual(len(connections), 1) # Six requests over one connection
+
+    def test_fleet_routes_render_cached_snapshots(self):
+        import app as app_module
+        from benchmark import simulated_fleet
+        from fleet import FleetAggregator
+        app.config['TESTING'] = True
+        client = app.test_client()
+        with patch.object(app_module, 'fleet', simulated_fleet(20)):
+            page = client.get('/fleet')
+            fragment = client.get('/fleet/nodes')
+            api = client.get('/api/fleet').get_json()
+        with patch.object(app_module, 'fleet', FleetAggregator([])):
+            empty = client.get('/fleet')
+        self.assertEqual(page.status_code, 200)
+        self.assertIn(b'pi-019', page.data)
+        self.assertIn(b'2 unreachable', fragment.data)
+        self.assertEqual((api["summary"]["nodes"], api["summary"]["reachable"]), (20, 18))
+        self.assertEqual(len(api["nodes"]), 20)
+        self.assertIn(b'No fleet configured', empty.data)
+
+class HttpCacheTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+
+    def test_static_urls_are_fingerprinted_and_cached_for_long(self):
+        import re
+        import gzip
+        page = self.client.get('/')
+        css_url = re.search(rb'href="(/static/style\.css\?v=[0-9a-f]+)"', page.data).group(1).decode()
+        compressed = self.client.get(css_url, headers={'Accept-Encoding': 'gzip'})
+        plain = self.client.get(css_url)
+        unversioned = self.client.get('/static/style.css')
+        revalidated = self.client.get(css_url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']})
+        self.assertEqual(compressed.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.data), plain.data)
+        self.assertNotEqual(compressed.headers['ETag'], plain.headers['ETag']) # One ETag per encoding
+        self.assertEqual(unversioned.headers['Cache-Control'], 'no-cache')
+        self.assertEqual(revalidated.status_code, 304)
+        pinout = self.client.get('/pinout')
+        image_url = re.search(rb'src="(/pinout_image\?v=[0-9a-f]+)"', pinout.data).group(1).decode()
+        image = self.client.get(image_url)
+        self.assertEqual((image.mimetype, image.headers['Cache-Control']), ('image/png', 'public, max-age=31536000, immutable'))
+        self.assertEqual(self.client.get('/static/missing.css').status_code, 404)
+
+    def test_compression_can_be_disabled(self):
+        with patch('app.COMPRESSION_ENABLED', False):
+            css = self.client.get('/static/style.css', headers={'Accept-Encoding': 'gzip, br'})
+            page = self.client.get('/processes', headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(css.status_code, 200)
+        self.assertNotIn('Content-Encoding', css.headers)
+        self.assertIn(b'body', css.data)
+        self.assertNotIn('Content-Encoding', page.headers)
+
+    def test_static_fingerprint_changes_with_content(self):
+        from http_cache import StaticAssets
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "app.css"
+            path.write_text("body { color: red; }\n")
+            assets = StaticAssets(tmp)
+            before = assets.fingerprint("app.css")
+            path.write_text("body { color: blue; }\n")
+            os.utime(path, ns=(path.stat().st_mtime_ns + 10**9,) * 2)
+            self.assertNotEqual(assets.fingerprint("app.css"), before)
+            self.assertIsNone(assets.fingerprint("../etc/passwd"))
+
+    def test_rendered_pages_are_compressed_and_revalidated(self):
+        import gzip
+        with patch('app.PSUTIL_AVAILABLE', False):
+            plain = self.client.get('/processes')
+            compressed = self.client.get('/processes', headers={'Accept-Encoding': 'gzip'})
+            not_modified = self.client.get('/processes', headers={'If-None-Match': plain.headers['ETag']})
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed.headers['Vary'])
+        self.assertEqual(gzip.decompress(compressed.data), plain.data)
+        self.assertEqual(compressed.headers['ETag'], plain.headers['ETag']) # Weak ETag of the uncompressed page
+        self.assertEqual((not_modified.status_code, not_modified.data), (304, b''))
+        self.assertEqual(plain.headers['Cache-Control'], 'no-cache')
+        self.client.post('/notifications/add', data={'message': 'cache test'})
+        changed = self.client.get('/notifications')
+        self.client.post('/notifications/add', data={'message': 'cache test 2'})
+        again = self.client.get('/notifications', headers={'If-None-Match': changed.headers['ETag']})
+        self.assertEqual(again.status_code, 200) # The data changed, so the page is sent again
+
+    def test_streams_and_downloads_are_not_buffered(self):
+        response = self.client.get('/admin/profiler/profile.collapsed', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('ETag', response.headers) # Not a page: sets its own Cache-Control (or 404s)
+        stream = self.client.get('/api/gpio/events/stream', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+        self.assertNotIn('Content-Encoding', stream.headers)
+        stream.close()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,131 @@
+# thumbnails.py
+# Thumbnail generation and on-disk cache for the RaspControll File Manager
+
+# Standard Library Imports
+import os
+import time
+import importlib.util
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# Pillow is optional: without it the File Manager simply lists images by name.
+# It is only imported when the first thumbnail is rendered, to keep app startup fast.
+PIL_AVAILABLE = importlib.util.find_spec('PIL') is not None
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+
+def is_image_name(name: str) -> bool:
+    return Path(name).suffix.lower() in IMAGE_EXTENSIONS
+
+def _render_thumbnail(source: Path, target: Path, size: tuple):
+    from PIL import Image
+    with Image.open(source) as img:
+        # For JPEGs, draft mode lets libjpeg decode at 1/2, 1/4 or 1/8 scale directly,
+        # so a 12MP photo is never fully decoded just to produce a 160px preview.
+        if img.format == 'JPEG':
+            img.draft('RGB', size)
+        img.thumbnail(size)
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        tmp_target = target.with_name(f"{target.name}.{threading.get_ident()}.tmp")
+        try:
+            img.save(tmp_target, format='JPEG', quality=80)
+            os.replace(tmp_target, target) # Atomic: readers never see a half-written thumbnail
+        except Exception:
+            try: os.unlink(tmp_target) # Don't leave partial files in the cache directory
+            except OSError: pass
+            raise
+
+class ThumbnailCache:
+    # Thumbnails are stored as <cache_dir>/<sha1>.jpg where the hash covers the source path,
+    # its mtime and size, and the thumbnail size. A changed source therefore gets a new key;
+    # stale entries are removed by the size-bounded (least recently used) eviction.
+    def __init__(self, cache_dir: Path, max_bytes: int = 64 * 1024**2, size: tuple = (160, 160), workers: int = 2):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.size = tuple(size)
+        self._lock = threading.Lock()
+        self._pending = {} # key -> Future, so concurrent requests for one image share a single render
+        self._entries = None # key -> (bytes, last_used); loaded lazily from disk
+        self._total_bytes = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnail')
+
+    def _key(self, source: Path) -> str:
+        st = source.stat()
+        raw = f"{source.resolve()}|{st.st_mtime_ns}|{st.st_size}|{self.size[0]}x{self.size[1]}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def _load_entries(self):
+        # Called with self._lock held.
+        if self._entries is not None: return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._entries = {}
+        for item in self.cache_dir.glob('*.jpg'):
+            try:
+                st = item.stat()
+                self._entries[item.stem] = (st.st_size, st.st_mtime)
+                self._total_bytes += st.st_size
+            except OSError: pass
+
+    def _evict(self, keep: str = None):
+        # Called with self._lock held. Oldest-used entries go first. `keep` (the thumbnail just
+        # rendered, about to be sent) is never evicted, even if on its own it exceeds the budget.
+        if self._total_bytes <= self.max_bytes: return
+        for key, (nbytes, _) in sorted(self._entries.items(), key=lambda kv: kv[1][1]):
+            if self._total_bytes <= self.max_bytes: break
+            if key == keep: continue
+            try: (self.cache_dir / f"{key}.jpg").unlink()
+            except FileNotFoundError: pass
+            except OSError as e: print(f"Thumbnail cache: could not evict {key}: {e}"); continue
+            del self._entries[key]
+            self._total_bytes -= nbytes
+
+    def _generate(self, key: str, source: Path) -> Path:
+        target = self.cache_dir / f"{key}.jpg"
+        try:
+            _render_thumbnail(source, target, self.size)
+            with self._lock:
+                nbytes = target.stat().st_size
+                old = self._entries.get(key)
+                if old: self._total_bytes -= old[0]
+                self._entries[key] = (nbytes, target.stat().st_mtime)
+                self._total_bytes += nbytes
+                self._evict(keep=key)
+            return target
+        finally:
+            with self._lock: self._pending.pop(key, None)
+
+    def get(self, source: Path, timeout: float = 10.0) -> Path:
+        # Returns the path of a cached thumbnail for `source`, rendering it on the worker pool if needed.
+        # Raises OSError/PIL errors for unreadable images and TimeoutError if rendering takes too long.
+        if not PIL_AVAILABLE: raise RuntimeError("Pillow is not installed.")
+        source = Path(source)
+        key = self._key(source)
+        with self._lock:
+            self._load_entries()
+            entry = self._entries.get(key)
+            target = self.cache_dir / f"{key}.jpg"
+            if entry is not None and target.exists():
+                self._entries[key] = (entry[0], time.time())
+                return target
+            future = self._pending.get(key)
+            if future is None:
+                future = self._executor.submit(self._generate, key, source)
+                self._pending[key] = future
+        return future.result(timeout=timeout)
+
+    def clear(self):
+        with self._lock:
+            self._load_entries()
+            for key in list(self._entries):
+                try: (self.cache_dir / f"{key}.jpg").unlink()
+                except OSError: pass
+            self._entries = {}
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load_entries()
+            return {"entries": len(self._entries), "bytes": self._total_bytes, "max_bytes": self.max_bytes}